@@ -0,0 +1,271 @@
+# app/answer_cache.py
+"""RAG 답변 캐시
+
+같은 질문(정규화 후 일치)이나 임베딩 코사인 유사도가 임계값 이상인 질문에 대해
+검색과 LLM 호출을 건너뛰고 저장된 답변을 돌려줍니다.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterator
+
+import numpy as np
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableGenerator
+
+from app.embedding_cache import normalize_text, with_query_vector
+
+# 요청 단위 캐시 결과 기록용 (서버 미들웨어가 응답 헤더로 내보냄)
+cache_status: ContextVar[list | None] = ContextVar("answer_cache_status", default=None)
+
+
+def _record(status: str):
+    holder = cache_status.get()
+    if holder is not None:
+        holder.append(status)
+
+
+@dataclass
+class CacheEntry:
+    question: str
+    answer: str
+    slot: int | None  # 임베딩 행렬의 행 번호 (임베딩이 없으면 None)
+    expires_at: float
+
+
+class AnswerCache:
+    """TTL + LRU 답변 캐시 (정확 일치 + 임베딩 유사도 일치)
+
+    Args:
+        max_items: 최대 항목 수 (초과 시 가장 오래 사용하지 않은 항목부터 삭제)
+        ttl_seconds: 항목 유효 시간
+        threshold: 유사 질문으로 인정할 최소 코사인 유사도 (1.0 이상이면 정확 일치만 사용)
+        version_check_interval: 컬렉션 변경 여부를 확인하는 최소 간격(초)
+    """
+
+    def __init__(
+        self,
+        max_items: int = 1000,
+        ttl_seconds: float = 3600,
+        threshold: float = 0.95,
+        version_check_interval: float = 5.0,
+    ):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.version_check_interval = version_check_interval
+        self._lock = threading.Lock()
+        self._clear()
+        self._generation = 0  # 캐시를 비울 때마다 증가 (비우기 전에 시작한 요청의 저장을 막는 데 사용)
+        self._version = None
+        self._version_checked_at = 0.0
+        self.counters = {"hit": 0, "semantic_hit": 0, "miss": 0, "evictions": 0, "invalidations": 0, "stale_puts": 0}
+
+    @property
+    def semantic(self) -> bool:
+        return self.threshold < 1.0
+
+    def _clear(self):
+        self._entries = OrderedDict()  # key -> CacheEntry
+        self._vectors = None  # (max_items, dim) 정규화된 질문 임베딩
+        self._valid = np.zeros(self.max_items, dtype=bool)
+        self._expires = np.zeros(self.max_items)
+        self._slot_keys = [None] * self.max_items
+        self._free_slots = list(range(self.max_items - 1, -1, -1))
+
+    @staticmethod
+    def _key(question: str) -> str:
+        return hashlib.sha256(normalize_text(question).encode("utf-8")).hexdigest()
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        if entry.slot is not None:
+            self._valid[entry.slot] = False
+            self._slot_keys[entry.slot] = None
+            self._free_slots.append(entry.slot)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self._generation += 1
+
+    @property
+    def generation(self) -> int:
+        """요청 시작 시 기록해 두었다가 put 에 넘기는 값 (그 사이 캐시가 비워졌으면 저장하지 않음)"""
+        return self._generation
+
+    def _version_check_due(self) -> bool:
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_interval:
+            return False
+        self._version_checked_at = now
+        return True
+
+    def check_version(self, get_version):
+        """컬렉션 버전이 바뀌었으면 캐시를 비움 (version_check_interval 마다 한 번만 확인)"""
+        if self._version_check_due():
+            self._set_version(get_version())
+
+    async def acheck_version(self, get_version):
+        """check_version 의 비동기 버전 (버전 조회는 Chroma 를 읽으므로 스레드에서 실행)"""
+        if self._version_check_due():
+            self._set_version(await asyncio.to_thread(get_version))
+
+    def _set_version(self, version):
+        with self._lock:
+            if self._version is not None and version != self._version:
+                self._clear()
+                self._generation += 1
+                self.counters["invalidations"] += 1
+            self._version = version
+
+    def get_exact(self, question: str) -> str | None:
+        key = self._key(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            self.counters["hit"] += 1
+            return entry.answer
+
+    def get_similar(self, vector) -> str | None:
+        """코사인 유사도가 threshold 이상인 가장 가까운 질문의 답변"""
+        if vector is None or self._vectors is None:
+            return None
+        query = np.array(vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        with self._lock:
+            live = self._valid & (self._expires >= time.time())
+            if not live.any():
+                return None
+            scores = self._vectors @ query
+            scores[~live] = -np.inf
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                return None
+            key = self._slot_keys[slot]
+            self._entries.move_to_end(key)
+            self.counters["semantic_hit"] += 1
+            return self._entries[key].answer
+
+    def put(self, question: str, answer: str, vector=None, generation: int | None = None):
+        """답변 저장 (generation 이 현재 값과 다르면 무효화 이전 문서로 만든 답변이므로 버림)"""
+        key = self._key(question)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                self.counters["stale_puts"] += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_items:
+                self._remove(next(iter(self._entries)))
+                self.counters["evictions"] += 1
+
+            expires_at = time.time() + self.ttl_seconds
+            slot = None
+            if vector is not None:
+                vector = np.asarray(vector, dtype=np.float32)
+                if self._vectors is None:
+                    self._vectors = np.zeros((self.max_items, vector.shape[0]), dtype=np.float32)
+                slot = self._free_slots.pop()
+                self._vectors[slot] = vector / (np.linalg.norm(vector) or 1.0)
+                self._valid[slot] = True
+                self._expires[slot] = expires_at
+                self._slot_keys[slot] = key
+            self._entries[key] = CacheEntry(question, answer, slot, expires_at)
+
+    def record_miss(self):
+        with self._lock:
+            self.counters["miss"] += 1
+        _record("miss")
+
+    def stats(self) -> dict:
+        counter = dict(self.counters)
+        lookups = counter["hit"] + counter["semantic_hit"] + counter["miss"]
+        counter["items"] = len(self._entries)
+        counter["hit_rate"] = (counter["hit"] + counter["semantic_hit"]) / lookups if lookups else 0.0
+        counter["threshold"] = self.threshold
+        return counter
+
+
+def with_answer_cache(chain: Runnable, engine, cache: AnswerCache) -> Runnable:
+    """질문(str)을 입력받는 체인 앞에 답변 캐시를 붙인 Runnable (스트리밍 지원)
+
+    캐시에 적중하면 검색과 LLM 호출 없이 저장된 답변을 한 번에 내보냅니다.
+    """
+
+    def transform(inputs: Iterator[str], config: RunnableConfig) -> Iterator[str]:
+        question = "".join(inputs)
+        cache.check_version(engine.fingerprint)
+        generation = cache.generation
+
+        answer = cache.get_exact(question)
+        status = "hit"
+        vector = None
+        if answer is None and cache.semantic:
+            vector = engine.embeddings.embed_query(question)
+            answer = cache.get_similar(vector)
+            status = "semantic-hit"
+        if answer is not None:
+            _record(status)
+            yield answer
+            return
+
+        cache.record_miss()
+        if vector is not None:
+            # 검색 단계가 같은 질문을 다시 임베딩하지 않도록 계산한 벡터를 넘김 (임베딩 캐시가 꺼져 있어도)
+            config = with_query_vector(config, question, vector)
+        chunks = []
+        for chunk in chain.stream(question, config):
+            chunks.append(chunk)
+            yield chunk
+        cache.put(question, "".join(chunks), vector, generation)
+
+    async def atransform(inputs: AsyncIterator[str], config: RunnableConfig) -> AsyncIterator[str]:
+        question = "".join([chunk async for chunk in inputs])
+        # 버전 확인(문서 수 조회)과 엔진 생성은 블로킹 I/O 이므로 이벤트 루프 밖에서 실행
+        await cache.acheck_version(engine.fingerprint)
+        generation = cache.generation
+
+        answer = cache.get_exact(question)
+        status = "hit"
+        vector = None
+        if answer is None and cache.semantic:
+            embeddings = await asyncio.to_thread(lambda: engine.embeddings)
+            vector = await embeddings.aembed_query(question)
+            answer = cache.get_similar(vector)
+            status = "semantic-hit"
+        if answer is not None:
+            _record(status)
+            yield answer
+            return
+
+        cache.record_miss()
+        if vector is not None:
+            config = with_query_vector(config, question, vector)
+        chunks = []
+        async for chunk in chain.astream(question, config):
+            chunks.append(chunk)
+            yield chunk
+        cache.put(question, "".join(chunks), vector, generation)
+
+    return RunnableGenerator(transform, atransform, name="CachedRagChain")
+
+
+def answer_cache_from_env() -> AnswerCache | None:
+    """환경변수 설정으로 답변 캐시 생성 (ANSWER_CACHE=0 이면 None)"""
+    if os.getenv("ANSWER_CACHE", "1") == "0":
+        return None
+    return AnswerCache(
+        max_items=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+        ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+        threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    )
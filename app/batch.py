@@ -0,0 +1,220 @@
+# app/batch.py
+"""대량 질문 일괄 처리
+
+LangServe의 /rag/batch는 질문마다 임베딩 API 호출과 Chroma 검색을 따로 수행합니다.
+여기서는 질문 전체를 한 번의 임베딩 요청과 한 번의 Chroma 질의로 처리한 뒤,
+LLM 호출만 동시 실행 수를 제한하여 병렬로 보내고 끝나는 순서대로 결과를 내보냅니다.
+
+사용 예 (서버 실행 후 /rag/bulk 와 /rag/batch 처리량 비교):
+    python -m app.batch data/testset.xlsx --url http://localhost:8000
+
+    두 경로 모두 답변 캐시를 거치므로 공정하게 비교하려면 서버를 ANSWER_CACHE=0 으로 실행합니다.
+"""
+import asyncio
+import time
+from typing import AsyncIterator
+
+import numpy as np
+from langchain_chroma.vectorstores import maximal_marginal_relevance
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
+
+from app.hybrid import HybridRetriever
+from app.rag import format_docs, llm, prompt, reranker
+
+# 검색 결과를 받아 답변만 생성하는 체인
+generation_chain = prompt | llm | StrOutputParser()
+
+
+async def batch_retrieve(engine, questions: list[str], vectors: list[list[float]]) -> list[list[Document]]:
+    """질문 임베딩으로 Chroma를 한 번에 조회하여 질문별 문서 목록을 반환
+
+    mmr/similarity 검색기는 Chroma 질의 1회 + 로컬 MMR 계산으로 처리하고,
+    hybrid 검색기는 이미 계산한 임베딩을 넘겨 질문별로, 그 외 검색기는 검색기의 abatch로 검색합니다.
+    """
+    if engine.search_type not in ("mmr", "similarity"):
+        retriever = engine.retriever
+        if isinstance(retriever, HybridRetriever):
+            all_docs = await asyncio.gather(
+                *(retriever.ainvoke(question, query_vector=vector) for question, vector in zip(questions, vectors))
+            )
+        else:
+            all_docs = await retriever.abatch(questions)
+        return await _rerank_all(questions, all_docs)
+
+    k = engine.search_kwargs.get("k", 4)
+    fetch_k = engine.search_kwargs.get("fetch_k", 20) if engine.search_type == "mmr" else k
+    lambda_mult = engine.search_kwargs.get("lambda_mult", 0.5)
+
+    include = ["documents", "metadatas"]
+    if engine.search_type == "mmr":
+        include.append("embeddings")
+    with engine.reading():
+        collection = engine.chroma_db._collection
+        results = await asyncio.to_thread(
+            collection.query, query_embeddings=vectors, n_results=fetch_k, include=include
+        )
+
+    all_docs = []
+    for i, vector in enumerate(vectors):
+        candidates = [
+            Document(id=doc_id, page_content=text, metadata=metadata or {})
+            for doc_id, text, metadata in zip(results["ids"][i], results["documents"][i], results["metadatas"][i])
+        ]
+        if engine.search_type == "mmr" and candidates:
+            selected = maximal_marginal_relevance(
+                np.array(vector, dtype=np.float32),
+                results["embeddings"][i],
+                k=k,
+                lambda_mult=lambda_mult,
+            )
+            candidates = [candidates[j] for j in sorted(selected)]
+        all_docs.append(candidates[:k])
+    return await _rerank_all(questions, all_docs)
+
+
+async def _rerank_all(questions: list[str], all_docs: list[list[Document]]) -> list[list[Document]]:
+    """재정렬기가 켜져 있으면 질문별로 재정렬 (질문마다 지연 시간 예산 적용)"""
+    if reranker is None:
+        return all_docs
+    return await asyncio.gather(*(reranker.arerank(q, docs) for q, docs in zip(questions, all_docs)))
+
+
+async def run_batch(
+    engine,
+    questions: list[str],
+    concurrency: int = 8,
+    answer_cache=None,
+) -> AsyncIterator[dict]:
+    """질문 목록을 처리하여 완료되는 순서대로 결과(dict)를 내보냄
+
+    각 결과는 {"index", "question", "answer" | "error", "latency", "cached"} 형태이며,
+    마지막에 {"summary": {...}}를 내보냅니다. 한 질문의 오류는 다른 질문에 영향을 주지 않습니다.
+    """
+    start = time.perf_counter()
+
+    # 1) 질문 전체를 한 번의 임베딩 요청으로 처리 (이후 답변 캐시 조회와 검색에서 이 벡터를 그대로 사용)
+    try:
+        embeddings = await asyncio.to_thread(lambda: engine.embeddings)  # 엔진 생성은 이벤트 루프 밖에서
+        vectors = await embeddings.aembed_documents(questions)
+    except Exception as e:
+        for i, question in enumerate(questions):
+            yield {"index": i, "question": question, "error": f"임베딩 실패: {e}", "cached": False}
+        yield {"summary": {"total": len(questions), "cached": 0, "errors": len(questions),
+                           "elapsed": time.perf_counter() - start, "questions_per_second": 0.0}}
+        return
+
+    # 2) 답변 캐시 조회 - 적중한 질문은 검색과 생성을 건너뜀
+    cached = {}
+    if answer_cache is not None:
+        await answer_cache.acheck_version(engine.fingerprint)
+        generation = answer_cache.generation
+        for i, (question, vector) in enumerate(zip(questions, vectors)):
+            answer = answer_cache.get_exact(question)
+            if answer is None and answer_cache.semantic:
+                answer = answer_cache.get_similar(vector)
+            if answer is not None:
+                cached[i] = answer
+            else:
+                answer_cache.record_miss()
+    pending = [i for i in range(len(questions)) if i not in cached]
+
+    errors = 0
+    for i, answer in cached.items():
+        yield {"index": i, "question": questions[i], "answer": answer, "latency": 0.0, "cached": True}
+
+    # 3) 남은 질문의 Chroma 검색을 한 번에 수행
+    docs_list = []
+    if pending:
+        try:
+            docs_list = await batch_retrieve(engine, [questions[i] for i in pending], [vectors[i] for i in pending])
+        except Exception as e:
+            for i in pending:
+                errors += 1
+                yield {"index": i, "question": questions[i], "error": f"검색 실패: {e}", "cached": False}
+            pending = []
+
+    # 4) LLM 호출은 동시 실행 수를 제한하여 병렬 처리
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def generate(i: int, docs: list[Document]) -> dict:
+        async with semaphore:
+            t0 = time.perf_counter()
+            try:
+                answer = await generation_chain.ainvoke({"context": format_docs(docs), "question": questions[i]})
+            except Exception as e:
+                return {"index": i, "question": questions[i], "error": str(e), "cached": False}
+            if answer_cache is not None:
+                vector = vectors[i] if answer_cache.semantic else None
+                answer_cache.put(questions[i], answer, vector, generation)
+            return {
+                "index": i,
+                "question": questions[i],
+                "answer": answer,
+                "latency": time.perf_counter() - t0,
+                "cached": False,
+            }
+
+    tasks = [asyncio.create_task(generate(i, docs)) for i, docs in zip(pending, docs_list)]
+    try:
+        for future in asyncio.as_completed(tasks):
+            result = await future
+            errors += "error" in result
+            yield result
+    finally:
+        # 클라이언트 연결이 끊기면 남은 LLM 호출 취소
+        for task in tasks:
+            task.cancel()
+
+    elapsed = time.perf_counter() - start
+    yield {
+        "summary": {
+            "total": len(questions),
+            "cached": len(cached),
+            "errors": errors,
+            "elapsed": elapsed,
+            "questions_per_second": len(questions) / elapsed if elapsed else 0.0,
+        }
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    import httpx
+
+    from app.hybrid import load_questions
+
+    parser = argparse.ArgumentParser(description="/rag/bulk 와 /rag/batch 처리량 비교")
+    parser.add_argument("questions", help=".xlsx 테스트셋 또는 한 줄에 한 질문인 텍스트 파일")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=None, help="사용할 질문 수")
+    parser.add_argument("--skip-langserve", action="store_true", help="/rag/batch 비교 생략")
+    args = parser.parse_args()
+
+    questions, _ = load_questions(args.questions)
+    questions = questions[: args.limit]
+
+    with httpx.Client(base_url=args.url, timeout=None) as client:
+        t0 = time.perf_counter()
+        with client.stream(
+            "POST", "/rag/bulk", json={"questions": questions, "concurrency": args.concurrency}
+        ) as response:
+            for line in response.iter_lines():
+                if line:
+                    record = json.loads(line)
+                    if "summary" in record:
+                        print("bulk summary:", record["summary"])
+        bulk_elapsed = time.perf_counter() - t0
+        print(f"/rag/bulk : {len(questions) / bulk_elapsed:.2f} questions/s ({bulk_elapsed:.1f}s)")
+
+        if not args.skip_langserve:
+            t0 = time.perf_counter()
+            client.post(
+                "/rag/batch",
+                json={"inputs": questions, "config": {"max_concurrency": args.concurrency}},
+            ).raise_for_status()
+            batch_elapsed = time.perf_counter() - t0
+            print(f"/rag/batch: {len(questions) / batch_elapsed:.2f} questions/s ({batch_elapsed:.1f}s)")
@@ -0,0 +1,194 @@
+# app/context.py
+"""검색 문서 → 프롬프트 컨텍스트 패킹
+
+검색된 청크를 그대로 이어 붙이면 청크 간 겹침(chunk_overlap)과 중복 문서 때문에
+프롬프트 토큰과 생성 지연 시간이 늘어납니다. 여기서는
+1) 관련도 순서로 청크를 정렬하고 (metadata["relevance_score"]가 있으면 그 값, 없으면 검색 순서)
+2) 이미 넣은 내용과 거의 같은 청크는 버리고, 겹치는 문장은 한 번만 넣은 뒤
+3) 토큰 예산에 맞도록 문장 경계(한국어 종결 부호/목록 기호 고려)에서 잘라
+줄어든 토큰 수와 함께 반환합니다.
+"""
+import logging
+import os
+import re
+from dataclasses import dataclass
+
+from langchain_core.documents import Document
+
+from app.embedding_cache import normalize_text
+from app.history import count_tokens
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# 컨텍스트 토큰 예산과 중복 판정 기준 (환경변수로 변경 가능)
+CONTEXT_MAX_TOKENS = int(os.getenv("RAG_CONTEXT_MAX_TOKENS", "1500"))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("RAG_CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+
+# 청크 구분자
+SEPARATOR = "\n\n"
+# 남은 예산이 이보다 작으면 더 넣지 않음
+MIN_FILL_TOKENS = 16
+# 중복 판정에 쓰는 글자 n-gram 길이
+SHINGLE_SIZE = 5
+# 이미 넣은 문장의 일부인지(부분 문자열) 확인할 최소 길이 - 짧은 문장은 완전히 같을 때만 중복
+MIN_FRAGMENT_CHARS = 20
+
+# 종결 부호(. ! ? 。 … 등) 뒤 공백 또는 줄바꿈에서 문장을 나눔 ("3.5", "Inc.는" 처럼 뒤에 공백이 없으면 나누지 않음)
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?。？！…][\"'”’)\]])\s+|(?<=[.!?。？！…])\s+|\s*\n\s*")
+# "1.", "가.", "(3)" 처럼 목록 번호만 남은 조각은 다음 문장에 붙임
+_LIST_MARKER = re.compile(r"^(?:\d{1,3}|[가-하]|[a-zA-Z]|[①-⑳])[.)]$|^\(\d{1,3}\)$")
+
+CONTEXT_TOKENS = registry.counter(
+    "rag_context_tokens_total", "컨텍스트 토큰 수 (original: 단순 연결, packed: 패킹 후)", ("kind",)
+)
+CONTEXT_CHUNKS = registry.counter(
+    "rag_context_chunks_total", "컨텍스트 청크 처리 결과", ("result",)
+)
+
+
+def _split(text: str) -> list[tuple[str, str]]:
+    """(앞 구분자, 문장) 목록 - 구분자는 원문에 줄바꿈이 있었으면 "\n", 아니면 " " """
+    pieces = []
+    marker, marker_separator = "", ""
+    separator = ""
+    position = 0
+    for match in [*_SENTENCE_BREAK.finditer(text), None]:
+        piece = text[position : match.start() if match else len(text)].strip()
+        if _LIST_MARKER.match(piece):
+            if not marker:
+                marker_separator = separator
+            marker += piece + " "
+        elif piece:
+            pieces.append((marker_separator if marker else separator, marker + piece))
+            marker = ""
+        if match:
+            separator = "\n" if "\n" in match.group() else " "
+            position = match.end()
+    if marker:
+        pieces.append((marker_separator, marker.strip()))
+    return pieces
+
+
+def split_sentences(text: str) -> list[str]:
+    """한국어 문서를 문장 단위로 나눔 (목록 번호는 뒤 문장과 합침)"""
+    return [sentence for _, sentence in _split(text)]
+
+
+def _shingles(text: str) -> set[str]:
+    text = re.sub(r"\s+", "", text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i : i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+@dataclass
+class PackedContext:
+    """패킹 결과
+
+    original_tokens 는 기존 format_docs 처럼 모든 청크를 그대로 이어 붙였을 때의 토큰 수입니다.
+    """
+
+    text: str
+    tokens: int
+    original_tokens: int
+    chunks: int  # 컨텍스트에 들어간 청크 수
+    duplicates: int  # 중복으로 버린 청크 수
+    trimmed: int  # 예산 때문에 일부 문장만 넣거나 버린 청크 수
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.original_tokens - self.tokens)
+
+
+class ContextPacker:
+    """검색 문서를 중복 제거 + 토큰 예산 안에서 하나의 컨텍스트 문자열로 합침
+
+    Args:
+        max_tokens: 컨텍스트 최대 토큰 수
+        duplicate_threshold: 청크의 글자 n-gram 중 이미 넣은 내용에 포함된 비율이 이 값 이상이면 중복으로 버림
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = CONTEXT_MAX_TOKENS,
+        duplicate_threshold: float = CONTEXT_DUPLICATE_THRESHOLD,
+    ):
+        self.max_tokens = max_tokens
+        self.duplicate_threshold = duplicate_threshold
+
+    @staticmethod
+    def rank(docs: list[Document]) -> list[Document]:
+        """관련도 순 정렬 (relevance_score 가 없으면 검색기 순서 유지)"""
+        if all("relevance_score" in doc.metadata for doc in docs):
+            return sorted(docs, key=lambda doc: doc.metadata["relevance_score"], reverse=True)
+        return list(docs)
+
+    def pack(self, docs: list[Document]) -> PackedContext:
+        original_tokens = count_tokens(SEPARATOR.join(doc.page_content for doc in docs)) if docs else 0
+        separator_tokens = count_tokens(SEPARATOR)
+
+        parts = []
+        seen_shingles: set[str] = set()
+        seen_sentences: set[str] = set()
+        seen_text = ""  # 이미 넣은 문장 (정규화) - 청크 경계에서 잘린 문장 조각 판정용
+        remaining = self.max_tokens
+        duplicates = trimmed = 0
+
+        for doc in self.rank(docs):
+            shingles = _shingles(normalize_text(doc.page_content))
+            if shingles and len(shingles & seen_shingles) / len(shingles) >= self.duplicate_threshold:
+                duplicates += 1
+                continue
+            if remaining < MIN_FILL_TOKENS:
+                trimmed += 1
+                continue
+
+            budget = remaining - (separator_tokens if parts else 0)
+            kept, used, cut = "", 0, False
+            for separator, sentence in _split(doc.page_content):
+                key = normalize_text(sentence)
+                if key in seen_sentences or (len(key) >= MIN_FRAGMENT_CHARS and key in seen_text):
+                    # 앞 청크와 겹치는 문장 또는 청크 경계에서 잘린 문장 조각 (chunk_overlap 구간)
+                    continue
+                tokens = count_tokens(sentence) + (1 if kept else 0)
+                if used + tokens > budget:
+                    cut = True
+                    break
+                kept += (separator if kept else "") + sentence
+                used += tokens
+                seen_sentences.add(key)
+                seen_text += key + "\n"
+            trimmed += cut
+
+            if kept:
+                parts.append(kept)
+                remaining = budget - used
+                seen_shingles |= shingles
+
+        text = SEPARATOR.join(parts)
+        packed = PackedContext(
+            text=text,
+            tokens=count_tokens(text) if text else 0,
+            original_tokens=original_tokens,
+            chunks=len(parts),
+            duplicates=duplicates,
+            trimmed=trimmed,
+        )
+        CONTEXT_TOKENS.inc(packed.original_tokens, "original")
+        CONTEXT_TOKENS.inc(packed.tokens, "packed")
+        CONTEXT_CHUNKS.inc(packed.chunks, "kept")
+        CONTEXT_CHUNKS.inc(packed.duplicates, "duplicate")
+        CONTEXT_CHUNKS.inc(packed.trimmed, "trimmed")
+        logger.debug(
+            f"컨텍스트 패킹: {packed.original_tokens} → {packed.tokens} 토큰 "
+            f"(청크 {packed.chunks}개, 중복 {packed.duplicates}개, 잘림 {packed.trimmed}개)"
+        )
+        return packed
+
+
+def context_packer_from_env() -> ContextPacker | None:
+    """환경변수 설정으로 패커 생성 (RAG_CONTEXT_PACKING=0 이면 None - 기존처럼 단순 연결)"""
+    if os.getenv("RAG_CONTEXT_PACKING", "1") == "0":
+        return None
+    return ContextPacker()
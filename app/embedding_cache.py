@@ -0,0 +1,297 @@
+# app/embedding_cache.py
+"""질의 임베딩 캐시
+
+자주 들어오는 질문(예: "연차휴가는 어떻게 계산하나요?")을 매번 임베딩 API로 보내지 않도록
+메모리 LRU + 디스크(SQLite) 2단계 캐시를 임베딩 모델 앞에 둡니다.
+벡터는 두 단계 모두 float32 정밀도로 저장하므로 어느 단계에서 꺼내도 같은 값을 돌려줍니다.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import RunnableConfig
+
+# 기본 캐시 위치 (환경변수로 변경 가능)
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "./.cache/embeddings")
+
+
+def normalize_text(text: str) -> str:
+    """캐시 키 생성을 위한 텍스트 정규화 (유니코드 NFKC + 공백 정리)"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def to_float32(vector) -> list[float]:
+    """디스크에 저장하는 정밀도(float32)로 맞춘 벡터"""
+    return array("f", vector).tolist()
+
+
+# 요청 안에서 이미 계산한 질의 임베딩을 검색 단계로 넘길 때 쓰는 configurable 키
+QUERY_VECTOR_KEY = "query_vector"
+
+
+def with_query_vector(config: RunnableConfig | None, text: str, vector: list[float]) -> RunnableConfig:
+    """text 의 임베딩(vector)을 담은 config (체인의 하위 단계까지 전달됨)"""
+    config = dict(config or {})
+    config["configurable"] = {**config.get("configurable", {}), QUERY_VECTOR_KEY: (text, vector)}
+    return config
+
+
+def query_vector_from(config: RunnableConfig | None, text: str) -> list[float] | None:
+    """config 에 같은 text 의 임베딩이 담겨 있으면 반환"""
+    item = (config or {}).get("configurable", {}).get(QUERY_VECTOR_KEY)
+    if item is None or item[0] != text:
+        return None
+    return item[1]
+
+
+def make_key(model: str, text: str) -> str:
+    """모델 이름과 정규화된 텍스트로 캐시 키 생성"""
+    return hashlib.sha256(f"{model}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """임베딩 모델을 감싸는 2단계 캐시 (Chroma의 embedding_function으로 그대로 사용 가능)
+
+    Args:
+        embeddings: 실제 임베딩 모델 (예: OpenAIEmbeddings)
+        model_name: 캐시 키에 포함할 모델 이름
+        cache_dir: 디스크 캐시 디렉터리 (None이면 메모리 캐시만 사용)
+        max_memory_items: 메모리 LRU 최대 항목 수
+        max_disk_bytes: 디스크 캐시 최대 크기 (초과 시 오래 사용하지 않은 항목부터 삭제)
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        cache_dir: str | None = EMBEDDING_CACHE_DIR,
+        max_memory_items: int = 10_000,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()  # 메모리 LRU와 카운터 (이벤트 루프에서도 잡으므로 I/O 중에는 잡지 않음)
+        self._disk_lock = threading.Lock()  # SQLite 연결
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self.evictions = {"memory": 0, "disk": 0}
+
+        self._conn = None
+        self._disk_bytes = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._conn = sqlite3.connect(
+                os.path.join(cache_dir, "embeddings.sqlite3"),
+                check_same_thread=False,
+                isolation_level=None,  # autocommit
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)")
+            row = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+            self._disk_bytes = row[0]
+
+    # ---------- 캐시 저장소 ----------
+
+    def _memory_put(self, key: str, vector: list[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self.evictions["memory"] += 1
+
+    def _disk_get(self, key: str) -> list[float] | None:
+        if self._conn is None:
+            return None
+        row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE embeddings SET last_access = ? WHERE key = ?", (time.time(), key))
+        return array("f", row[0]).tolist()
+
+    def _disk_put(self, items: list[tuple[str, list[float]]]):
+        if self._conn is None or not items:
+            return
+        now = time.time()
+        added = 0
+        self._conn.execute("BEGIN")
+        try:
+            for key, vector in items:
+                blob = array("f", vector).tobytes()
+                # 이미 있는 키를 교체하면 늘어난 크기만 더함 (다른 프로세스가 먼저 저장했을 수 있음)
+                old = self._conn.execute("SELECT LENGTH(vector) FROM embeddings WHERE key = ?", (key,)).fetchone()
+                self._conn.execute("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", (key, blob, now))
+                added += len(blob) - (old[0] if old else 0)
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._disk_bytes += added
+        if self._disk_bytes > self.max_disk_bytes:
+            self._disk_evict()
+
+    def _disk_evict(self):
+        """디스크 캐시가 최대 크기를 넘으면 최대 크기의 90%가 될 때까지 오래된 항목 삭제"""
+        target = int(self.max_disk_bytes * 0.9)
+        cursor = self._conn.execute("SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_access")
+        total = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+        evicted = []
+        for key, size in cursor:
+            if total <= target:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+        self._disk_bytes = total
+        self.evictions["disk"] += len(evicted)
+
+    def _lookup_memory(self, keys: list[str]) -> list[list[float] | None]:
+        vectors = []
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self.hits["memory"] += 1
+                vectors.append(vector)
+        return vectors
+
+    def _lookup_disk(self, keys: list[str], vectors: list[list[float] | None]) -> list[list[float] | None]:
+        """메모리에 없던 항목을 디스크에서 조회 (SQLite I/O - 비동기 경로에서는 스레드에서 실행)"""
+        vectors = list(vectors)
+        missing = list(dict.fromkeys(key for key, vector in zip(keys, vectors) if vector is None))
+        with self._disk_lock:
+            found = {key: self._disk_get(key) for key in missing}
+        with self._lock:
+            for key, vector in found.items():
+                if vector is not None:
+                    self._memory_put(key, vector)
+            for i, key in enumerate(keys):
+                if vectors[i] is None:
+                    vectors[i] = found[key]
+                    if vectors[i] is None:
+                        self.misses += 1
+                    else:
+                        self.hits["disk"] += 1
+        return vectors
+
+    def _lookup(self, texts: list[str]) -> tuple[list[str], list[list[float] | None]]:
+        """캐시에서 조회하여 (키 목록, 벡터 목록(없으면 None))을 반환"""
+        keys = [make_key(self.model_name, text) for text in texts]
+        vectors = self._lookup_memory(keys)
+        if any(vector is None for vector in vectors):
+            vectors = self._lookup_disk(keys, vectors)
+        return keys, vectors
+
+    async def _alookup(self, texts: list[str]) -> tuple[list[str], list[list[float] | None]]:
+        """_lookup 의 비동기 버전 (메모리는 바로 확인하고 디스크 조회만 스레드에서 실행)"""
+        keys = [make_key(self.model_name, text) for text in texts]
+        vectors = self._lookup_memory(keys)
+        if any(vector is None for vector in vectors):
+            if self._conn is None:
+                vectors = self._lookup_disk(keys, vectors)
+            else:
+                vectors = await asyncio.to_thread(self._lookup_disk, keys, vectors)
+        return keys, vectors
+
+    def _store_memory(self, keys: list[str], vectors: list[list[float]]):
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._memory_put(key, vector)
+
+    def _store_disk(self, keys: list[str], vectors: list[list[float]]):
+        with self._disk_lock:
+            self._disk_put(list(zip(keys, vectors)))
+
+    def _store(self, keys: list[str], vectors: list[list[float]]):
+        self._store_memory(keys, vectors)
+        self._store_disk(keys, vectors)
+
+    async def _astore(self, keys: list[str], vectors: list[list[float]]):
+        self._store_memory(keys, vectors)
+        if self._conn is not None:
+            await asyncio.to_thread(self._store_disk, keys, vectors)
+
+    def _missing(self, texts, keys, vectors):
+        """캐시에 없는 텍스트만 중복 없이 추림"""
+        missing = {}
+        for text, key, vector in zip(texts, keys, vectors):
+            if vector is None and key not in missing:
+                missing[key] = text
+        return missing
+
+    # ---------- Embeddings 인터페이스 ----------
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, vectors = self._lookup(texts)
+        missing = self._missing(texts, keys, vectors)
+        if missing:
+            new_vectors = [to_float32(vector) for vector in self.embeddings.embed_documents(list(missing.values()))]
+            self._store(list(missing.keys()), new_vectors)
+            computed = dict(zip(missing.keys(), new_vectors))
+            vectors = [vector if vector is not None else computed[key] for key, vector in zip(keys, vectors)]
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        keys, vectors = self._lookup([text])
+        if vectors[0] is not None:
+            return vectors[0]
+        vector = to_float32(self.embeddings.embed_query(text))
+        self._store(keys, [vector])
+        return vector
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, vectors = await self._alookup(texts)
+        missing = self._missing(texts, keys, vectors)
+        if missing:
+            new_vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            new_vectors = [to_float32(vector) for vector in new_vectors]
+            await self._astore(list(missing.keys()), new_vectors)
+            computed = dict(zip(missing.keys(), new_vectors))
+            vectors = [vector if vector is not None else computed[key] for key, vector in zip(keys, vectors)]
+        return vectors
+
+    async def aembed_query(self, text: str) -> list[float]:
+        keys, vectors = await self._alookup([text])
+        if vectors[0] is not None:
+            return vectors[0]
+        vector = to_float32(await self.embeddings.aembed_query(text))
+        await self._astore(keys, [vector])
+        return vector
+
+    # ---------- 통계 ----------
+
+    def stats(self) -> dict:
+        """히트/미스 카운터와 캐시 크기"""
+        hits = self.hits["memory"] + self.hits["disk"]
+        total = hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "evictions": dict(self.evictions),
+            "memory_items": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+        }
+
+    def close(self):
+        with self._disk_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -1,10 +1,15 @@
+import asyncio
+import os
+import time
+
 import gradio as gr
 from dotenv import load_dotenv
 from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_chroma import Chroma
+from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, AIMessage
+
+from app.history import ChatHistoryManager
+from app.rag import engine, pack_context, reranker, retriever  # 서버와 같은 지연 초기화 엔진을 공유
 
 # 환경변수 로드
 load_dotenv()
@@ -13,31 +18,6 @@ load_dotenv()
 #  RAG 체인 구성
 ######################
 
-# OpenAI 임베딩 모델 생성
-embeddings_openai = OpenAIEmbeddings(
-    model="text-embedding-3-small",
-)
-
-# 저장된 벡터 저장소를 가져오기
-chroma_db = Chroma(
-    collection_name="labor_law",
-    embedding_function=embeddings_openai,
-    persist_directory="./chroma_db",
-)
-
-print("Chroma DB loaded")
-print(chroma_db._collection.count())  # 벡터 저장소에 있는 문서 수 출력
-
-# 검색기 초기화
-retriever = chroma_db.as_retriever(
-    search_type='mmr',
-    search_kwargs={
-        'k': 5,                  # 검색할 문서의 수
-        'fetch_k': 10,           # mmr 알고리즘에 전달할 문서의 수 (fetch_k > k)
-        'lambda_mult': 0.3,      # 다양성을 고려하는 정도
-    },
-)
-
 # 메시지 플레이스홀더가 있는 프롬프트 템플릿 정의
 prompt = ChatPromptTemplate.from_messages([
     ("system", """주어진 컨텍스트를 기반으로 질문에 답변하시오.
@@ -69,35 +49,60 @@ llm = ChatOpenAI(
     top_p=0.9,
 )
 
-# 문서 포맷팅
-def format_docs(docs):
-    return "\n\n".join([f"{doc.page_content}" for doc in docs])
-
 # RAG 체인 생성
 rag_chain = prompt | llm | StrOutputParser()
 
-# 사용자 메시지를 처리하고 AI 응답을 생성하는 함수
-def answer_invoke(message, history):
-    # 대화 이력을 LangChain 메시지 형식으로 변환
-    history_messages = []
-    for msg in history:
-        if msg['role'] == "user":
-            history_messages.append(HumanMessage(content=msg['content']))
-        elif msg['role'] == "assistant":
-            history_messages.append(AIMessage(content=msg['content']))
-    
-    # RAG 체인 실행
-    response = rag_chain.invoke({
+# 대화 이력 관리자 (이력 토큰 예산을 넘는 오래된 대화는 요약으로 대체)
+history_manager = ChatHistoryManager(
+    ChatOpenAI(model="gpt-4.1-mini", temperature=0),
+    max_tokens=int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "2000")),
+)
+
+# 동시 처리 설정 (환경변수로 변경 가능)
+CONCURRENCY_LIMIT = int(os.getenv("GRADIO_CONCURRENCY_LIMIT", "32"))  # 동시에 실행할 채팅 수
+QUEUE_MAX_SIZE = int(os.getenv("GRADIO_QUEUE_MAX_SIZE", "256"))  # 대기열 최대 길이
+
+# 사용자 메시지를 처리하고 AI 응답을 토큰 단위로 스트리밍하는 함수
+async def answer_stream(message, history):
+    start = time.perf_counter()
+
+    # 검색(비동기)과 대화 이력 구성(토큰 예산 적용, 필요 시 요약)을 동시에 실행
+    docs, (history_messages, history_stats) = await asyncio.gather(
+        retriever.ainvoke(message),
+        history_manager.build(history),
+    )
+    retrieval_time = time.perf_counter() - start
+    context = pack_context(docs)
+    history_info = (
+        f"컨텍스트 {context.tokens} 토큰(-{context.saved_tokens}) · "
+        f"이력 {history_stats['history_tokens']} 토큰"
+    )
+
+    # RAG 체인 스트리밍 실행
+    response = ""
+    first_token_time = None
+    async for chunk in rag_chain.astream({
         "chat_history": history_messages,
-        "context": format_docs(retriever.invoke(message)), 
+        "context": context.text,
         "question": message
-    })
-    
-    return response
+    }):
+        if first_token_time is None:
+            first_token_time = time.perf_counter() - start
+        response += chunk
+        yield response, f"⏳ 검색 {retrieval_time:.2f}s · 첫 토큰 {first_token_time:.2f}s · {history_info}"
+
+    total_time = time.perf_counter() - start
+    yield response, (
+        f"⏱️ 검색 {retrieval_time:.2f}s · 첫 토큰 {first_token_time or total_time:.2f}s · 전체 {total_time:.2f}s"
+        f" · {history_info}"
+    )
+
+# 응답 시간 표시 영역 (채팅창 아래에 표시)
+latency_display = gr.Markdown(render=False)
 
 # Gradio ChatInterface 객체 생성
 demo = gr.ChatInterface(
-    fn=answer_invoke,                    # 메시지 처리 함수
+    fn=answer_stream,                    # 메시지 처리 함수 (비동기 제너레이터)
     title="근로기준법 Q&A 챗봇",              # 채팅 인터페이스의 제목
     description="근로기준법 관련 질문에 답변하는 AI 챗봇입니다.",
     examples=[
@@ -106,9 +111,18 @@ demo = gr.ChatInterface(
         "최저임금은 어떻게 정해지나요?",
         "해고 절차는 어떻게 되나요?"
     ],
-    type="messages"
+    type="messages",
+    additional_outputs=[latency_display],  # 첫 토큰까지 걸린 시간 표시
+    concurrency_limit=CONCURRENCY_LIMIT,
 )
 
-# Gradio 인터페이스 실행
+# 대기열 설정: 최대 CONCURRENCY_LIMIT개의 채팅을 동시에 처리하고 나머지는 대기
+demo.queue(max_size=QUEUE_MAX_SIZE, default_concurrency_limit=CONCURRENCY_LIMIT)
+
+# Gradio 인터페이스 실행 (프로젝트 루트에서 `python -m app.gradio_app`)
 if __name__ == "__main__":
-    demo.launch()
\ No newline at end of file
+    # 첫 질문이 엔진 생성 시간을 기다리지 않도록 미리 준비
+    engine.warmup()
+    if reranker is not None:
+        reranker.load()
+    demo.launch()
@@ -0,0 +1,205 @@
+# app/history.py
+"""토큰 예산 기반 대화 이력 관리
+
+긴 대화에서도 LLM에 보내는 이력의 토큰 수가 일정하게 유지되도록
+최근 대화는 원문 그대로, 예산을 넘는 오래된 대화는 요약으로 대체합니다.
+요약은 대화 앞부분(prefix)의 해시를 키로 저장해 두고, 다음 턴에는
+이전 요약 이후 새로 밀려난 대화만 추가로 요약합니다.
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+logger = logging.getLogger(__name__)
+
+
+######################
+#  토큰 계산
+######################
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+
+                    try:
+                        _encoding = tiktoken.encoding_for_model("gpt-4.1-mini")
+                    except KeyError:
+                        _encoding = tiktoken.get_encoding("o200k_base")  # gpt-4.1 계열 인코딩
+                except Exception as e:
+                    logger.warning(f"tiktoken 인코딩을 불러오지 못해 글자 수로 토큰 수를 추정합니다: {e}")
+                    _encoding = False
+    return _encoding
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """gpt-4.1-mini 기준 토큰 수 (같은 문자열은 캐시)"""
+    encoding = _get_encoding()
+    if not encoding:
+        return max(1, len(text) // 2)  # 한국어는 대략 글자 2개당 1토큰
+    return len(encoding.encode(text))
+
+
+# 메시지 1개당 역할/구분자에 쓰이는 추가 토큰
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=8192)
+def to_message(role: str, content: str) -> BaseMessage:
+    """Gradio 메시지를 LangChain 메시지로 변환 (같은 메시지는 캐시된 객체 재사용)"""
+    if role == "user":
+        return HumanMessage(content=content)
+    return AIMessage(content=content)
+
+
+def _chain_hash(previous: str, role: str, content: str) -> str:
+    return hashlib.sha1(f"{previous}\x1f{role}\x1f{content}".encode("utf-8")).hexdigest()
+
+
+######################
+#  이력 관리자
+######################
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """다음은 근로기준법 Q&A 챗봇과 사용자의 이전 대화입니다.
+이후 대화에 필요한 사실, 사용자의 상황과 질문, 챗봇이 안내한 핵심 내용만 한국어로 간결하게 요약하시오.
+요약은 {max_tokens} 토큰을 넘지 않아야 합니다."""),
+    ("human", """[기존 요약]
+{summary}
+
+[추가 대화]
+{conversation}"""),
+])
+
+
+class ChatHistoryManager:
+    """토큰 예산 안에서 LLM에 보낼 대화 이력을 구성
+
+    Args:
+        llm: 요약에 사용할 채팅 모델
+        max_tokens: 이력(요약 + 최근 대화)에 허용할 최대 토큰 수
+        summary_max_tokens: 요약 1개의 목표 최대 토큰 수
+        low_watermark: 새로 요약할 때 최근 대화를 max_tokens의 이 비율까지 줄임
+            (여유를 두어 매 턴마다 요약하지 않도록 함)
+        max_summaries: 보관할 요약 수 (LRU)
+    """
+
+    def __init__(
+        self,
+        llm,
+        max_tokens: int = 2000,
+        summary_max_tokens: int = 300,
+        low_watermark: float = 0.5,
+        max_summaries: int = 1024,
+    ):
+        self.summary_chain = SUMMARY_PROMPT | llm | StrOutputParser()
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.low_watermark = low_watermark
+        self.max_summaries = max_summaries
+        self._summaries = OrderedDict()  # prefix 해시 -> (요약, 토큰 수)
+        self._lock = threading.Lock()
+        self.summary_calls = 0
+
+    def _get_summary(self, key: str):
+        with self._lock:
+            value = self._summaries.get(key)
+            if value is not None:
+                self._summaries.move_to_end(key)
+            return value
+
+    def _put_summary(self, key: str, summary: str):
+        with self._lock:
+            self._summaries[key] = (summary, count_tokens(summary) + MESSAGE_OVERHEAD_TOKENS)
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.max_summaries:
+                self._summaries.popitem(last=False)
+
+    async def build(self, history: list[dict]) -> tuple[list[BaseMessage], dict]:
+        """Gradio 이력(type="messages")으로 LLM에 보낼 메시지 목록과 통계를 반환"""
+        items = [
+            (msg["role"], msg["content"])
+            for msg in history
+            if msg.get("role") in ("user", "assistant") and isinstance(msg.get("content"), str)
+        ]
+        n = len(items)
+
+        # prefix 해시 체인과 메시지별 토큰 수
+        hashes = [""]
+        for role, content in items:
+            hashes.append(_chain_hash(hashes[-1], role, content))
+        tokens = [count_tokens(content) + MESSAGE_OVERHEAD_TOKENS for _, content in items]
+        suffix_tokens = [0] * (n + 1)
+        for i in range(n - 1, -1, -1):
+            suffix_tokens[i] = suffix_tokens[i + 1] + tokens[i]
+
+        # 1) 예산 안에 들어가는 가장 긴 구간을 가진 기존 요약 지점을 찾음 (없으면 0 = 요약 없음)
+        boundary, summary = None, None
+        for p in range(n + 1):
+            cached = self._get_summary(hashes[p]) if p > 0 else ("", 0)
+            if cached is not None and cached[1] + suffix_tokens[p] <= self.max_tokens:
+                boundary, summary = p, cached
+                break
+
+        # 2) 없으면 최근 대화가 low_watermark 이하가 되는 지점까지 새로 요약
+        if boundary is None:
+            target = int(self.max_tokens * self.low_watermark)
+            new_boundary = next(p for p in range(n + 1) if suffix_tokens[p] <= target)
+            # 사용자/AI 한 쌍이 갈라지지 않도록 사용자 메시지에서 시작
+            while new_boundary < n and items[new_boundary][0] != "user":
+                new_boundary += 1
+
+            # 이어서 요약할 수 있는 가장 최근 요약 지점
+            start, previous = 0, ""
+            for p in range(new_boundary, 0, -1):
+                cached = self._get_summary(hashes[p])
+                if cached is not None:
+                    start, previous = p, cached[0]
+                    break
+
+            if start == new_boundary:
+                # 이미 같은 지점의 요약이 있으면 그대로 사용
+                boundary, summary = start, self._get_summary(hashes[start])
+                return self._result(items, boundary, summary, suffix_tokens)
+
+            conversation = "\n".join(
+                f"{'사용자' if role == 'user' else '챗봇'}: {content}" for role, content in items[start:new_boundary]
+            )
+            text = await self.summary_chain.ainvoke({
+                "summary": previous or "(없음)",
+                "conversation": conversation,
+                "max_tokens": self.summary_max_tokens,
+            })
+            self.summary_calls += 1
+            self._put_summary(hashes[new_boundary], text)
+            boundary, summary = new_boundary, self._get_summary(hashes[new_boundary])
+
+        return self._result(items, boundary, summary, suffix_tokens)
+
+    @staticmethod
+    def _result(items, boundary, summary, suffix_tokens) -> tuple[list[BaseMessage], dict]:
+        messages = []
+        if boundary > 0:
+            messages.append(SystemMessage(content=f"[이전 대화 요약]\n{summary[0]}"))
+        messages.extend(to_message(role, content) for role, content in items[boundary:])
+
+        stats = {
+            "history_tokens": summary[1] + suffix_tokens[boundary],
+            "raw_tokens": suffix_tokens[0],
+            "summarized_messages": boundary,
+        }
+        return messages, stats
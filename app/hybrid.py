@@ -0,0 +1,532 @@
+# app/hybrid.py
+"""BM25(Kiwi 토큰화) + 벡터 검색 하이브리드 검색기
+
+노트북(DAY02_003)처럼 매번 rank-bm25로 전체 문서를 다시 토큰화/채점하지 않고,
+Chroma 컬렉션에서 한 번 만든 역색인을 디스크에 저장해 두고 추가·삭제된 문서만 반영합니다.
+질의 채점은 용어별 포스팅 배열에 대한 NumPy 연산으로 처리합니다.
+
+벤치마크 (기존 MMR 검색기와 비교):
+    python -m app.hybrid --collection db_korean_cosine_metadata --questions data/testset.xlsx
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import pickle
+import threading
+from collections import Counter
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+logger = logging.getLogger(__name__)
+
+# 색인에서 제외할 Kiwi 품사 (문장부호/기호)
+PUNCT_TAGS = {"SF", "SP", "SS", "SSO", "SSC", "SE", "SO", "SW", "SB"}
+
+
+######################
+#  Kiwi 토크나이저
+######################
+
+class KiwiTokenizer:
+    """Kiwi 형태소 분석 기반 토크나이저 (질의 토큰화 결과는 LRU 캐시)"""
+
+    def __init__(self, query_cache_size: int = 4096):
+        self._kiwi = None
+        self._lock = threading.Lock()
+        self.tokenize = lru_cache(maxsize=query_cache_size)(self._tokenize)
+
+    @property
+    def kiwi(self):
+        # Kiwi 모델 로딩은 1초 가까이 걸리므로 처음 사용할 때 생성
+        if self._kiwi is None:
+            with self._lock:
+                if self._kiwi is None:
+                    from kiwipiepy import Kiwi
+
+                    self._kiwi = Kiwi(num_workers=-1)  # -1: 가용한 모든 코어 사용
+        return self._kiwi
+
+    @staticmethod
+    def _forms(tokens) -> tuple[str, ...]:
+        return tuple(t.form.lower() for t in tokens if t.tag not in PUNCT_TAGS)
+
+    def _tokenize(self, text: str) -> tuple[str, ...]:
+        return self._forms(self.kiwi.tokenize(text))
+
+    def tokenize_many(self, texts: list[str]) -> list[tuple[str, ...]]:
+        """여러 문서를 한 번에 토큰화 (Kiwi 내부 멀티스레드 사용)"""
+        if not texts:
+            return []
+        return [self._forms(tokens) for tokens in self.kiwi.tokenize(texts)]
+
+
+_tokenizer = None
+
+
+def get_tokenizer() -> KiwiTokenizer:
+    """프로세스 전체에서 공유하는 토크나이저"""
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = KiwiTokenizer()
+    return _tokenizer
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+######################
+#  BM25 역색인
+######################
+
+class SparseIndex:
+    """증분 갱신이 가능한 BM25 역색인
+
+    - 문서는 내부 번호(idx)로 관리하고, 삭제된 문서는 alive=False로 표시만 함
+    - 토큰화 결과는 본문 해시 기준으로 보관하여 같은 본문을 다시 토큰화하지 않음
+    - 포스팅 목록은 용어별 NumPy 배열로 변환해 두고, 바뀐 용어만 다시 변환
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = []  # idx -> Chroma 문서 id
+        self.id_to_idx = {}
+        self.texts = []
+        self.metadatas = []
+        self.doc_len = []
+        self.alive = []
+        self.postings = {}  # 용어 -> ([idx], [tf])
+        self.df = Counter()  # 살아 있는 문서 기준 문서 빈도
+        self.token_cache = {}  # 본문 해시 -> 토큰
+        self._lock = threading.RLock()
+        self._reset_arrays()
+
+    def _reset_arrays(self):
+        self._term_arrays = {}
+        self._doc_norm = None
+        self._alive_mask = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ("_lock", "_term_arrays", "_doc_norm", "_alive_mask"):
+            state.pop(name)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+        self._reset_arrays()
+
+    @property
+    def size(self) -> int:
+        return len(self.id_to_idx)
+
+    def add(self, ids: list[str], texts: list[str], metadatas: list[dict], tokenizer: KiwiTokenizer):
+        """문서 추가 (이미 있는 id는 교체)"""
+        hashes = [text_hash(text) for text in texts]
+        todo = {h: text for h, text in zip(hashes, texts) if h not in self.token_cache}
+        # 토큰화는 잠금 밖에서 하고, 결과는 잠금 안에서 반영 (그 사이 압축으로 token_cache 가 바뀔 수 있음)
+        tokenized = dict(zip(todo.keys(), tokenizer.tokenize_many(list(todo.values())))) if todo else {}
+
+        with self._lock:
+            self.token_cache.update(tokenized)
+            missing = {h: text for h, text in zip(hashes, texts) if h not in self.token_cache}
+            if missing:  # 확인 이후 압축으로 캐시에서 빠진 본문 (드묾)
+                self.token_cache.update(zip(missing.keys(), tokenizer.tokenize_many(list(missing.values()))))
+            # 교체되는 문서를 지우고 새 문서를 넣은 뒤에 압축 (압축이 새 문서의 토큰 캐시를 버리지 않도록)
+            self._mark_removed([doc_id for doc_id in ids if doc_id in self.id_to_idx])
+            for doc_id, text, metadata, h in zip(ids, texts, metadatas, hashes):
+                tokens = self.token_cache[h]
+                if doc_id in self.id_to_idx:  # 같은 호출 안에서 중복된 id는 마지막 것만 남김
+                    self._mark_removed([doc_id])
+                idx = len(self.ids)
+                self.ids.append(doc_id)
+                self.id_to_idx[doc_id] = idx
+                self.texts.append(text)
+                self.metadatas.append(metadata or {})
+                self.doc_len.append(len(tokens))
+                self.alive.append(True)
+                for term, tf in Counter(tokens).items():
+                    doc_list, tf_list = self.postings.setdefault(term, ([], []))
+                    doc_list.append(idx)
+                    tf_list.append(tf)
+                    self.df[term] += 1
+                    self._term_arrays.pop(term, None)
+            self._doc_norm = None
+            self._alive_mask = None
+            self._compact_if_sparse()
+
+    def remove(self, ids: list[str]):
+        """문서 삭제 (삭제된 문서가 절반을 넘으면 색인을 압축)"""
+        with self._lock:
+            self._mark_removed(ids)
+            self._compact_if_sparse()
+
+    def _mark_removed(self, ids: list[str]):
+        """문서를 삭제 표시만 함 (호출자가 _lock 을 잡고 있어야 함)"""
+        for doc_id in ids:
+            idx = self.id_to_idx.pop(doc_id, None)
+            if idx is None:
+                continue
+            self.alive[idx] = False
+            tokens = self.token_cache.get(text_hash(self.texts[idx]), ())
+            for term in set(tokens):
+                self.df[term] -= 1
+        # 살아 있는 문서가 바뀌면 평균 문서 길이(avgdl)도 바뀌므로 정규화 값도 다시 계산
+        self._doc_norm = None
+        self._alive_mask = None
+
+    def _compact_if_sparse(self):
+        if len(self.ids) > 2 * max(self.size, 1):
+            self._compact()
+
+    def _compact(self):
+        """삭제 표시된 문서를 빼고 색인을 다시 구성 (재토큰화 없음, 호출자가 _lock 을 잡고 있어야 함)
+
+        새 배열은 지역 변수로 만든 뒤 한 번에 바꿔 끼우므로, 잠금을 기다리던 검색은 압축 전이나 후의
+        완전한 색인만 보게 됩니다.
+        """
+        live = [i for i, alive in enumerate(self.alive) if alive]
+        new_idx = {old: new for new, old in enumerate(live)}
+        postings = {}
+        df = Counter()
+        for term, (doc_list, tf_list) in self.postings.items():
+            kept = [(new_idx[i], tf) for i, tf in zip(doc_list, tf_list) if i in new_idx]
+            if kept:
+                postings[term] = tuple(map(list, zip(*kept)))
+                df[term] = len(kept)
+        ids = [self.ids[i] for i in live]
+        texts = [self.texts[i] for i in live]
+        hashes = {text_hash(text) for text in texts}
+
+        self.ids = ids
+        self.id_to_idx = {doc_id: idx for idx, doc_id in enumerate(ids)}
+        self.texts = texts
+        self.metadatas = [self.metadatas[i] for i in live]
+        self.doc_len = [self.doc_len[i] for i in live]
+        self.alive = [True] * len(live)
+        self.postings = postings
+        self.df = df
+        self.token_cache = {h: tokens for h, tokens in self.token_cache.items() if h in hashes}
+        self._reset_arrays()
+
+    def sync(self, vectorstore, tokenizer: KiwiTokenizer) -> tuple[int, int, int]:
+        """Chroma 컬렉션과 비교하여 바뀐 문서만 반영하고 (추가 수, 삭제 수, 메타데이터 갱신 수)를 반환
+
+        같은 id라도 본문이 바뀌었으면 다시 토큰화하고, 메타데이터만 바뀌었으면 메타데이터만 교체합니다.
+        """
+        current = vectorstore.get(include=["documents", "metadatas"])
+        docs = {
+            doc_id: (text, metadata or {})
+            for doc_id, text, metadata in zip(current["ids"], current["documents"], current["metadatas"])
+        }
+        with self._lock:
+            removed = [doc_id for doc_id in self.id_to_idx if doc_id not in docs]
+            added, updated = [], []
+            for doc_id, (text, metadata) in docs.items():
+                idx = self.id_to_idx.get(doc_id)
+                if idx is None or text != self.texts[idx]:
+                    added.append(doc_id)
+                elif metadata != self.metadatas[idx]:
+                    updated.append(doc_id)
+            for doc_id in updated:
+                self.metadatas[self.id_to_idx[doc_id]] = docs[doc_id][1]
+        if removed:
+            self.remove(removed)
+        if added:
+            self.add(added, [docs[doc_id][0] for doc_id in added], [docs[doc_id][1] for doc_id in added], tokenizer)
+        return len(added), len(removed), len(updated)
+
+    def _arrays_for(self, term: str):
+        arrays = self._term_arrays.get(term)
+        if arrays is None:
+            doc_list, tf_list = self.postings[term]
+            arrays = (np.asarray(doc_list, dtype=np.int64), np.asarray(tf_list, dtype=np.float32))
+            self._term_arrays[term] = arrays
+        return arrays
+
+    def _prepare(self):
+        if self._doc_norm is None:
+            doc_len = np.asarray(self.doc_len, dtype=np.float32)
+            alive = np.asarray(self.alive, dtype=bool)
+            avgdl = doc_len[alive].mean() if alive.any() else 1.0
+            self._doc_norm = self.k1 * (1 - self.b + self.b * doc_len / max(avgdl, 1e-6))
+        if self._alive_mask is None:
+            self._alive_mask = np.asarray(self.alive, dtype=bool)
+
+    def search(self, query_tokens, top_n: int) -> list[tuple[int, float]]:
+        """BM25 점수 상위 top_n개의 (idx, score) 목록
+
+        idx 는 다음 삭제/압축 전까지만 유효하므로 문서가 필요하면 search_documents 를 사용합니다.
+        """
+        with self._lock:
+            if not self.size:
+                return []
+            self._prepare()
+            n_docs = self.size
+            scores = np.zeros(len(self.ids), dtype=np.float32)
+            for term, qtf in Counter(query_tokens).items():
+                df = self.df.get(term, 0)
+                if df <= 0:
+                    continue
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                idx, tf = self._arrays_for(term)
+                scores[idx] += qtf * idf * tf * (self.k1 + 1) / (tf + self._doc_norm[idx])
+            scores[~self._alive_mask] = 0.0
+
+        top_n = min(top_n, len(scores))
+        top = np.argpartition(-scores, top_n - 1)[:top_n]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def search_documents(self, query_tokens, top_n: int) -> list[tuple[Document, float]]:
+        """BM25 점수 상위 top_n개의 (문서, score) 목록 (채점과 문서 조회를 같은 잠금 안에서 수행)"""
+        with self._lock:
+            return [(self.document(idx), score) for idx, score in self.search(query_tokens, top_n)]
+
+    def document(self, idx: int) -> Document:
+        return Document(id=self.ids[idx], page_content=self.texts[idx], metadata=self.metadatas[idx])
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with self._lock, open(tmp_path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SparseIndex":
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def load_or_build_index(vectorstore, path: str, tokenizer: KiwiTokenizer | None = None) -> SparseIndex:
+    """저장된 색인을 읽어 컬렉션과 동기화 (없으면 새로 생성) 후 변경이 있으면 저장"""
+    tokenizer = tokenizer or get_tokenizer()
+    index = None
+    if os.path.exists(path):
+        try:
+            index = SparseIndex.load(path)
+        except Exception as e:
+            logger.warning(f"BM25 색인을 읽지 못해 새로 생성합니다: {e}")
+    if index is None:
+        index = SparseIndex()
+    added, removed, updated = index.sync(vectorstore, tokenizer)
+    if added or removed or updated or not os.path.exists(path):
+        index.save(path)
+    logger.info(
+        f"BM25 색인 준비 완료: documents={index.size}, added={added}, removed={removed}, updated={updated}"
+    )
+    return index
+
+
+######################
+#  점수 결합
+######################
+
+def _doc_key(doc: Document) -> str:
+    return doc.id or text_hash(doc.page_content)
+
+
+def fuse_results(
+    dense: list[tuple[Document, float]],
+    sparse: list[tuple[Document, float]],
+    method: str = "rrf",
+    dense_weight: float = 0.5,
+    rrf_k: int = 60,
+) -> list[tuple[Document, float]]:
+    """벡터 검색과 BM25 결과를 RRF 또는 가중합(min-max 정규화)으로 결합"""
+    fused = {}
+    docs = {}
+    for results, weight in ((dense, dense_weight), (sparse, 1 - dense_weight)):
+        if not results:
+            continue
+        if method == "rrf":
+            contributions = [1 / (rrf_k + rank + 1) for rank in range(len(results))]
+        else:
+            scores = np.asarray([score for _, score in results], dtype=np.float32)
+            span = scores.max() - scores.min()
+            contributions = (scores - scores.min()) / span if span > 0 else np.ones_like(scores)
+            contributions = (weight * contributions).tolist()
+        for (doc, _), contribution in zip(results, contributions):
+            key = _doc_key(doc)
+            docs.setdefault(key, doc)
+            fused[key] = fused.get(key, 0.0) + contribution
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    return [(docs[key], score) for key, score in ranked]
+
+
+class HybridRetriever(BaseRetriever):
+    """Chroma 벡터 검색 + BM25 역색인 하이브리드 검색기
+
+    Args:
+        vectorstore: Chroma 벡터 저장소
+        index: SparseIndex
+        k: 최종 반환 문서 수
+        fetch_k: 각 검색기에서 가져올 후보 수
+        fusion: "rrf" 또는 "weighted"
+        dense_weight: weighted 방식에서 벡터 검색 점수의 가중치
+        rrf_k: RRF 상수
+    """
+
+    vectorstore: Any
+    index: Any
+    tokenizer: Any = None
+    k: int = 5
+    fetch_k: int = 20
+    fusion: str = "rrf"
+    dense_weight: float = 0.5
+    rrf_k: int = 60
+
+    def _sparse(self, query: str) -> list[tuple[Document, float]]:
+        tokenizer = self.tokenizer or get_tokenizer()
+        return self.index.search_documents(tokenizer.tokenize(query), self.fetch_k)
+
+    def _dense(self, results) -> list[tuple[Document, float]]:
+        # 거리(작을수록 유사)를 점수(클수록 유사)로 변환 - 컬렉션의 거리 함수와 무관하게 사용
+        return [(doc, -distance) for doc, distance in results]
+
+    def _fuse(self, dense, sparse) -> list[Document]:
+        fused = fuse_results(dense, sparse, self.fusion, self.dense_weight, self.rrf_k)[: self.k]
+        return [doc for doc, _ in fused]
+
+    def _vector_search(self, query: str, query_vector: list[float] | None) -> list[tuple[Document, float]]:
+        # 질의 임베딩을 이미 받았으면 다시 임베딩하지 않고 벡터로 검색
+        if query_vector is not None:
+            return self.vectorstore.similarity_search_by_vector_with_relevance_scores(query_vector, k=self.fetch_k)
+        return self.vectorstore.similarity_search_with_score(query, k=self.fetch_k)
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun,
+        query_vector: list[float] | None = None,
+    ) -> list[Document]:
+        dense = self._dense(self._vector_search(query, query_vector))
+        return self._fuse(dense, self._sparse(query))
+
+    async def _aget_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: AsyncCallbackManagerForRetrieverRun,
+        query_vector: list[float] | None = None,
+    ) -> list[Document]:
+        # 벡터 검색과 BM25 채점을 동시에 실행
+        if query_vector is not None:
+            dense_search = asyncio.to_thread(self._vector_search, query, query_vector)
+        else:
+            dense_search = self.vectorstore.asimilarity_search_with_score(query, k=self.fetch_k)
+        dense, sparse = await asyncio.gather(dense_search, asyncio.to_thread(self._sparse, query))
+        return self._fuse(self._dense(dense), sparse)
+
+    def refresh(self, index_path: str | None = None) -> tuple[int, int, int]:
+        """컬렉션에서 추가/삭제/변경된 문서를 색인에 반영 (index_path가 있으면 저장)"""
+        added, removed, updated = self.index.sync(self.vectorstore, self.tokenizer or get_tokenizer())
+        if index_path and (added or removed or updated):
+            self.index.save(index_path)
+        return added, removed, updated
+
+
+def index_path_for(persist_directory: str, collection_name: str) -> str:
+    return os.path.join(persist_directory, f"bm25_{collection_name}.pkl")
+
+
+def build_hybrid_retriever(vectorstore, index_path: str, **kwargs) -> HybridRetriever:
+    """색인을 준비하고 하이브리드 검색기를 생성"""
+    index = load_or_build_index(vectorstore, index_path)
+    return HybridRetriever(vectorstore=vectorstore, index=index, **kwargs)
+
+
+######################
+#  벤치마크
+######################
+
+def load_questions(path: str) -> tuple[list[str], list[list[str]] | None]:
+    """질문 목록 로드 (.xlsx 테스트셋이면 reference_contexts도 함께 반환)"""
+    if path.endswith(".xlsx"):
+        import ast
+
+        import pandas as pd
+
+        df = pd.read_excel(path)
+        questions = df["user_input"].tolist()
+        references = None
+        if "reference_contexts" in df:
+            references = [ast.literal_eval(value) for value in df["reference_contexts"]]
+        return questions, references
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()], None
+
+
+def _benchmark(retriever, questions, references, k) -> dict:
+    import time
+
+    from rapidfuzz import fuzz
+
+    latencies = []
+    hits = 0
+    for i, question in enumerate(questions):
+        t0 = time.perf_counter()
+        docs = retriever.invoke(question)[:k]
+        latencies.append(time.perf_counter() - t0)
+        if references is not None:
+            hits += any(
+                fuzz.partial_ratio(ref, doc.page_content) >= 80 for ref in references[i] for doc in docs
+            )
+    latencies = np.asarray(latencies) * 1000
+    result = {
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+    if references is not None:
+        result[f"hit@{k}"] = hits / len(questions)
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from app.rag import CHROMA_PERSIST_DIR, RagEngine
+
+    parser = argparse.ArgumentParser(description="하이브리드 검색기와 MMR 검색기 비교")
+    parser.add_argument("--collection", default="labor_law")
+    parser.add_argument("--persist-dir", default=CHROMA_PERSIST_DIR)
+    parser.add_argument("--questions", default="data/testset.xlsx", help=".xlsx 테스트셋 또는 한 줄에 한 질문인 텍스트 파일")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--fusion", choices=["rrf", "weighted"], default="rrf")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = RagEngine(collection_name=args.collection, persist_directory=args.persist_dir)
+    questions, references = load_questions(args.questions)
+
+    # 질문 임베딩을 미리 캐시에 올려 두어 두 검색기 모두 API 호출 시간 없이 비교
+    engine.embeddings.embed_documents(questions)
+
+    t0 = time.perf_counter()
+    hybrid = build_hybrid_retriever(
+        engine.chroma_db,
+        index_path_for(args.persist_dir, args.collection),
+        k=args.k,
+        fetch_k=args.fetch_k,
+        fusion=args.fusion,
+    )
+    print(f"BM25 색인 준비: {time.perf_counter() - t0:.2f}s ({hybrid.index.size}개 문서)")
+
+    mmr = engine.chroma_db.as_retriever(
+        search_type="mmr", search_kwargs={"k": args.k, "fetch_k": 10, "lambda_mult": 0.3}
+    )
+    for name, retriever in (("MMR", mmr), ("Hybrid", hybrid)):
+        print(name, _benchmark(retriever, questions, references, args.k))
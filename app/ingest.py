@@ -0,0 +1,270 @@
+# app/ingest.py
+"""근로기준법 PDF → Chroma 컬렉션(labor_law) 증분 적재 도구
+
+- PDF 페이지 텍스트 추출을 여러 프로세스에서 병렬로 수행
+- 페이지가 추출되는 대로 청크로 분할 (전체 문서를 메모리에 모으지 않음)
+- 청크 id를 출처 + 본문 해시로 만들어 이미 적재된 청크는 다시 임베딩하지 않음 (페이지 등 메타데이터만 갱신)
+- 새 청크만 큰 배치로 임베딩 API에 보내되 동시 요청 수를 제한
+- Chroma에는 배치 단위로 upsert 하고, 개정으로 사라진 청크는 삭제
+- hybrid 검색용 BM25 색인 저장본이 있으면 적재 후 함께 동기화
+
+사용 예 (프로젝트 루트에서):
+    python -m app.ingest data/labor_law.pdf --collection labor_law --persist-dir ./chroma_db
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+# 환경변수 로드
+load_dotenv()
+
+# 출처 경로의 기준 (프로젝트 루트)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def extract_pages(path: str, start: int, end: int) -> tuple[list[tuple[int, str]], float]:
+    """[start, end) 범위 페이지의 텍스트와 소요 시간을 반환 (워커 프로세스에서 실행)"""
+    from pypdf import PdfReader
+
+    t0 = time.perf_counter()
+    reader = PdfReader(path)
+    pages = [(i, reader.pages[i].extract_text() or "") for i in range(start, end)]
+    return pages, time.perf_counter() - t0
+
+
+def page_count(path: str) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def source_key(pdf_path: str) -> str:
+    """PDF의 출처 키 - 입력한 경로 형태(상대/절대, ./, 심볼릭 링크)와 무관하게 같은 파일이면 같은 값
+
+    프로젝트 안의 파일은 루트 기준 상대 경로(예: data/labor_law.pdf), 밖의 파일은 절대 경로를 사용합니다.
+    """
+    path = os.path.realpath(pdf_path)
+    relative = os.path.relpath(path, PROJECT_ROOT)
+    if not relative.startswith(os.pardir + os.sep) and not os.path.isabs(relative):
+        path = relative
+    return path.replace(os.sep, "/")
+
+
+def chunk_id(source: str, text: str) -> str:
+    """출처 + 청크 본문 해시 (Chroma 문서 id로 사용)
+
+    출처를 포함하므로 다른 PDF에 같은 본문이 있어도 각자의 청크로 저장되고,
+    한 PDF를 다시 적재하거나 지울 때 다른 PDF의 청크를 건드리지 않습니다.
+    """
+    return hashlib.sha256(f"{source}\0{text}".encode("utf-8")).hexdigest()
+
+
+class StageTimer:
+    """단계별 누적 소요 시간과 처리 건수"""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    @contextmanager
+    def stage(self, name: str, count: int = 0):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - t0
+            self.counts[name] += count
+
+    def summary(self, wall: float) -> str:
+        lines = [f"{'단계':<10}{'시간(s)':>10}{'건수':>10}"]
+        for name, seconds in self.seconds.items():
+            lines.append(f"{name:<10}{seconds:>10.2f}{self.counts[name]:>10}")
+        lines.append(f"{'전체':<10}{wall:>10.2f}")
+        return "\n".join(lines)
+
+
+async def ingest(
+    pdf_path: str,
+    collection_name: str = "labor_law",
+    persist_directory: str = "./chroma_db",
+    embedding_model: str = "text-embedding-3-small",
+    workers: int = os.cpu_count() or 1,
+    pages_per_task: int = 8,
+    chunk_size: int = 500,
+    chunk_overlap: int = 100,
+    batch_size: int = 256,
+    concurrency: int = 4,
+) -> dict:
+    """PDF를 증분 적재하고 결과 통계를 반환"""
+    from langchain_chroma import Chroma
+    from langchain_openai import OpenAIEmbeddings
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    from app.hybrid import index_path_for, load_or_build_index
+
+    wall_start = time.perf_counter()
+    timer = StageTimer()
+    source = source_key(pdf_path)  # 청크 id, 메타데이터, 삭제 대상 조회에 모두 같은 키 사용
+
+    # 노트북(DAY01_005)과 같은 분할 설정 (토큰 수 기준)
+    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name="cl100k_base",
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+    embeddings = OpenAIEmbeddings(model=embedding_model)
+    chroma_db = Chroma(
+        collection_name=collection_name,
+        embedding_function=embeddings,
+        persist_directory=persist_directory,
+        collection_metadata={"hnsw:space": "cosine"},  # l2, ip, cosine 중에서 선택
+    )
+    collection = chroma_db._collection
+    upsert_batch_size = min(5000, chroma_db._client.get_max_batch_size())
+
+    seen_ids = set()  # 이번 실행(이 출처)에서 만든 청크 id (중복 본문 제거 + 삭제 대상 계산용)
+    pending = []  # 임베딩 대기 중인 새 청크
+    tasks = []
+    semaphore = asyncio.Semaphore(concurrency)
+    chroma_lock = asyncio.Lock()
+    stats = {"pages": 0, "chunks": 0, "duplicates": 0, "unchanged": 0, "updated": 0, "embedded": 0, "deleted": 0}
+
+    async def embed_and_upsert(batch: list[tuple[str, str, dict]]):
+        ids, texts, metadatas = map(list, zip(*batch))
+        async with semaphore:
+            with timer.stage("embed", len(texts)):
+                vectors = await embeddings.aembed_documents(texts)
+        async with chroma_lock:
+            with timer.stage("upsert", len(texts)):
+                for i in range(0, len(ids), upsert_batch_size):
+                    await asyncio.to_thread(
+                        collection.upsert,
+                        ids=ids[i : i + upsert_batch_size],
+                        embeddings=vectors[i : i + upsert_batch_size],
+                        documents=texts[i : i + upsert_batch_size],
+                        metadatas=metadatas[i : i + upsert_batch_size],
+                    )
+        stats["embedded"] += len(texts)
+
+    async def flush():
+        """대기 중인 청크 중 Chroma에 없는 것만 골라 임베딩 작업으로 넘김
+
+        이미 있는 청크는 다시 임베딩하지 않고, 페이지가 밀리는 등 메타데이터가 바뀐 경우만 갱신합니다.
+        """
+        nonlocal pending
+        batch, pending = pending, []
+        if not batch:
+            return
+        with timer.stage("dedupe", len(batch)):
+            async with chroma_lock:
+                existing = await asyncio.to_thread(
+                    collection.get, ids=[item[0] for item in batch], include=["metadatas"]
+                )
+        stored = dict(zip(existing["ids"], existing["metadatas"]))
+        new_items = [item for item in batch if item[0] not in stored]
+        changed = [item for item in batch if item[0] in stored and stored[item[0]] != item[2]]
+        stats["unchanged"] += len(batch) - len(new_items) - len(changed)
+        if changed:
+            ids, _, metadatas = map(list, zip(*changed))
+            async with chroma_lock:
+                with timer.stage("update", len(ids)):
+                    await asyncio.to_thread(collection.update, ids=ids, metadatas=metadatas)
+            stats["updated"] += len(ids)
+        if new_items:
+            tasks.append(asyncio.create_task(embed_and_upsert(new_items)))
+
+    # 1) 페이지 범위별로 워커 프로세스에 텍스트 추출을 맡김
+    total_pages = page_count(pdf_path)
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            loop.run_in_executor(pool, extract_pages, pdf_path, start, min(start + pages_per_task, total_pages))
+            for start in range(0, total_pages, pages_per_task)
+        ]
+
+        # 2) 추출이 끝난 범위부터 순서대로 분할하고 배치가 차면 바로 임베딩 시작
+        for future in futures:
+            pages, parse_seconds = await future
+            timer.seconds["parse"] += parse_seconds
+            timer.counts["parse"] += len(pages)
+            stats["pages"] += len(pages)
+            for page_no, text in pages:
+                with timer.stage("chunk"):
+                    chunks = text_splitter.split_text(text)
+                timer.counts["chunk"] += len(chunks)
+                for chunk in chunks:
+                    stats["chunks"] += 1
+                    doc_id = chunk_id(source, chunk)
+                    if doc_id in seen_ids:
+                        stats["duplicates"] += 1
+                        continue
+                    seen_ids.add(doc_id)
+                    pending.append((doc_id, chunk, {"source": source, "page": page_no}))
+                    if len(pending) >= batch_size:
+                        await flush()
+        await flush()
+
+    # 3) 남은 임베딩/적재 작업 완료 대기
+    if tasks:
+        await asyncio.gather(*tasks)
+
+    # 4) 이번 PDF에서 더 이상 만들어지지 않는 청크(개정으로 바뀐 조항)를 삭제
+    with timer.stage("delete"):
+        # 출처 키를 정규화하기 전에 입력한 경로 그대로 적재된 청크도 함께 정리
+        sources = list(dict.fromkeys([source, os.path.normpath(pdf_path)]))
+        where = {"source": source} if len(sources) == 1 else {"source": {"$in": sources}}
+        stored = await asyncio.to_thread(collection.get, where=where, include=[])
+        stale_ids = [doc_id for doc_id in stored["ids"] if doc_id not in seen_ids]
+        for i in range(0, len(stale_ids), upsert_batch_size):
+            await asyncio.to_thread(collection.delete, ids=stale_ids[i : i + upsert_batch_size])
+    timer.counts["delete"] += len(stale_ids)
+    stats["deleted"] = len(stale_ids)
+
+    # 5) hybrid 검색용 BM25 색인 저장본이 있으면 함께 갱신 (실행 중인 서버는 HYBRID_REFRESH_INTERVAL 마다 다시 동기화)
+    index_path = index_path_for(persist_directory, collection_name)
+    if os.path.exists(index_path):
+        with timer.stage("bm25"):
+            await asyncio.to_thread(load_or_build_index, chroma_db, index_path)
+
+    wall = time.perf_counter() - wall_start
+    stats["documents"] = collection.count()
+    stats["seconds"] = wall
+    print(timer.summary(wall))
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PDF를 Chroma 컬렉션에 증분 적재")
+    parser.add_argument("pdf", nargs="?", default="data/labor_law.pdf")
+    parser.add_argument("--collection", default="labor_law")
+    parser.add_argument("--persist-dir", default=os.getenv("CHROMA_PERSIST_DIR", "./chroma_db"))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="PDF 추출 프로세스 수")
+    parser.add_argument("--pages-per-task", type=int, default=8)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=256, help="임베딩 요청 1회당 청크 수")
+    parser.add_argument("--concurrency", type=int, default=4, help="동시 임베딩 요청 수")
+    args = parser.parse_args()
+
+    result = asyncio.run(
+        ingest(
+            args.pdf,
+            collection_name=args.collection,
+            persist_directory=args.persist_dir,
+            workers=args.workers,
+            pages_per_task=args.pages_per_task,
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+        )
+    )
+    print(result)
@@ -0,0 +1,542 @@
+# app/loadtest.py
+"""app/server.py 오프라인 부하 테스트
+
+OpenAI API를 호출하지 않도록 채팅/임베딩 모델을 결정적인 가짜 모델로 바꾸고,
+data/korean_docs_final.jsonl 로 임시 Chroma 컬렉션을 만든 뒤 서버를 같은 프로세스에서 띄웁니다.
+/openai 와 /rag 의 invoke, batch, stream 경로에 동시 요청을 보내
+p50/p95/p99 지연 시간, 처리량, 오류율을 측정하고 결과를 JSON으로 저장합니다.
+
+사용 예 (프로젝트 루트에서):
+    python -m app.loadtest --concurrency 1 8 32 --requests 200 --output loadtest.json
+
+    # 이전 커밋의 결과와 비교
+    python -m app.loadtest --output loadtest_new.json --compare loadtest.json
+
+클라이언트와 서버가 한 프로세스(별도 스레드)에서 실행되므로 절대값보다는
+같은 설정으로 측정한 커밋 간 비교에 사용합니다.
+"""
+import asyncio
+import functools
+import hashlib
+import json
+import math
+import os
+import platform
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import unicodedata
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Iterator
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+DOCS_PATH = "data/korean_docs_final.jsonl"
+
+# 기본 질문 (korean_docs_final.jsonl 의 리비안/테슬라 문서 기준)
+QUESTIONS = [
+    "리비안은 언제 설립되었나요?",
+    "리비안의 주요 제품은 무엇인가요?",
+    "리비안의 본사는 어디에 있나요?",
+    "테슬라의 창업자는 누구인가요?",
+    "테슬라가 생산하는 차량 모델을 알려주세요.",
+    "테슬라의 에너지 저장 제품은 무엇이 있나요?",
+    "리비안과 아마존의 관계를 설명해 주세요.",
+    "테슬라의 기가팩토리는 어디에 있나요?",
+    "리비안 R1T와 R1S의 차이는 무엇인가요?",
+    "테슬라 오토파일럿은 어떤 기능인가요?",
+    "리비안의 상장 시기와 공모 규모는?",
+    "테슬라의 슈퍼차저 네트워크에 대해 알려주세요.",
+]
+
+SCENARIOS = [(endpoint, mode) for endpoint in ("openai", "rag") for mode in ("invoke", "batch", "stream")]
+
+
+######################
+#  가짜 모델
+######################
+
+def _tokens(text: str) -> list[str]:
+    return re.findall(r"\w+", unicodedata.normalize("NFKC", text).lower())
+
+
+class HashEmbeddings(Embeddings):
+    """문자 bigram 해싱 임베딩 (같은 입력이면 프로세스가 달라도 같은 벡터)
+
+    글자가 겹치는 문장끼리 코사인 유사도가 높아지므로 검색 결과도 그럴듯하게 나옵니다.
+
+    Args:
+        model: OpenAIEmbeddings 와 같은 생성자 형태를 맞추기 위한 인자 (사용하지 않음)
+        size: 벡터 차원
+        latency: 호출 1회당 모의 지연(초)
+    """
+
+    def __init__(self, model: str = "hash", size: int = 256, latency: float = 0.0, **kwargs):
+        self.model = model
+        self.size = size
+        self.latency = latency
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in _tokens(text):
+            padded = f" {token} "
+            for i in range(len(padded) - 1):
+                digest = hashlib.md5(padded[i : i + 2].encode("utf-8")).digest()
+                index = int.from_bytes(digest[:4], "little") % self.size
+                vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = float(np.linalg.norm(vector))
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """입력 프롬프트의 단어로 정해진 길이의 답변을 만드는 가짜 채팅 모델
+
+    첫 토큰까지 first_token_latency, 이후 토큰마다 token_latency 만큼 기다려
+    실제 모델의 스트리밍 지연을 흉내 냅니다. ChatOpenAI 의 생성자 인자는 무시합니다.
+    """
+
+    model: str = "fake"
+    temperature: float | None = None
+    top_p: float | None = None
+    answer_tokens: int = 50
+    first_token_latency: float = 0.3
+    token_latency: float = 0.01
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _answer(self, messages: list[BaseMessage]) -> tuple[list[str], int]:
+        words = _tokens(" ".join(str(message.content) for message in messages)) or ["답변"]
+        start = int(hashlib.md5(" ".join(words).encode("utf-8")).hexdigest(), 16) % len(words)
+        pieces = [words[(start + i) % len(words)] + " " for i in range(self.answer_tokens)]
+        return pieces, len(words)
+
+    def _usage(self, input_tokens: int, output_tokens: int) -> dict:
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        pieces, input_tokens = self._answer(messages)
+        time.sleep(self.first_token_latency + self.token_latency * (len(pieces) - 1))
+        message = AIMessage(content="".join(pieces), usage_metadata=self._usage(input_tokens, len(pieces)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        pieces, input_tokens = self._answer(messages)
+        await asyncio.sleep(self.first_token_latency + self.token_latency * (len(pieces) - 1))
+        message = AIMessage(content="".join(pieces), usage_metadata=self._usage(input_tokens, len(pieces)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        pieces, input_tokens = self._answer(messages)
+        for i, piece in enumerate(pieces):
+            time.sleep(self.first_token_latency if i == 0 else self.token_latency)
+            usage = self._usage(input_tokens, len(pieces)) if i == len(pieces) - 1 else None
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        pieces, input_tokens = self._answer(messages)
+        for i, piece in enumerate(pieces):
+            await asyncio.sleep(self.first_token_latency if i == 0 else self.token_latency)
+            usage = self._usage(input_tokens, len(pieces)) if i == len(pieces) - 1 else None
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+
+######################
+#  테스트 환경 구성
+######################
+
+def load_documents(path: str = DOCS_PATH) -> list[Document]:
+    """korean_docs_final.jsonl 로드 (각 줄이 Document JSON을 다시 문자열로 감싼 형태)"""
+    docs = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = json.loads(record)
+            docs.append(Document(page_content=record["page_content"], metadata=record.get("metadata") or {}))
+    return docs
+
+
+def seed_collection(engine, embeddings: Embeddings, docs: list[Document]) -> int:
+    """엔진이 열 컬렉션 위치에 문서를 적재하고 문서 수를 반환"""
+    from langchain_chroma import Chroma
+
+    from app.rag import shared_chroma
+
+    chroma_db = Chroma(
+        # 엔진과 같은 클라이언트로 적재 (다른 클라이언트가 이미 올린 색인에는 새 문서가 보이지 않음)
+        client=shared_chroma(engine.persist_directory, engine.dedicated_client).client,
+        collection_name=engine.collection_name,
+        embedding_function=embeddings,
+        persist_directory=engine.persist_directory,
+        collection_metadata={"hnsw:space": "cosine"},
+    )
+    chroma_db.add_documents(docs)
+    return chroma_db._collection.count()
+
+
+def patch_models(args) -> None:
+    """app.rag / app.server 가 import 하기 전에 OpenAI 모델을 가짜 모델로 교체"""
+    import langchain_openai
+
+    langchain_openai.ChatOpenAI = functools.partial(
+        FakeChatModel,
+        answer_tokens=args.answer_tokens,
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+    )
+    langchain_openai.OpenAIEmbeddings = functools.partial(HashEmbeddings, latency=args.embedding_latency)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServerThread:
+    """uvicorn 서버를 별도 스레드(별도 이벤트 루프)에서 실행"""
+
+    def __init__(self, app, port: int):
+        import uvicorn
+
+        config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.url = f"http://127.0.0.1:{port}"
+
+    def start(self, timeout: float = 60.0):
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("부하 테스트용 서버를 시작하지 못했습니다.")
+            time.sleep(0.05)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=30)
+
+
+######################
+#  부하 생성 / 집계
+######################
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    array = np.asarray(values)
+    p50, p95, p99 = np.percentile(array, [50, 95, 99])
+    return {
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "mean": float(array.mean()),
+        "max": float(array.max()),
+    }
+
+
+async def send(client, endpoint: str, mode: str, questions: list[str]) -> float | None:
+    """요청 1건 전송 - 스트리밍이면 첫 data 이벤트까지의 시간을 반환 (실패 시 예외)"""
+    if mode == "invoke":
+        response = await client.post(f"/{endpoint}/invoke", json={"input": questions[0]})
+        response.raise_for_status()
+        return None
+    if mode == "batch":
+        response = await client.post(f"/{endpoint}/batch", json={"inputs": questions})
+        response.raise_for_status()
+        return None
+
+    t0 = time.perf_counter()
+    first_event = None
+    async with client.stream("POST", f"/{endpoint}/stream", json={"input": questions[0]}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.startswith("event: error"):
+                raise RuntimeError("스트림 오류 이벤트")
+            if first_event is None and line.startswith("event: data"):
+                first_event = time.perf_counter() - t0
+    return first_event
+
+
+async def run_scenario(
+    client,
+    endpoint: str,
+    mode: str,
+    questions: list[str],
+    requests: int,
+    concurrency: int,
+    batch_size: int,
+    warmup: int,
+) -> dict:
+    """concurrency 개의 작업자가 requests 건을 나눠 보내고 지연 시간을 집계"""
+    per_request = batch_size if mode == "batch" else 1
+
+    def payload(i: int) -> list[str]:
+        return [questions[(i * per_request + j) % len(questions)] for j in range(per_request)]
+
+    for i in range(warmup):
+        try:
+            await send(client, endpoint, mode, payload(i))
+        except Exception:
+            pass
+
+    latencies, first_tokens, errors = [], [], {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < requests:
+            i = next_index
+            next_index += 1
+            t0 = time.perf_counter()
+            try:
+                first = await send(client, endpoint, mode, payload(i))
+            except Exception as e:
+                name = type(e).__name__
+                errors[name] = errors.get(name, 0) + 1
+                continue
+            latencies.append(time.perf_counter() - t0)
+            if first is not None:
+                first_tokens.append(first)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+
+    completed = len(latencies)
+    return {
+        "endpoint": endpoint,
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": requests,
+        "completed": completed,
+        "error_rate": (requests - completed) / requests if requests else 0.0,
+        "errors": errors,
+        "elapsed": elapsed,
+        "requests_per_second": completed / elapsed if elapsed else 0.0,
+        "items_per_second": completed * per_request / elapsed if elapsed else 0.0,
+        "latency": percentiles(latencies),
+        "first_event": percentiles(first_tokens) if mode == "stream" else None,
+    }
+
+
+def git_revision() -> dict:
+    def git(*argv) -> str | None:
+        try:
+            return subprocess.run(["git", *argv], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(status) if status is not None else None}
+
+
+async def run_all(url: str, args, questions: list[str]) -> list[dict]:
+    import httpx
+
+    limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+    results = []
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        for concurrency in args.concurrency:
+            for endpoint, mode in SCENARIOS:
+                if endpoint not in args.endpoints or mode not in args.modes:
+                    continue
+                result = await run_scenario(
+                    client, endpoint, mode, questions,
+                    requests=args.requests,
+                    concurrency=concurrency,
+                    batch_size=args.batch_size,
+                    warmup=args.warmup,
+                )
+                print(format_row(result), flush=True)
+                results.append(result)
+    return results
+
+
+def _ms(value: float | None) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}"
+
+
+def format_header() -> str:
+    return (
+        f"{'시나리오':<16}{'동시':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}"
+        f"{'첫이벤트p95':>12}{'req/s':>9}{'item/s':>9}{'오류율':>8}"
+    )
+
+
+def format_row(result: dict) -> str:
+    latency = result["latency"]
+    first = result["first_event"] or {}
+    return (
+        f"{result['endpoint'] + '/' + result['mode']:<16}{result['concurrency']:>6}"
+        f"{_ms(latency['p50']):>10}{_ms(latency['p95']):>10}{_ms(latency['p99']):>10}"
+        f"{_ms(first.get('p95')):>12}{result['requests_per_second']:>9.1f}"
+        f"{result['items_per_second']:>9.1f}{result['error_rate']:>8.1%}"
+    )
+
+
+def compare(previous: dict, current: dict):
+    """이전 결과 파일과 같은 시나리오의 p95 지연 시간과 처리량 변화를 출력"""
+    key = lambda r: (r["endpoint"], r["mode"], r["concurrency"])  # noqa: E731
+    before = {key(r): r for r in previous["results"]}
+    print(f"\n비교 기준: {previous['meta'].get('git', {}).get('commit')}")
+    print(f"{'시나리오':<16}{'동시':>6}{'p95 변화':>12}{'req/s 변화':>12}{'오류율':>16}")
+    for result in current["results"]:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        p95_old, p95_new = old["latency"]["p95"], result["latency"]["p95"]
+        rps_old, rps_new = old["requests_per_second"], result["requests_per_second"]
+        p95_delta = (p95_new / p95_old - 1) if p95_old and p95_new else math.nan
+        rps_delta = (rps_new / rps_old - 1) if rps_old else math.nan
+        print(
+            f"{result['endpoint'] + '/' + result['mode']:<16}{result['concurrency']:>6}"
+            f"{p95_delta:>+12.1%}{rps_delta:>+12.1%}"
+            f"{old['error_rate']:>8.1%}→{result['error_rate']:<7.1%}"
+        )
+
+
+def main(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="rag-loadtest-")
+
+    # app.rag 가 import 시점에 읽는 설정 (.env 보다 우선)
+    os.environ["CHROMA_PERSIST_DIR"] = os.path.join(workdir, "chroma")
+    os.environ["EMBEDDING_CACHE_DIR"] = os.path.join(workdir, "embeddings")
+    os.environ["ANSWER_CACHE"] = "1" if args.answer_cache else "0"
+    os.environ["RAG_WARMUP"] = "1"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-offline-loadtest")
+    os.makedirs(os.environ["CHROMA_PERSIST_DIR"], exist_ok=True)
+
+    patch_models(args)
+    from app.server import app
+    from app.rag import engine
+
+    docs = load_documents(args.docs)
+    seeded = seed_collection(engine, HashEmbeddings(), docs)
+    print(f"임시 컬렉션 '{engine.collection_name}'에 문서 {seeded}개 적재 ({workdir})")
+
+    questions = QUESTIONS
+    if args.questions:
+        from app.hybrid import load_questions
+
+        questions, _ = load_questions(args.questions)
+
+    server = ServerThread(app, free_port())
+    server.start()
+    try:
+        print(format_header())
+        results = asyncio.run(run_all(server.url, args, questions))
+    finally:
+        server.stop()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "git": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "documents": seeded,
+            "config": vars(args),
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="app/server.py 오프라인 부하 테스트 (가짜 모델 + 임시 Chroma)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8], help="동시 요청 수 (여러 개 지정 가능)")
+    parser.add_argument("--requests", type=int, default=100, help="시나리오별 측정 요청 수")
+    parser.add_argument("--warmup", type=int, default=2, help="시나리오별 측정 전 요청 수")
+    parser.add_argument("--batch-size", type=int, default=4, help="batch 요청 1건에 담는 질문 수")
+    parser.add_argument("--endpoints", nargs="+", choices=["openai", "rag"], default=["openai", "rag"])
+    parser.add_argument("--modes", nargs="+", choices=["invoke", "batch", "stream"], default=["invoke", "batch", "stream"])
+    parser.add_argument("--questions", default=None, help=".xlsx 테스트셋 또는 한 줄에 한 질문인 텍스트 파일")
+    parser.add_argument("--docs", default=DOCS_PATH, help="임시 컬렉션에 적재할 문서(jsonl)")
+    parser.add_argument("--answer-tokens", type=int, default=50, help="가짜 모델의 답변 토큰 수")
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="가짜 모델의 첫 토큰 지연(초)")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="가짜 모델의 토큰 간 지연(초)")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="가짜 임베딩 호출 지연(초)")
+    parser.add_argument("--answer-cache", action="store_true", help="답변 캐시를 켜고 측정 (기본: 끔)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="요청 타임아웃(초)")
+    parser.add_argument("--output", default="loadtest.json", help="결과를 저장할 JSON 파일")
+    parser.add_argument("--compare", default=None, help="비교할 이전 결과 JSON 파일")
+    parser.add_argument("--keep", action="store_true", help="임시 디렉터리를 지우지 않음")
+    args = parser.parse_args()
+
+    report = main(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"결과 저장: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
@@ -0,0 +1,387 @@
+# app/metrics.py
+"""RAG 서비스 단계별 지연 시간 계측과 Prometheus 지표
+
+체인에 콜백 핸들러(StageMetricsHandler)를 붙여 요청마다
+질의 임베딩 → Chroma 검색 → 프롬프트 구성 → 첫 토큰 → LLM 생성 → 전체 시간을 기록하고,
+/metrics 에서 Prometheus 텍스트 형식으로 내보냅니다. 느린 요청은 표본을 골라 단계별 내역을 로그로 남깁니다.
+
+외부 라이브러리 없이 구간(bucket) 카운터만 갱신하므로 운영 환경에서 켜 두어도 부담이 작습니다.
+"""
+import bisect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+logger = logging.getLogger(__name__)
+
+# 계측 사용 여부 (RAG_METRICS=0 이면 콜백을 붙이지 않음)
+METRICS_ENABLED = os.getenv("RAG_METRICS", "1") != "0"
+
+# 느린 요청 로그 기준(초)과 표본 비율
+SLOW_REQUEST_SECONDS = float(os.getenv("RAG_SLOW_REQUEST_SECONDS", "3.0"))
+SLOW_REQUEST_SAMPLE_RATE = float(os.getenv("RAG_SLOW_REQUEST_SAMPLE_RATE", "0.1"))
+
+# 지연 시간 히스토그램 구간(초)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 실행 이름 → 단계 이름
+STAGES = {
+    "EmbedQuery": "embedding",
+    "VectorSearch": "search",
+    "Retriever": "retrieval",
+    "Rerank": "rerank",
+    "format_docs": "prompt",
+    "ChatPromptTemplate": "prompt",
+}
+
+# 끝나지 않은 요청(클라이언트 연결 끊김 등) 기록을 정리하는 기준
+MAX_OPEN_TRACES = 1000
+TRACE_EXPIRE_SECONDS = 600.0
+
+
+######################
+#  Prometheus 지표
+######################
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """레이블별 누적 카운터"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values.items()]
+
+
+class Histogram:
+    """레이블별 고정 구간 히스토그램 (구간별 개수 + 합계)"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values: dict[tuple, list] = {}  # labels → [구간별 개수..., +Inf 개수, 합계]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[index] += 1
+            row[-1] += value
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = {key: list(row) for key, row in self._values.items()}
+        lines = []
+        for key, row in values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), row[:-1]):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(row[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    """수집 시점에 함수를 호출해 값을 읽는 지표 (캐시 통계처럼 다른 객체가 관리하는 값)"""
+
+    def __init__(self, name: str, kind: str, help: str, labelnames: tuple[str, ...], collect: Callable[[], dict]):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = labelnames
+        self.collect = collect
+
+    def samples(self) -> list[str]:
+        try:
+            values = self.collect()
+        except Exception as e:
+            logger.debug(f"지표 수집 실패 ({self.name}): {e}")
+            return []
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values.items()]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_callback(
+        self, name: str, kind: str, help: str, labelnames: tuple[str, ...], collect: Callable[[], dict]
+    ) -> CallbackMetric:
+        """collect()는 {레이블 값 튜플: 값} 을 반환"""
+        metric = CallbackMetric(name, kind, help, labelnames, collect)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus 텍스트 형식 (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            samples = metric.samples()
+            if not samples:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "rag_stage_seconds", "요청 단계별 소요 시간(초)", ("route", "stage")
+)
+REQUESTS = registry.counter(
+    "rag_requests_total", "처리한 체인 실행 수", ("route", "status")
+)
+TOKENS = registry.counter(
+    "rag_llm_tokens_total", "LLM 입력/출력 토큰 수", ("route", "kind")
+)
+SLOW_REQUESTS = registry.counter(
+    "rag_slow_requests_total", "느린 요청 기준을 넘은 실행 수", ("route",)
+)
+
+
+######################
+#  단계별 계측 콜백
+######################
+
+@dataclass
+class Trace:
+    """체인 실행(요청) 1건의 단계별 기록"""
+
+    route: str
+    start: float
+    stages: dict = field(default_factory=dict)
+    first_token: float | None = None
+    streamed_tokens: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+class StageMetricsHandler(BaseCallbackHandler):
+    """체인 실행 이벤트로 단계별 소요 시간, 첫 토큰 시간, 토큰 수를 기록하는 콜백
+
+    이 콜백이 처음 보는 실행(최상위 실행 또는 다른 체인 안에서 호출된 계측 대상 체인)을 요청 1건으로 보고,
+    하위 실행은 이름으로 단계를 구분합니다.
+    (EmbedQuery → embedding, VectorSearch → search, Rerank → rerank, format_docs/ChatPromptTemplate → prompt,
+    채팅 모델 → llm, 첫 스트리밍 토큰까지 → ttft, 최상위 실행 → total)
+    ttft는 스트리밍 요청에서만 기록됩니다.
+
+    Args:
+        route: 지표 레이블로 쓸 경로 이름 (예: "rag", "openai")
+    """
+
+    # 비동기 체인에서도 스레드 풀로 넘기지 않고 이벤트 루프에서 바로 실행
+    run_inline = True
+
+    def __init__(
+        self,
+        route: str,
+        slow_seconds: float = SLOW_REQUEST_SECONDS,
+        sample_rate: float = SLOW_REQUEST_SAMPLE_RATE,
+    ):
+        self.route = route
+        self.slow_seconds = slow_seconds
+        self.sample_rate = sample_rate
+        self._runs: dict[UUID, tuple[UUID, str | None, float]] = {}  # run_id → (root_id, stage, start)
+        self._traces: dict[UUID, Trace] = {}
+        self._lock = threading.Lock()
+        self._skipped_slow = 0
+
+    # --- 실행 시작/종료 공통 처리 ---
+
+    def _start(self, run_id: UUID, parent_run_id: UUID | None, stage: str | None):
+        now = time.perf_counter()
+        with self._lock:
+            parent = self._runs.get(parent_run_id) if parent_run_id is not None else None
+            if parent is None:
+                # 최상위 실행 또는 다른 체인 안에서 호출된 계측 대상 체인 (예: 컬렉션 라우터가 고른 체인)
+                if len(self._traces) >= MAX_OPEN_TRACES:
+                    self._expire(now)
+                self._traces[run_id] = Trace(self.route, now)
+                root_id = run_id
+            else:
+                root_id = parent[0]
+            self._runs[run_id] = (root_id, stage, now)
+
+    def _end(self, run_id: UUID, error: bool = False):
+        now = time.perf_counter()
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+            if run is None:
+                return
+            root_id, stage, start = run
+            trace = self._traces.get(root_id)
+            if trace is None:
+                return
+            if stage is not None:
+                trace.stages[stage] = trace.stages.get(stage, 0.0) + (now - start)
+            if root_id != run_id:
+                return
+            del self._traces[root_id]
+        self._finish(trace, now - trace.start, error)
+
+    def _expire(self, now: float):
+        expired = {root for root, trace in self._traces.items() if now - trace.start > TRACE_EXPIRE_SECONDS}
+        for root in expired:
+            del self._traces[root]
+        for run_id in [run_id for run_id, run in self._runs.items() if run[0] in expired]:
+            del self._runs[run_id]
+
+    def _trace(self, run_id: UUID) -> Trace | None:
+        run = self._runs.get(run_id)
+        return self._traces.get(run[0]) if run else None
+
+    def _finish(self, trace: Trace, total: float, error: bool):
+        STAGE_SECONDS.observe(total, trace.route, "total")
+        for stage, seconds in trace.stages.items():
+            STAGE_SECONDS.observe(seconds, trace.route, stage)
+        if trace.first_token is not None:
+            STAGE_SECONDS.observe(trace.first_token - trace.start, trace.route, "ttft")
+        REQUESTS.inc(1, trace.route, "error" if error else "ok")
+        if trace.input_tokens:
+            TOKENS.inc(trace.input_tokens, trace.route, "input")
+        if trace.output_tokens:
+            TOKENS.inc(trace.output_tokens, trace.route, "output")
+
+        if total >= self.slow_seconds:
+            SLOW_REQUESTS.inc(1, trace.route)
+            if random.random() < self.sample_rate:
+                self._log_slow(trace, total, error)
+            else:
+                self._skipped_slow += 1
+
+    def _log_slow(self, trace: Trace, total: float, error: bool):
+        breakdown = {stage: round(seconds, 4) for stage, seconds in trace.stages.items()}
+        if trace.first_token is not None:
+            breakdown["ttft"] = round(trace.first_token - trace.start, 4)
+        record = {
+            "route": trace.route,
+            "total": round(total, 4),
+            "stages": breakdown,
+            "input_tokens": trace.input_tokens,
+            "output_tokens": trace.output_tokens,
+            "error": error,
+            "skipped_since_last": self._skipped_slow,
+        }
+        self._skipped_slow = 0
+        logger.warning(f"느린 요청: {json.dumps(record, ensure_ascii=False)}")
+
+    # --- 체인 / 검색기 ---
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs: Any):
+        self._start(run_id, parent_run_id, STAGES.get(kwargs.get("name")))
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs: Any):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs: Any):
+        self._end(run_id, error=True)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs: Any):
+        # 벡터 검색을 직접 나누지 않는 검색기(hybrid 등)는 검색기 전체를 search 단계로 기록
+        self._start(run_id, parent_run_id, "search")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs: Any):
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs: Any):
+        self._end(run_id, error=True)
+
+    # --- LLM ---
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs: Any):
+        self._start(run_id, parent_run_id, "llm")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs: Any):
+        self._start(run_id, parent_run_id, "llm")
+
+    def on_llm_new_token(self, token: str, *, run_id, **kwargs: Any):
+        trace = self._trace(run_id)
+        if trace is None:
+            return
+        if trace.first_token is None:
+            trace.first_token = time.perf_counter()
+        trace.streamed_tokens += 1
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs: Any):
+        trace = self._trace(run_id)
+        if trace is not None:
+            usage = None
+            for generations in response.generations:
+                for generation in generations:
+                    usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or usage
+            if usage:
+                trace.input_tokens += usage.get("input_tokens", 0)
+                trace.output_tokens += usage.get("output_tokens", 0)
+            else:
+                # 스트리밍에서 사용량을 받지 못하면 받은 청크 수를 출력 토큰 수로 사용
+                trace.output_tokens += trace.streamed_tokens
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs: Any):
+        self._end(run_id, error=True)
+
+
+def instrument(runnable, route: str):
+    """Runnable에 단계별 계측 콜백을 붙여 반환 (RAG_METRICS=0 이면 그대로 반환)"""
+    if not METRICS_ENABLED:
+        return runnable
+    return runnable.with_config(callbacks=[StageMetricsHandler(route)])
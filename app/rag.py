@@ -1,44 +1,546 @@
 # app/rag.py
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
 from dotenv import load_dotenv
 
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.documents import Document
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda, RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
 from langchain_core.prompts import ChatPromptTemplate
 
+from app.context import PackedContext, context_packer_from_env
+from app.embedding_cache import EMBEDDING_CACHE_DIR, CachedEmbeddings, query_vector_from
+from app.history import count_tokens
+from app.hybrid import HybridRetriever, build_hybrid_retriever, index_path_for
+from app.rerank import reranker_from_env, with_rerank
+
 # 환경변수 로드
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# 프로세스 시작 시각 (콜드 스타트 측정 기준)
+PROCESS_START = time.perf_counter()
+
+# 벡터 저장소 위치 (환경변수로 변경 가능)
+CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
+
+# 검색 방식 (mmr | hybrid)
+RAG_SEARCH_TYPE = os.getenv("RAG_SEARCH_TYPE", "mmr")
+
+# 질의 임베딩 캐시 사용 여부 (EMBEDDING_CACHE=0 이면 사용하지 않음)
+USE_EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "1") != "0"
+
+# hybrid 검색기의 BM25 색인이 컬렉션 변경(실행 중 적재 등)을 확인하는 간격(초) - 0이면 엔진 생성 때만 동기화
+HYBRID_REFRESH_INTERVAL = float(os.getenv("HYBRID_REFRESH_INTERVAL", "30"))
+
+# 공유 Chroma 클라이언트를 닫기 전에 진행 중인 조회가 끝나길 기다리는 최대 시간(초)
+CHROMA_RECYCLE_TIMEOUT = float(os.getenv("CHROMA_RECYCLE_TIMEOUT", "5"))
+
+# 색인을 올릴 때 벡터 하나당 벡터 값 외에 추가로 차지하는 대략적인 크기 (HNSW 이웃 링크, 레코드 캐시 등)
+# 실측: 256차원 벡터 2만 개 컬렉션 하나를 조회하면 RSS 가 약 31MB 늘어남 → 벡터당 약 1.5KB
+HNSW_OVERHEAD_BYTES = 512
+
 
 ######################
-#  RAG 체인 구성
+#  공유 자원 (임베딩 클라이언트, Chroma 클라이언트)
 ######################
 
-# OpenAI 임베딩 모델 생성
-embeddings_openai = OpenAIEmbeddings(
-    model="text-embedding-3-small",  # 사용할 모델 이름
-)
+_shared = {}
+_shared_lock = threading.Lock()
 
-# 저장된 벡터 저장소를 가져오기
-chroma_db = Chroma(
-    collection_name="labor_law",
-    embedding_function=embeddings_openai,
-    persist_directory="./chroma_db",
-)
 
-print("Chroma DB loaded")
-print(chroma_db._collection.count())  # 벡터 저장소에 있는 문서 수 출력
-
-# 검색기 초기화å
-retriever = chroma_db.as_retriever(
-    search_type="mmr",
-    search_kwargs={
-        "k": 5,  # 검색할 문서의 수
-        "fetch_k": 10,  # mmr 알고리즘에 전달할 문서의 수 (fetch_k > k)
-        "lambda_mult": 0.3,  # 다양성을 고려하는 정도 (1은 최소 다양성, 0은 최대 다양성을 의미. 기본값은 0.5)
-    },
-)
+def _shared_resource(key: tuple, factory):
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = factory()
+        return _shared[key]
+
+
+def shared_embeddings(model: str, cache_dir: str | None = EMBEDDING_CACHE_DIR) -> Embeddings:
+    """모델별로 하나만 만드는 임베딩 클라이언트 (여러 컬렉션이 HTTP 연결과 캐시를 공유)"""
+
+    def create():
+        embeddings = OpenAIEmbeddings(model=model)
+        if USE_EMBEDDING_CACHE:
+            # 앞단에 메모리/디스크 캐시
+            embeddings = CachedEmbeddings(embeddings, model_name=model, cache_dir=cache_dir)
+        return embeddings
+
+    return _shared_resource(("embeddings", model, cache_dir), create)
+
+
+class SharedChromaClient:
+    """저장소 경로별로 하나만 여는 Chroma 클라이언트
+
+    Chroma 로컬(Rust) 백엔드는 한 번 조회한 컬렉션의 HNSW 색인을 클라이언트를 닫을 때까지 메모리에 두고,
+    세그먼트 캐시 설정(chroma_segment_cache_policy / chroma_memory_limit_bytes)도 적용하지 않습니다.
+    그래서 색인 메모리를 돌려받으려면 recycle()로 클라이언트를 닫아야 하며,
+    엔진은 generation이 바뀐 것을 보고 다음 사용 때 새 클라이언트로 다시 연결합니다.
+    """
+
+    def __init__(self, persist_directory: str):
+        self.persist_directory = persist_directory
+        self.generation = 0
+        self._client = None
+        self._readers = 0
+        self._cond = threading.Condition()
+
+    @property
+    def client(self):
+        with self._cond:
+            if self._client is None:
+                import chromadb
+
+                self._client = chromadb.PersistentClient(path=self.persist_directory)
+            return self._client
+
+    @contextmanager
+    def reading(self):
+        """블록 안에서는 클라이언트를 닫지 않음 (기다리지 않으므로 이벤트 루프에서 await 를 사이에 둬도 됨)"""
+        with self._cond:
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    def recycle(self, timeout: float = CHROMA_RECYCLE_TIMEOUT) -> bool:
+        """진행 중인 조회가 끝나면 클라이언트를 닫아 열려 있던 색인 메모리를 모두 돌려줌
+
+        timeout 안에 조회가 끝나지 않으면 닫지 않고 False 를 반환합니다.
+        """
+        with self._cond:
+            if self._client is None:
+                return True
+            if not self._cond.wait_for(lambda: self._readers == 0, timeout):
+                return False
+            if self._client is None:
+                # 기다리는 동안 다른 스레드가 이미 닫음
+                return True
+            client, self._client = self._client, None
+            self.generation += 1
+            client.close()
+        return True
+
+
+def shared_chroma(persist_directory: str = CHROMA_PERSIST_DIR, dedicated: bool = False) -> SharedChromaClient:
+    """저장소 경로별 공유 Chroma 클라이언트
+
+    같은 경로를 설정이 다른 클라이언트로 두 번 열 수 없으므로, 프로세스 안에서는 모두 이 함수를 거칩니다.
+    dedicated=True 이면 같은 저장소를 별도 클라이언트로 엽니다 (기본 엔진 전용 - 레지스트리가 공유 클라이언트를
+    닫아도 기본 컬렉션의 색인은 유지됨). Chroma 는 경로 문자열로 클라이언트를 구분하므로 끝에 구분자를 붙여 엽니다.
+    """
+    path = os.path.abspath(persist_directory)
+    client_path = os.path.join(path, "") if dedicated else path
+    return _shared_resource(("chroma", path, dedicated), lambda: SharedChromaClient(client_path))
+
+
+def chroma_client(persist_directory: str = CHROMA_PERSIST_DIR):
+    return shared_chroma(persist_directory).client
+
+
+def reset_shared():
+    """공유 자원을 모두 버림 (fork 직후 자식 프로세스에서 호출)"""
+    _shared.clear()
+
+
+######################
+#  RAG 엔진 (지연 초기화)
+######################
+
+class RagEngine:
+    """임베딩 모델, Chroma 벡터 저장소, 검색기를 지연 생성하는 RAG 엔진
+
+    import 시점에는 아무 것도 만들지 않고, warmup()이 호출되거나 처음 검색할 때
+    한 번만 생성합니다. FastAPI 서버와 Gradio 앱이 같은 엔진을 공유합니다.
+    """
+
+    def __init__(
+        self,
+        collection_name: str = "labor_law",
+        persist_directory: str = CHROMA_PERSIST_DIR,
+        embedding_model: str = "text-embedding-3-small",
+        search_type: str = "mmr",
+        search_kwargs: dict | None = None,
+        embedding_cache_dir: str | None = EMBEDDING_CACHE_DIR,
+        dedicated_client: bool = False,
+    ):
+        self.collection_name = collection_name
+        self.persist_directory = persist_directory
+        self.embedding_model = embedding_model
+        self.search_type = search_type
+        self.embedding_cache_dir = embedding_cache_dir
+        self.dedicated_client = dedicated_client  # 공유 Chroma 클라이언트 대신 전용 클라이언트 사용
+        if search_kwargs is None and search_type == "hybrid":
+            search_kwargs = {
+                "k": 5,  # 검색할 문서의 수
+                "fetch_k": 20,  # 벡터 검색과 BM25 각각에서 가져올 후보 수
+                "fusion": "rrf",  # 점수 결합 방식 (rrf | weighted)
+            }
+        self.search_kwargs = search_kwargs or {
+            "k": 5,  # 검색할 문서의 수
+            "fetch_k": 10,  # mmr 알고리즘에 전달할 문서의 수 (fetch_k > k)
+            "lambda_mult": 0.3,  # 다양성을 고려하는 정도 (1은 최소 다양성, 0은 최대 다양성을 의미. 기본값은 0.5)
+        }
+        self.reset()
+
+    def reset(self):
+        """생성된 객체를 모두 버리고 초기 상태로 되돌림 (fork 직후 자식 프로세스에서 호출)"""
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._embeddings = None
+        self._chroma_db = None
+        self._retriever = None
+        self._shared = None
+        self._generation = None  # 검색기를 만들 때 쓴 공유 Chroma 클라이언트 세대
+        self._queried_generation = None  # 마지막으로 색인을 조회한 클라이언트 세대
+        self._refresh_lock = threading.Lock()  # BM25 색인 갱신은 한 번에 하나만
+        self._index_checked_at = time.monotonic()
+        self._index_fingerprint = None  # BM25 색인을 마지막으로 동기화한 시점의 컬렉션 fingerprint
+        self.document_count = None
+        self.memory_bytes = 0
+        self.timings = {}
+        self.error = None
+        self.first_request_seconds = None
+
+    @property
+    def ready(self) -> bool:
+        """검색기가 생성되어 요청을 처리할 수 있는지 여부 (공유 클라이언트가 다시 열려 재연결이 남아 있으면 False)"""
+        return (
+            self._retriever is not None
+            and self._pid == os.getpid()
+            and self._shared.generation == self._generation
+        )
+
+    def _build(self):
+        """임베딩 모델 → 벡터 저장소 → 검색기 순서로 생성하고 단계별 소요 시간을 기록"""
+        if not os.path.isdir(self.persist_directory):
+            raise FileNotFoundError(f"벡터 저장소 경로를 찾을 수 없습니다: {self.persist_directory}")
+
+        timings = {}
+
+        # OpenAI 임베딩 모델 (같은 모델을 쓰는 엔진끼리 공유)
+        t0 = time.perf_counter()
+        embeddings = shared_embeddings(self.embedding_model, self.embedding_cache_dir)
+        timings["embeddings"] = time.perf_counter() - t0
+
+        shared = shared_chroma(self.persist_directory, self.dedicated_client)
+        with shared.reading():
+            # 저장된 벡터 저장소를 가져오기 (같은 경로의 엔진끼리 Chroma 클라이언트 공유)
+            t0 = time.perf_counter()
+            generation = shared.generation
+            chroma_db = Chroma(
+                client=shared.client,
+                collection_name=self.collection_name,
+                embedding_function=embeddings,
+                persist_directory=self.persist_directory,
+            )
+            timings["chroma"] = time.perf_counter() - t0
+
+            # 벡터 저장소에 있는 문서 수 확인
+            t0 = time.perf_counter()
+            document_count = chroma_db._collection.count()
+            timings["count"] = time.perf_counter() - t0
+            if document_count == 0:
+                logger.warning(f"컬렉션 '{self.collection_name}'에 문서가 없습니다.")
+
+            # 검색기 초기화
+            t0 = time.perf_counter()
+            if self.search_type == "hybrid":
+                # BM25 역색인(저장본)을 컬렉션과 동기화한 뒤 벡터 검색과 결합
+                index_fingerprint = self._fingerprint_of(chroma_db)
+                retriever = build_hybrid_retriever(
+                    chroma_db,
+                    index_path_for(self.persist_directory, self.collection_name),
+                    **self.search_kwargs,
+                )
+            else:
+                retriever = chroma_db.as_retriever(
+                    search_type=self.search_type,
+                    search_kwargs=self.search_kwargs,
+                )
+            timings["retriever"] = time.perf_counter() - t0
+            memory_bytes = self._estimate_memory(chroma_db, document_count)
+
+        self._embeddings = embeddings
+        self._chroma_db = chroma_db
+        self._shared = shared
+        self._generation = generation
+        if self.search_type == "hybrid":
+            self._index_fingerprint = index_fingerprint
+        self.document_count = document_count
+        self.memory_bytes = memory_bytes
+        self.timings.update(timings)
+        self._retriever = retriever
+
+    def _estimate_memory(self, chroma_db: Chroma, document_count: int) -> int:
+        """컬렉션을 열어 두는 데 드는 대략적인 메모리 (HNSW 벡터 + BM25 색인 파일 크기)"""
+        if not document_count:
+            return 0
+        sample = chroma_db._collection.get(limit=1, include=["embeddings"])["embeddings"]
+        dimension = len(sample[0]) if sample is not None and len(sample) else 0
+        size = document_count * (dimension * 4 + HNSW_OVERHEAD_BYTES)
+        if self.search_type == "hybrid":
+            index_path = index_path_for(self.persist_directory, self.collection_name)
+            if os.path.exists(index_path):
+                size += os.path.getsize(index_path)
+        return size
+
+    def load(self):
+        """검색기를 반환 (필요하면 생성)"""
+        if self._pid != os.getpid():
+            # fork된 자식 프로세스에서는 부모의 SQLite/HTTP 연결을 재사용하지 않음
+            self.reset()
+        if self._retriever is None or self._shared.generation != self._generation:
+            # 처음 사용하거나, 공유 Chroma 클라이언트가 닫혔다 다시 열렸으면 새 클라이언트로 다시 연결
+            with self._lock:
+                if self._retriever is None or self._shared.generation != self._generation:
+                    try:
+                        self._build()
+                        self.error = None
+                    except Exception as e:
+                        self.error = str(e)
+                        raise
+        return self._retriever
+
+    def warmup(self, probe: bool = False) -> float:
+        """엔진을 미리 생성하고 소요 시간(초)을 반환
+
+        probe=True이면 임베딩 API를 한 번 호출하여 HTTP 연결까지 미리 맺어 둡니다.
+        """
+        t0 = time.perf_counter()
+        self.load()
+        if probe:
+            t1 = time.perf_counter()
+            self._embeddings.embed_query("warmup")
+            self.timings["probe"] = time.perf_counter() - t1
+        elapsed = time.perf_counter() - t0
+        self.timings["warmup"] = elapsed
+        logger.info(
+            f"RAG 엔진 준비 완료: collection={self.collection_name}, "
+            f"documents={self.document_count}, {elapsed:.3f}s"
+        )
+        return elapsed
+
+    @property
+    def embeddings(self):
+        self.load()
+        return self._embeddings
+
+    @property
+    def chroma_db(self):
+        self.load()
+        return self._chroma_db
+
+    @property
+    def retriever(self):
+        retriever = self.load()
+        self._maybe_refresh_index()
+        return retriever
+
+    def _maybe_refresh_index(self):
+        """HYBRID_REFRESH_INTERVAL 마다 컬렉션이 바뀌었는지 백그라운드에서 확인하고 BM25 색인에 반영
+
+        확인(문서 수 조회)과 동기화(토큰화)는 별도 스레드에서 하므로 요청은 기다리지 않고 기존 색인으로 검색합니다.
+        """
+        if self.search_type != "hybrid" or HYBRID_REFRESH_INTERVAL <= 0:
+            return
+        if time.monotonic() - self._index_checked_at < HYBRID_REFRESH_INTERVAL:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        self._index_checked_at = time.monotonic()
+        threading.Thread(target=self._refresh_index, name=f"bm25-refresh-{self.collection_name}", daemon=True).start()
+
+    def _refresh_index(self):
+        try:
+            with self.reading():
+                retriever = self.load()
+                fingerprint = self._fingerprint_of(self._chroma_db)
+                if fingerprint == self._index_fingerprint:
+                    return
+                added, removed, updated = retriever.refresh(
+                    index_path_for(self.persist_directory, self.collection_name)
+                )
+                self._index_fingerprint = fingerprint
+            if added or removed or updated:
+                logger.info(
+                    f"BM25 색인 갱신: collection={self.collection_name}, "
+                    f"added={added}, removed={removed}, updated={updated}"
+                )
+        except Exception as e:
+            logger.warning(f"BM25 색인 갱신 실패 (collection={self.collection_name}): {e}")
+        finally:
+            self._refresh_lock.release()
+
+    @contextmanager
+    def reading(self):
+        """Chroma 를 쓰는 동안 공유 클라이언트가 닫히지 않도록 잡아 둠"""
+        with shared_chroma(self.persist_directory, self.dedicated_client).reading():
+            yield
+
+    @property
+    def resident_bytes(self) -> int:
+        """지금 Chroma 클라이언트에 올라와 있는 색인의 예상 메모리 (다시 연결한 뒤 아직 조회하지 않았으면 0)"""
+        if self._shared is None or self._queried_generation != self._shared.generation:
+            return 0
+        return self.memory_bytes
+
+    def warm_index(self):
+        """벡터 1개로 검색해 Chroma 가 이 컬렉션의 색인을 미리 올리게 함 (클라이언트를 다시 연 뒤 첫 요청이 느려지지 않도록)"""
+        with self.reading():
+            collection = self.chroma_db._collection
+            sample = collection.get(limit=1, include=["embeddings"])["embeddings"]
+            if sample is not None and len(sample):
+                collection.query(query_embeddings=[sample[0]], n_results=1, include=[])
+                self._queried_generation = self._generation
+
+    def _mark_first_request(self):
+        # 검색하면 Chroma 가 이 컬렉션의 색인을 메모리에 올림
+        self._queried_generation = self._generation
+        if self.first_request_seconds is None:
+            self.first_request_seconds = time.perf_counter() - PROCESS_START
+
+    def _retriever_kwargs(self, retriever, question: str, config: RunnableConfig | None) -> dict:
+        # 답변 캐시가 이미 계산한 질의 임베딩은 하이브리드 검색기의 벡터 검색에 그대로 사용
+        vector = query_vector_from(config, question)
+        if vector is not None and isinstance(retriever, HybridRetriever):
+            return {"query_vector": vector}
+        return {}
+
+    def retrieve(self, question: str, config: RunnableConfig | None = None) -> list[Document]:
+        with self.reading():
+            retriever = self.retriever
+            docs = retriever.invoke(question, config=config, **self._retriever_kwargs(retriever, question, config))
+            self._mark_first_request()
+        return docs
+
+    async def aretrieve(self, question: str, config: RunnableConfig | None = None) -> list[Document]:
+        with self.reading():
+            retriever = self.retriever
+            kwargs = self._retriever_kwargs(retriever, question, config)
+            docs = await retriever.ainvoke(question, config=config, **kwargs)
+            self._mark_first_request()
+        return docs
+
+    def embed_query(self, question: str, config: RunnableConfig | None = None) -> list[float]:
+        vector = query_vector_from(config, question)
+        return vector if vector is not None else self.embeddings.embed_query(question)
+
+    async def aembed_query(self, question: str, config: RunnableConfig | None = None) -> list[float]:
+        vector = query_vector_from(config, question)
+        return vector if vector is not None else await self.embeddings.aembed_query(question)
+
+    def _similarity_kwargs(self) -> dict:
+        # similarity 검색은 mmr 전용 인자(fetch_k, lambda_mult)를 받지 않음
+        return {key: value for key, value in self.search_kwargs.items() if key in ("k", "filter", "where_document")}
+
+    def search_by_vector(self, vector: list[float]) -> list[Document]:
+        """질의 임베딩으로 Chroma 검색 (검색기와 같은 search_kwargs 사용)"""
+        with self.reading():
+            if self.search_type == "mmr":
+                docs = self.chroma_db.max_marginal_relevance_search_by_vector(vector, **self.search_kwargs)
+            else:
+                docs = self.chroma_db.similarity_search_by_vector(vector, **self._similarity_kwargs())
+            self._mark_first_request()
+        return docs
+
+    async def asearch_by_vector(self, vector: list[float]) -> list[Document]:
+        with self.reading():
+            if self.search_type == "mmr":
+                docs = await self.chroma_db.amax_marginal_relevance_search_by_vector(vector, **self.search_kwargs)
+            else:
+                docs = await self.chroma_db.asimilarity_search_by_vector(vector, **self._similarity_kwargs())
+            self._mark_first_request()
+        return docs
+
+    def fingerprint(self) -> tuple:
+        """컬렉션 변경 감지용 값 (문서 수 + SQLite 파일 수정 시각)"""
+        with self.reading():
+            return self._fingerprint_of(self.chroma_db)
+
+    def _fingerprint_of(self, chroma_db: Chroma) -> tuple:
+        # 수정 시각을 먼저 읽어, 읽는 도중에 바뀐 내용은 다음 확인에서 잡히도록 함
+        mtimes = []
+        for name in ("chroma.sqlite3", "chroma.sqlite3-wal"):
+            path = os.path.join(self.persist_directory, name)
+            mtimes.append(os.path.getmtime(path) if os.path.exists(path) else None)
+        return (chroma_db._collection.count(), *mtimes)
+
+    def status(self) -> dict:
+        """준비 상태와 콜드 스타트 관련 측정값"""
+        return {
+            "ready": self.ready,
+            "collection": self.collection_name,
+            "documents": self.document_count,
+            "memory_bytes": self.memory_bytes,
+            "resident_bytes": self.resident_bytes,
+            "timings": self.timings,
+            "first_request_seconds": self.first_request_seconds,
+            "uptime_seconds": time.perf_counter() - PROCESS_START,
+            "error": self.error,
+            "pid": os.getpid(),
+            "embedding_cache": self._embeddings.stats() if isinstance(self._embeddings, CachedEmbeddings) else None,
+        }
+
+    def as_runnable(self) -> Runnable:
+        """체인에 연결할 수 있는 지연 검색기 Runnable
+
+        mmr/similarity 검색은 질의 임베딩(EmbedQuery)과 Chroma 검색(VectorSearch)을
+        별도 단계로 나누어 콜백에서 단계별 소요 시간을 볼 수 있게 합니다.
+        """
+        if self.search_type in ("mmr", "similarity"):
+            return (
+                RunnableLambda(self.embed_query, afunc=self.aembed_query, name="EmbedQuery")
+                | RunnableLambda(self.search_by_vector, afunc=self.asearch_by_vector, name="VectorSearch")
+            ).with_config(run_name="Retriever")
+        return RunnableLambda(self.retrieve, afunc=self.aretrieve, name="Retriever")
+
+
+# Cross-encoder 재정렬 (RAG_RERANK=1 일 때만 사용)
+reranker = reranker_from_env()
+
+
+def create_engine(collection_name: str = "labor_law", **kwargs) -> RagEngine:
+    """서버 기본 설정(검색 방식, 재정렬 후보 수)으로 엔진 생성"""
+    engine = RagEngine(collection_name=collection_name, search_type=RAG_SEARCH_TYPE, **kwargs)
+    if reranker is not None:
+        # 재정렬할 후보를 더 많이 가져오고, 최종 문서 수는 reranker.top_n 으로 맞춤
+        engine.search_kwargs["k"] = reranker.candidates
+        engine.search_kwargs["fetch_k"] = max(engine.search_kwargs.get("fetch_k", 0), reranker.candidates * 2)
+    return engine
+
+
+def build_retriever(engine: RagEngine) -> Runnable:
+    """엔진의 지연 검색기 (재정렬을 켰으면 Rerank 단계 포함)"""
+    retriever = engine.as_runnable()
+    if reranker is not None:
+        retriever = with_rerank(retriever, reranker)
+    return retriever
+
+
+# 서버와 Gradio 앱이 공유하는 기본 엔진
+# (레지스트리가 다른 컬렉션을 내보내며 공유 Chroma 클라이언트를 닫아도 영향을 받지 않도록 전용 클라이언트 사용)
+engine = create_engine(dedicated_client=True)
+
+# fork 방식의 멀티 워커(gunicorn --preload 등)에서도 자식 프로세스가 새로 연결하도록 설정
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_shared)
+    os.register_at_fork(after_in_child=engine.reset)
+
+# 검색기 (첫 호출 시 엔진 생성)
+retriever = build_retriever(engine)
 
 # Prompt 템플릿 생성
 template = """주어진 컨텍스트를 기반으로 질문에 답변하시오.
@@ -75,16 +577,39 @@ llm = ChatOpenAI(
 )
 
 
-# 문서 포맷팅
-def format_docs(docs):
+# 컨텍스트 패킹 (RAG_CONTEXT_PACKING=0 이면 기존처럼 모든 청크를 그대로 연결)
+context_packer = context_packer_from_env()
+
+
+def pack_context(docs: list[Document]) -> PackedContext:
+    """검색 문서를 중복 제거 + 토큰 예산 안의 컨텍스트로 변환 (줄어든 토큰 수 포함)"""
+    if context_packer is None:
+        text = _join_docs(docs)
+        tokens = count_tokens(text) if text else 0
+        return PackedContext(text, tokens, tokens, chunks=len(docs), duplicates=0, trimmed=0)
+    return context_packer.pack(docs)
+
+
+def _join_docs(docs: list[Document]) -> str:
     return "\n\n".join([f"{doc.page_content}" for doc in docs])
 
 
+# 문서 포맷팅 (패킹을 쓰지 않으면 토큰 수를 세지 않고 이어 붙이기만 함)
+def format_docs(docs):
+    if context_packer is None:
+        return _join_docs(docs)
+    return context_packer.pack(docs).text
+
+
 # RAG 체인 생성
+def build_rag_chain(retriever: Runnable) -> Runnable:
+    """검색기 → 컨텍스트 패킹 → 프롬프트 → LLM 체인 (컬렉션별 체인도 같은 프롬프트/LLM 사용)"""
+    return (
+        {"context": retriever | format_docs, "question": RunnablePassthrough()}
+        | prompt
+        | llm
+        | StrOutputParser()
+    )
 
-rag_chain = (
-    {"context": retriever | format_docs, "question": RunnablePassthrough()}
-    | prompt
-    | llm
-    | StrOutputParser()
-)
+
+rag_chain = build_rag_chain(retriever)
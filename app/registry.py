@@ -0,0 +1,267 @@
+# app/registry.py
+"""여러 Chroma 컬렉션을 한 프로세스에서 제공하는 검색기 레지스트리
+
+/rag/{collection} 요청이 처음 들어올 때 컬렉션을 열고(엔진 + RAG 체인 생성),
+최근에 쓴 컬렉션만 최대 RAG_MAX_OPEN_COLLECTIONS 개까지 열어 둡니다.
+RAG_COLLECTION_MEMORY_MB 를 지정하면 열린 컬렉션의 예상 메모리(벡터 + HNSW 링크 + BM25 색인) 합계도
+그 안으로 유지합니다. 임베딩 클라이언트와 Chroma 클라이언트는 모든 컬렉션이 공유합니다.
+
+Chroma 는 컬렉션 하나만 닫는 기능이 없고 한 번 조회한 색인을 클라이언트를 닫을 때까지 메모리에 두므로,
+내보낸 컬렉션의 색인이 RAG_RELEASE_THRESHOLD_MB 넘게 쌓이면 백그라운드에서 진행 중인 조회가 끝나길 기다려
+공유 클라이언트를 닫고, 남은 컬렉션을 새 클라이언트로 다시 연결해 색인을 미리 올립니다.
+
+기본 엔진(labor_law)은 /rag 에서 항상 쓰므로 내보내지 않고(pinned), 전용 Chroma 클라이언트를 써서
+공유 클라이언트를 닫아도 영향을 받지 않습니다.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from langchain_core.runnables import Runnable
+
+from app.metrics import instrument, registry as metrics_registry
+from app.rag import (
+    CHROMA_PERSIST_DIR,
+    RagEngine,
+    build_rag_chain,
+    build_retriever,
+    create_engine,
+    shared_chroma,
+)
+
+logger = logging.getLogger(__name__)
+
+# 동시에 열어 둘 최대 컬렉션 수 (기본 엔진 포함)
+RAG_MAX_OPEN_COLLECTIONS = int(os.getenv("RAG_MAX_OPEN_COLLECTIONS", "4"))
+
+# 열린 컬렉션의 예상 메모리 합계 상한(MB) - 0이면 개수만 제한
+RAG_COLLECTION_MEMORY_MB = float(os.getenv("RAG_COLLECTION_MEMORY_MB", "0"))
+
+# 내보냈지만 아직 Chroma 에 올라와 있는 색인이 이만큼(MB) 넘게 쌓이면 공유 클라이언트를 닫음 (0이면 내보낼 때마다)
+RAG_RELEASE_THRESHOLD_MB = float(os.getenv("RAG_RELEASE_THRESHOLD_MB", "64"))
+
+# Chroma 컬렉션 이름 규칙 (3~512자, 영문/숫자로 시작·끝, 중간에 . _ - 허용)
+_COLLECTION_NAME = re.compile(r"^[a-zA-Z0-9][a-zA-Z0-9._-]{1,510}[a-zA-Z0-9]$")
+
+COLLECTION_EVENTS = metrics_registry.counter(
+    "rag_collection_events_total",
+    "컬렉션 레지스트리 이벤트 (hit | open | evict | release | not_found)",
+    ("event",),
+)
+
+
+class CollectionNotFound(KeyError):
+    """저장소에 없는 컬렉션"""
+
+
+@dataclass
+class OpenCollection:
+    """레지스트리에 열려 있는 컬렉션 1개"""
+
+    engine: RagEngine
+    chain: Runnable
+    opened_at: float
+    pinned: bool = False
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.engine.memory_bytes
+
+    @property
+    def resident_bytes(self) -> int:
+        return self.engine.resident_bytes
+
+
+class CollectionRegistry:
+    """컬렉션 이름 → (엔진, RAG 체인)을 지연 생성하고 LRU 로 내보내는 레지스트리
+
+    Args:
+        persist_directory: 컬렉션이 저장된 Chroma 경로 (모든 컬렉션이 같은 클라이언트 사용)
+        max_open: 동시에 열어 둘 최대 컬렉션 수
+        max_memory_bytes: 열린 컬렉션의 예상 메모리 합계 상한 (0이면 개수만 제한)
+        release_threshold_bytes: 내보낸 컬렉션의 색인이 이만큼 쌓이면 공유 Chroma 클라이언트를 닫음
+        pinned: 내보내지 않을 엔진 (서버 기본 엔진)
+    """
+
+    def __init__(
+        self,
+        persist_directory: str = CHROMA_PERSIST_DIR,
+        max_open: int = RAG_MAX_OPEN_COLLECTIONS,
+        max_memory_bytes: int = int(RAG_COLLECTION_MEMORY_MB * 1024 * 1024),
+        release_threshold_bytes: int = int(RAG_RELEASE_THRESHOLD_MB * 1024 * 1024),
+        pinned: RagEngine | None = None,
+    ):
+        self.persist_directory = persist_directory
+        self.max_open = max(1, max_open)
+        self.max_memory_bytes = max_memory_bytes
+        self.release_threshold_bytes = release_threshold_bytes
+        self._pinned = pinned
+        self.reset()
+
+    def reset(self):
+        """열린 컬렉션을 모두 버림 (fork 직후 자식 프로세스에서 호출)"""
+        self._lock = threading.Lock()
+        self._opening: dict[str, threading.Lock] = {}
+        self._open: OrderedDict[str, OpenCollection] = OrderedDict()
+        self.hits = self.opens = self.evictions = self.releases = 0
+        self._evicted_bytes = 0  # 내보냈지만 공유 클라이언트를 닫지 않아 아직 올라와 있는 색인의 예상 메모리
+        self._releasing = False  # 백그라운드에서 공유 클라이언트를 닫는 중
+        if self._pinned is not None:
+            self._open[self._pinned.collection_name] = OpenCollection(
+                self._pinned, self._build_chain(self._pinned), time.time(), pinned=True
+            )
+
+    @staticmethod
+    def _build_chain(engine: RagEngine) -> Runnable:
+        return instrument(build_rag_chain(build_retriever(engine)), f"rag/{engine.collection_name}")
+
+    def exists(self, name: str) -> bool:
+        """저장소에 컬렉션이 있는지 확인 (없는 이름으로 빈 컬렉션을 만들지 않도록 열기 전에 확인)"""
+        if not _COLLECTION_NAME.match(name):
+            return False
+        shared = shared_chroma(self.persist_directory)
+        with shared.reading():
+            try:
+                shared.client.get_collection(name)
+            except Exception:
+                return False
+        return True
+
+    def names(self) -> list[str]:
+        """저장소의 모든 컬렉션 이름"""
+        shared = shared_chroma(self.persist_directory)
+        with shared.reading():
+            return sorted(collection.name for collection in shared.client.list_collections())
+
+    def get(self, name: str) -> Runnable:
+        """컬렉션의 RAG 체인을 반환 (처음이면 열고, 한도를 넘으면 오래 쓰지 않은 컬렉션을 내보냄)"""
+        with self._lock:
+            entry = self._open.get(name)
+            if entry is not None:
+                self._open.move_to_end(name)
+                self.hits += 1
+                COLLECTION_EVENTS.inc(1, "hit")
+                return entry.chain
+            opening = self._opening.setdefault(name, threading.Lock())
+
+        # 같은 컬렉션을 동시에 여는 요청은 하나만 열고 나머지는 기다림
+        with opening:
+            with self._lock:
+                entry = self._open.get(name)
+                if entry is not None:
+                    self._open.move_to_end(name)
+                    self.hits += 1
+                    COLLECTION_EVENTS.inc(1, "hit")
+                    return entry.chain
+            try:
+                if not self.exists(name):
+                    COLLECTION_EVENTS.inc(1, "not_found")
+                    raise CollectionNotFound(name)
+                engine = create_engine(name, persist_directory=self.persist_directory)
+                engine.warmup()
+                entry = OpenCollection(engine, self._build_chain(engine), time.time())
+            except Exception:
+                with self._lock:
+                    self._opening.pop(name, None)
+                raise
+
+            with self._lock:
+                self._open[name] = entry
+                self._opening.pop(name, None)
+                self.opens += 1
+                COLLECTION_EVENTS.inc(1, "open")
+                self._evicted_bytes += sum(victim.resident_bytes for victim in self._evict(keep=name))
+                release = self._evicted_bytes > self.release_threshold_bytes and not self._releasing
+                if release:
+                    self._releasing = True
+            if release:
+                # 요청은 기다리지 않도록 클라이언트를 닫고 다시 여는 일은 백그라운드에서 처리
+                threading.Thread(target=self._release, name="chroma-release", daemon=True).start()
+        return entry.chain
+
+    def _evict(self, keep: str) -> list[OpenCollection]:
+        """개수/메모리 한도를 넘으면 가장 오래 쓰지 않은 컬렉션부터 내보냄 (pinned 와 방금 연 컬렉션 제외)"""
+        victims = []
+        while len(self._open) > self.max_open or (
+            self.max_memory_bytes and self.estimated_bytes() > self.max_memory_bytes
+        ):
+            victim = next((name for name, entry in self._open.items() if not entry.pinned and name != keep), None)
+            if victim is None:
+                break
+            entry = self._open.pop(victim)
+            victims.append(entry)
+            self.evictions += 1
+            COLLECTION_EVENTS.inc(1, "evict")
+            logger.info(
+                f"컬렉션 '{victim}' 내보냄 (약 {entry.memory_bytes / 1024 / 1024:.1f}MB, "
+                f"열린 컬렉션 {len(self._open)}개)"
+            )
+        return victims
+
+    def _release(self):
+        """공유 Chroma 클라이언트를 닫아 내보낸 컬렉션의 색인 메모리를 돌려받고, 남은 컬렉션을 다시 연결"""
+        try:
+            with self._lock:
+                engines = [entry.engine for entry in self._open.values() if not entry.engine.dedicated_client]
+                resident = {id(engine) for engine in engines if engine.resident_bytes}
+                released = self._evicted_bytes
+            if not shared_chroma(self.persist_directory).recycle():
+                # 오래 걸리는 조회가 있으면 다음에 컬렉션을 내보낼 때 다시 시도
+                logger.warning("진행 중인 조회가 끝나지 않아 Chroma 클라이언트를 닫지 못했습니다.")
+                return
+            with self._lock:
+                # 닫는 동안 더 내보낸 컬렉션은 다음 판정에 남겨 둠
+                self._evicted_bytes = max(0, self._evicted_bytes - released)
+                self.releases += 1
+            COLLECTION_EVENTS.inc(1, "release")
+            # 요청이 다시 연결하거나 색인을 읽느라 느려지지 않도록, 색인이 올라와 있던 컬렉션은 여기서 미리 올림
+            for engine in engines:
+                try:
+                    engine.load()
+                    if id(engine) in resident:
+                        engine.warm_index()
+                except Exception as e:
+                    logger.error(f"컬렉션 '{engine.collection_name}' 다시 연결 실패: {e}")
+        finally:
+            with self._lock:
+                self._releasing = False
+
+    def estimated_bytes(self) -> int:
+        """열린 컬렉션을 모두 조회했을 때의 예상 메모리 (메모리 한도 판정용)"""
+        return sum(entry.memory_bytes for entry in self._open.values())
+
+    def memory_bytes(self) -> int:
+        """지금 Chroma 에 올라와 있는 색인의 예상 메모리 (내보냈지만 아직 클라이언트를 닫지 않은 컬렉션 포함)
+
+        문서 수와 임베딩 차원으로 추정한 값이며 프로세스 메모리를 측정한 값은 아닙니다.
+        """
+        return sum(entry.resident_bytes for entry in self._open.values()) + self._evicted_bytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open": {
+                    name: {
+                        "documents": entry.engine.document_count,
+                        "memory_bytes": entry.memory_bytes,
+                        "resident_bytes": entry.resident_bytes,
+                        "pinned": entry.pinned,
+                    }
+                    for name, entry in self._open.items()
+                },
+                "memory_bytes": self.memory_bytes(),
+                "estimated_bytes": self.estimated_bytes(),
+                "evicted_bytes": self._evicted_bytes,
+                "releasing": self._releasing,
+                "release_threshold_bytes": self.release_threshold_bytes,
+                "max_open": self.max_open,
+                "max_memory_bytes": self.max_memory_bytes,
+                "hits": self.hits,
+                "opens": self.opens,
+                "evictions": self.evictions,
+                "releases": self.releases,
+            }
@@ -0,0 +1,359 @@
+# app/rerank.py
+"""Cross-encoder 재정렬 (CPU, 배치 + 점수 캐시 + 지연 시간 예산)
+
+노트북(DAY02_005)의 HuggingFaceCrossEncoder 는 요청마다 전체 정밀도(fp32) 모델로 쌍을 채점합니다.
+여기서는
+- 모델(BAAI/bge-reranker-v2-m3)을 프로세스당 한 번만 불러오고 (ONNX 또는 int8 동적 양자화)
+- 질문-문서 쌍을 배치로 채점하며, 한 번 채점한 쌍은 LRU 캐시에 저장하고
+- 요청별 지연 시간 예산을 넘길 것 같으면 채점을 멈추고 검색기 순서 그대로 반환합니다.
+재정렬 후보를 늘려도(RAG_RERANK_CANDIDATES) p99 지연 시간이 예산 이상으로 늘지 않습니다.
+
+    # 켜기 (기본값은 꺼짐)
+    RAG_RERANK=1 python -m app.server
+
+    # int8 양자화 ONNX 모델을 만들어 사용
+    python -m app.rerank --export ./models/bge-reranker-v2-m3-onnx
+    RAG_RERANK=1 RAG_RERANK_MODEL=./models/bge-reranker-v2-m3-onnx \\
+        RAG_RERANK_ONNX_FILE=onnx/model_qint8_avx512_vnni.onnx python -m app.server
+
+    # 백엔드별 채점 속도 비교
+    python -m app.rerank --bench --backends onnx torch-int8 torch
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.documents import Document
+from langchain_core.runnables import Runnable, RunnableLambda, RunnableParallel, RunnablePassthrough
+
+from app.embedding_cache import normalize_text
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# 재정렬 설정 (환경변수로 변경 가능)
+RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", "BAAI/bge-reranker-v2-m3")
+RERANK_BACKEND = os.getenv("RAG_RERANK_BACKEND", "onnx")  # onnx | torch-int8 | torch
+RERANK_ONNX_FILE = os.getenv("RAG_RERANK_ONNX_FILE")  # 예: onnx/model_qint8_avx512_vnni.onnx
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "20"))  # 재정렬 전 검색 문서 수
+RERANK_TOP_N = int(os.getenv("RAG_RERANK_TOP_N", "5"))  # 재정렬 후 남길 문서 수
+RERANK_BUDGET_MS = float(os.getenv("RAG_RERANK_BUDGET_MS", "300"))  # 요청별 재정렬 시간 예산
+RERANK_BATCH_SIZE = int(os.getenv("RAG_RERANK_BATCH_SIZE", "8"))
+RERANK_MAX_LENGTH = int(os.getenv("RAG_RERANK_MAX_LENGTH", "512"))
+RERANK_MAX_CONCURRENCY = int(os.getenv("RAG_RERANK_MAX_CONCURRENCY", "2"))  # 동시에 채점하는 요청 수 (CPU 과점유 방지)
+RERANK_CACHE_SIZE = int(os.getenv("RAG_RERANK_CACHE_SIZE", "50000"))
+
+BACKENDS = ("onnx", "torch-int8", "torch")
+
+RERANK_RESULTS = registry.counter(
+    "rag_rerank_total", "재정렬 결과 (ok 또는 검색기 순서로 대체한 이유)", ("result",)
+)
+RERANK_PAIRS = registry.counter(
+    "rag_rerank_pairs_total", "재정렬 질문-문서 쌍 수", ("source",)
+)
+
+
+def load_cross_encoder(model_name: str, backend: str, onnx_file: str | None = None, max_length: int = RERANK_MAX_LENGTH):
+    """sentence-transformers CrossEncoder 를 CPU 추론용으로 생성
+
+    - onnx: ONNX Runtime 백엔드 (onnx_file 로 양자화된 파일 선택, 없으면 기본 model.onnx 를 내보내 사용)
+    - torch-int8: PyTorch 모델의 Linear 층을 int8 동적 양자화
+    - torch: 양자화 없는 fp32
+    """
+    from sentence_transformers import CrossEncoder
+
+    if backend == "onnx":
+        model_kwargs = {"file_name": onnx_file} if onnx_file else {}
+        return CrossEncoder(model_name, backend="onnx", model_kwargs=model_kwargs, max_length=max_length, device="cpu")
+
+    model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+    if backend == "torch-int8":
+        import torch
+
+        model.model = torch.quantization.quantize_dynamic(model.model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def _doc_key(doc: Document) -> str:
+    if doc.id:
+        return doc.id
+    return hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+
+class Reranker:
+    """Cross-encoder 재정렬기 (모델은 load() 또는 첫 요청 때 백그라운드에서 한 번만 생성)
+
+    Args:
+        model_name: Hugging Face 모델 이름 또는 로컬 경로
+        backend: onnx | torch-int8 | torch (불러오기에 실패하면 다음 백엔드로 대체)
+        top_n: 재정렬 후 반환할 문서 수
+        candidates: 재정렬 전 검색기에서 가져올 문서 수
+        budget_ms: 요청별 재정렬 시간 예산 (넘길 것 같으면 검색기 순서로 반환)
+        batch_size: 한 번에 채점하는 쌍 수
+        loader: 모델 생성 함수 (model_name, backend) → predict(pairs, batch_size=...) 를 가진 객체
+    """
+
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL,
+        backend: str = RERANK_BACKEND,
+        top_n: int = RERANK_TOP_N,
+        candidates: int = RERANK_CANDIDATES,
+        budget_ms: float = RERANK_BUDGET_MS,
+        batch_size: int = RERANK_BATCH_SIZE,
+        max_concurrency: int = RERANK_MAX_CONCURRENCY,
+        cache_size: int = RERANK_CACHE_SIZE,
+        loader=None,
+    ):
+        self.model_name = model_name
+        self.backend = backend
+        self.top_n = top_n
+        self.candidates = candidates
+        self.budget = budget_ms / 1000
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.loader = loader or (lambda name, backend: load_cross_encoder(name, backend, RERANK_ONNX_FILE))
+        self._model = None
+        self._loaded_backend = None
+        self._load_lock = threading.Lock()
+        self._loading = None
+        self.error = None
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._seconds_per_pair = None  # 채점 속도 이동 평균 (예산 안에 배치를 끝낼 수 있는지 판단)
+        self.load_seconds = None
+
+    # --- 모델 ---
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        """모델을 생성 (이미 있으면 그대로). 지정한 백엔드가 실패하면 다음 백엔드를 시도"""
+        if self._model is not None:
+            return self._model
+        with self._load_lock:
+            if self._model is not None:
+                return self._model
+            t0 = time.perf_counter()
+            for backend in BACKENDS[BACKENDS.index(self.backend):]:
+                try:
+                    model = self.loader(self.model_name, backend)
+                except Exception as e:
+                    self.error = f"{backend}: {e}"
+                    logger.warning(f"재정렬 모델을 {backend} 백엔드로 불러오지 못했습니다: {e}")
+                    continue
+                # 한 쌍을 미리 채점하여 추론 세션을 준비하고 채점 속도 초기값을 잡음
+                t1 = time.perf_counter()
+                model.predict([("warmup", "warmup")], batch_size=1, show_progress_bar=False)
+                self._update_speed(time.perf_counter() - t1, 1)
+                self._loaded_backend = backend
+                self.error = None
+                self.load_seconds = time.perf_counter() - t0
+                self._model = model
+                logger.info(f"재정렬 모델 준비 완료: {self.model_name} ({backend}, {self.load_seconds:.1f}s)")
+                return model
+            raise RuntimeError(f"재정렬 모델을 불러오지 못했습니다: {self.error}")
+
+    def _ensure_loading(self):
+        """요청 경로에서는 모델 생성을 기다리지 않고 백그라운드 스레드에서 시작만 함"""
+        if self._model is None and self._loading is None:
+            with self._load_lock:
+                if self._loading is None:
+                    self._loading = threading.Thread(target=self._load_quietly, name="reranker-load", daemon=True)
+                    self._loading.start()
+
+    def _load_quietly(self):
+        try:
+            self.load()
+        except Exception:
+            pass
+
+    # --- 점수 캐시 ---
+
+    def _cached(self, keys: list[tuple]) -> dict[tuple, float]:
+        found = {}
+        with self._cache_lock:
+            for key in keys:
+                score = self._cache.get(key)
+                if score is not None:
+                    self._cache.move_to_end(key)
+                    found[key] = score
+        return found
+
+    def _store(self, items):
+        with self._cache_lock:
+            for key, score in items:
+                self._cache[key] = score
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # --- 재정렬 ---
+
+    def _fallback(self, docs: list[Document], reason: str) -> list[Document]:
+        RERANK_RESULTS.inc(1, reason)
+        return docs[: self.top_n]
+
+    def rerank(self, query: str, docs: list[Document]) -> list[Document]:
+        """질문과의 관련도 순으로 상위 top_n 문서를 반환 (metadata["relevance_score"] 에 점수 기록)
+
+        모델이 준비되지 않았거나 예산 안에 채점을 끝낼 수 없으면 검색기 순서의 상위 top_n 을 반환합니다.
+        """
+        if not docs:
+            return docs
+        deadline = time.perf_counter() + self.budget
+        if self._model is None:
+            self._ensure_loading()
+            return self._fallback(docs, "unavailable")
+
+        query_key = normalize_text(query)
+        keys = [(query_key, _doc_key(doc)) for doc in docs]
+        scores = self._cached(keys)
+        # 캐시에 없는 쌍만 채점 (같은 문서가 여러 번 들어 있으면 한 번만)
+        texts = {key: doc.page_content for key, doc in zip(keys, docs)}
+        pending = [key for key in texts if key not in scores]
+        RERANK_PAIRS.inc(len(texts) - len(pending), "cache")
+
+        if pending:
+            # 동시에 채점하는 요청 수를 제한 (대기 시간도 예산에 포함)
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.perf_counter())):
+                return self._fallback(docs, "budget")
+            try:
+                for start in range(0, len(pending), self.batch_size):
+                    batch = pending[start : start + self.batch_size]
+                    remaining = deadline - time.perf_counter()
+                    if self._seconds_per_pair is not None and self._seconds_per_pair * len(batch) > remaining:
+                        # 이번 배치를 끝내면 예산을 넘기므로 중단 (이미 채점한 쌍은 캐시에 남음)
+                        # 일시적으로 느려졌던 측정값이 계속 채점을 막지 않도록 추정치를 조금씩 낮춤
+                        self._seconds_per_pair *= 0.95
+                        return self._fallback(docs, "budget")
+                    t0 = time.perf_counter()
+                    try:
+                        values = self._model.predict(
+                            [(query, texts[key]) for key in batch],
+                            batch_size=self.batch_size,
+                            show_progress_bar=False,
+                        )
+                    except Exception as e:
+                        logger.warning(f"재정렬 채점 실패: {e}")
+                        return self._fallback(docs, "error")
+                    self._update_speed(time.perf_counter() - t0, len(batch))
+                    batch_scores = {key: float(value) for key, value in zip(batch, values)}
+                    scores.update(batch_scores)
+                    self._store(batch_scores.items())
+                    RERANK_PAIRS.inc(len(batch), "model")
+            finally:
+                self._slots.release()
+
+        order = sorted(range(len(docs)), key=lambda i: scores[keys[i]], reverse=True)[: self.top_n]
+        RERANK_RESULTS.inc(1, "ok")
+        return [
+            Document(
+                id=docs[i].id,
+                page_content=docs[i].page_content,
+                metadata={**docs[i].metadata, "relevance_score": scores[keys[i]]},
+            )
+            for i in order
+        ]
+
+    def _update_speed(self, elapsed: float, pairs: int):
+        per_pair = elapsed / pairs
+        if self._seconds_per_pair is None:
+            self._seconds_per_pair = per_pair
+        else:
+            self._seconds_per_pair = 0.8 * self._seconds_per_pair + 0.2 * per_pair
+
+    async def arerank(self, query: str, docs: list[Document]) -> list[Document]:
+        # 모델 추론은 CPU 작업이므로 이벤트 루프를 막지 않도록 스레드에서 실행
+        return await asyncio.to_thread(self.rerank, query, docs)
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "backend": self._loaded_backend or self.backend,
+            "ready": self.ready,
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+            "budget_ms": self.budget * 1000,
+            "ms_per_pair": self._seconds_per_pair * 1000 if self._seconds_per_pair is not None else None,
+            "cache_items": len(self._cache),
+        }
+
+
+def with_rerank(retriever: Runnable, reranker: Reranker) -> Runnable:
+    """질문(str) → 검색 → 재정렬 Runnable (체인에서 검색기 자리에 그대로 사용)"""
+    return (
+        RunnableParallel(question=RunnablePassthrough(), docs=retriever)
+        | RunnableLambda(
+            lambda x: reranker.rerank(x["question"], x["docs"]),
+            afunc=lambda x: reranker.arerank(x["question"], x["docs"]),
+            name="Rerank",
+        )
+    ).with_config(run_name="RerankRetriever").with_types(input_type=str, output_type=list[Document])
+
+
+def reranker_from_env() -> Reranker | None:
+    """환경변수 설정으로 재정렬기 생성 (RAG_RERANK=1 일 때만 사용, 기본값은 꺼짐)"""
+    if os.getenv("RAG_RERANK", "0") != "1":
+        return None
+    return Reranker()
+
+
+def _bench(model_name: str, backends: list[str], questions: list[str], docs: list[str], batch_size: int):
+    pairs = [(question, doc) for question in questions for doc in docs]
+    for backend in backends:
+        try:
+            t0 = time.perf_counter()
+            model = load_cross_encoder(model_name, backend, RERANK_ONNX_FILE if backend == "onnx" else None)
+            load_seconds = time.perf_counter() - t0
+        except Exception as e:
+            print(f"{backend:<12} 불러오기 실패: {e}")
+            continue
+        model.predict(pairs[:batch_size], batch_size=batch_size, show_progress_bar=False)  # warmup
+        t0 = time.perf_counter()
+        model.predict(pairs, batch_size=batch_size, show_progress_bar=False)
+        elapsed = time.perf_counter() - t0
+        print(
+            f"{backend:<12} 로드 {load_seconds:>6.1f}s  쌍 {len(pairs)}개 {elapsed:>6.2f}s "
+            f"({elapsed / len(pairs) * 1000:.1f} ms/쌍)"
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cross-encoder 재정렬 모델 내보내기 / 속도 비교")
+    parser.add_argument("--model", default=RERANK_MODEL)
+    parser.add_argument("--export", default=None, metavar="DIR", help="int8 동적 양자화 ONNX 모델을 저장할 경로")
+    parser.add_argument("--quantization", default="avx512_vnni", choices=["arm64", "avx2", "avx512", "avx512_vnni"])
+    parser.add_argument("--bench", action="store_true", help="백엔드별 채점 속도 비교")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--questions", default="data/testset.xlsx")
+    parser.add_argument("--limit", type=int, default=4, help="속도 비교에 사용할 질문 수")
+    parser.add_argument("--batch-size", type=int, default=RERANK_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.export:
+        from sentence_transformers import CrossEncoder, export_dynamic_quantized_onnx_model
+
+        model = CrossEncoder(args.model, backend="onnx", max_length=RERANK_MAX_LENGTH, device="cpu")
+        model.save_pretrained(args.export)
+        export_dynamic_quantized_onnx_model(model, args.quantization, args.export)
+        print(f"저장 완료: {args.export}/onnx/model_qint8_{args.quantization}.onnx")
+
+    if args.bench:
+        from app.hybrid import load_questions
+        from app.loadtest import load_documents
+
+        questions, _ = load_questions(args.questions)
+        documents = [doc.page_content for doc in load_documents()][:RERANK_CANDIDATES]
+        _bench(args.model, args.backends, questions[: args.limit], documents, args.batch_size)
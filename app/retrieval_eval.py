@@ -0,0 +1,272 @@
+# app/retrieval_eval.py
+"""검색기 파라미터 평가 (recall@k, MRR, nDCG@k + 지연 시간)
+
+노트북(DAY02_002)처럼 질문마다 파이썬 반복문으로 정밀도/재현율을 계산하지 않고,
+1) 질문 전체를 한 번만 임베딩하고
+2) 질문별 후보 문서(가장 큰 fetch_k 만큼)를 Chroma에서 한 번 가져와
+   후보와 reference_contexts 의 일치 여부를 rapidfuzz cdist 로 한꺼번에 계산한 뒤
+3) 설정 조합(search_type, k, fetch_k, lambda_mult)마다 후보 안에서 결과를 골라
+   지표를 NumPy 배열 연산으로 계산합니다.
+지연 시간은 설정마다 실제 검색 경로(임베딩 제외)를 질문별로 실행하여 측정하며, 설정들은 스레드로 병렬 실행합니다.
+
+사용 예 (프로젝트 루트에서):
+    python -m app.retrieval_eval --collection db_korean_cosine_metadata --questions data/testset.xlsx
+    python -m app.retrieval_eval --k 3 5 8 --fetch-k 10 20 40 --lambda-mult 0.3 0.5 0.7 --output sweep.json
+"""
+import itertools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+
+import numpy as np
+from langchain_chroma.vectorstores import maximal_marginal_relevance
+
+logger = logging.getLogger(__name__)
+
+# 현재 app/rag.py 기본 설정
+BASELINE = ("mmr", 5, 10, 0.3)
+
+
+@dataclass(frozen=True)
+class SearchConfig:
+    search_type: str
+    k: int
+    fetch_k: int
+    lambda_mult: float
+
+    @property
+    def label(self) -> str:
+        if self.search_type == "similarity":
+            return f"similarity k={self.k}"
+        return f"mmr k={self.k} fetch_k={self.fetch_k} λ={self.lambda_mult:g}"
+
+
+def build_grid(search_types, ks, fetch_ks, lambda_mults) -> list[SearchConfig]:
+    """설정 조합 목록 (fetch_k < k 조합 제외, similarity는 k만 다르게)"""
+    configs = []
+    for search_type in search_types:
+        if search_type == "similarity":
+            configs.extend(SearchConfig("similarity", k, k, 0.0) for k in ks)
+            continue
+        for k, fetch_k, lambda_mult in itertools.product(ks, fetch_ks, lambda_mults):
+            if fetch_k >= k:
+                configs.append(SearchConfig("mmr", k, fetch_k, lambda_mult))
+    return configs
+
+
+######################
+#  후보 문서와 정답 일치 행렬
+######################
+
+@dataclass
+class CandidatePool:
+    """질문별 후보 문서 (유사도 순)와 후보-정답 일치 여부
+
+    matches: (질문 수, 후보 수, 최대 정답 수) bool - 후보 c가 질문 q의 정답 r과 일치하는지
+    ref_mask: (질문 수, 최대 정답 수) bool - 실제 정답 위치 (패딩 제외)
+    """
+
+    vectors: np.ndarray  # (Q, dim)
+    embeddings: list[np.ndarray]  # 질문별 (후보 수, dim)
+    sizes: np.ndarray  # (Q,) 질문별 실제 후보 수
+    matches: np.ndarray
+    ref_mask: np.ndarray
+
+
+def build_pool(collection, vectors: np.ndarray, references: list[list[str]], size: int, threshold: float) -> CandidatePool:
+    from rapidfuzz import fuzz, process
+
+    results = collection.query(
+        query_embeddings=vectors.tolist(), n_results=size, include=["documents", "embeddings"]
+    )
+    n_questions = len(vectors)
+    max_refs = max(len(refs) for refs in references)
+    matches = np.zeros((n_questions, size, max_refs), dtype=bool)
+    ref_mask = np.zeros((n_questions, max_refs), dtype=bool)
+    sizes = np.zeros(n_questions, dtype=np.int64)
+    embeddings = []
+    for q, refs in enumerate(references):
+        documents = results["documents"][q]
+        sizes[q] = len(documents)
+        ref_mask[q, : len(refs)] = True
+        embeddings.append(np.asarray(results["embeddings"][q], dtype=np.float32))
+        if refs and documents:
+            # 정답 × 후보 부분 일치 점수를 C++ 구현으로 한 번에 계산 (노트북의 hit 기준과 동일)
+            scores = process.cdist(refs, documents, scorer=fuzz.partial_ratio, workers=-1)
+            matches[q, : len(documents), : len(refs)] = (scores >= threshold).T
+    return CandidatePool(vectors, embeddings, sizes, matches, ref_mask)
+
+
+def select(pool: CandidatePool, config: SearchConfig) -> np.ndarray:
+    """설정별 검색 결과를 후보 번호 행렬 (Q, k)로 반환 (부족한 자리는 -1)"""
+    n_questions = len(pool.vectors)
+    ranked = np.full((n_questions, config.k), -1, dtype=np.int64)
+    for q in range(n_questions):
+        available = int(min(pool.sizes[q], config.fetch_k))
+        if available == 0:
+            continue
+        if config.search_type == "similarity":
+            picked = np.arange(min(config.k, available))
+        else:
+            # Chroma와 같이 선택된 문서를 유사도 순서로 반환
+            picked = np.sort(maximal_marginal_relevance(
+                pool.vectors[q], pool.embeddings[q][:available], k=config.k, lambda_mult=config.lambda_mult
+            ))
+        ranked[q, : len(picked)] = picked
+    return ranked
+
+
+def score(pool: CandidatePool, ranked: np.ndarray) -> dict:
+    """recall@k, MRR, nDCG@k (질문 평균)
+
+    - recall@k: top-k 문서 중 하나라도 일치하는 정답의 비율
+    - MRR: 정답과 일치하는 첫 문서 순위의 역수
+    - nDCG@k: 정답과 일치하는 문서를 관련 문서(이진)로 본 순위 지표
+    """
+    n_questions, k = ranked.shape
+    valid = ranked >= 0
+    rows = np.arange(n_questions)[:, None]
+    # (Q, k, R): 순위 i 문서가 정답 r과 일치하는지
+    hits = pool.matches[rows, np.where(valid, ranked, 0)] & valid[:, :, None] & pool.ref_mask[:, None, :]
+    relevant = hits.any(axis=2)  # (Q, k)
+
+    n_refs = pool.ref_mask.sum(axis=1)
+    recall = np.divide(hits.any(axis=1).sum(axis=1), n_refs, out=np.zeros(n_questions), where=n_refs > 0)
+
+    first = relevant.argmax(axis=1)
+    mrr = np.where(relevant.any(axis=1), 1.0 / (first + 1), 0.0)
+
+    discounts = 1.0 / np.log2(np.arange(k) + 2)
+    dcg = (relevant * discounts).sum(axis=1)
+    ideal = np.cumsum(discounts)[np.clip(np.minimum(n_refs, k) - 1, 0, k - 1)] * (n_refs > 0)
+    ndcg = np.divide(dcg, ideal, out=np.zeros(n_questions), where=ideal > 0)
+
+    return {
+        "recall": float(recall.mean()),
+        "mrr": float(mrr.mean()),
+        "ndcg": float(ndcg.mean()),
+    }
+
+
+######################
+#  지연 시간 측정
+######################
+
+def measure_latency(chroma_db, vectors: np.ndarray, config: SearchConfig, repeat: int) -> dict:
+    """임베딩을 제외한 실제 검색 경로(Chroma 조회 + MMR)의 질문별 지연 시간(ms)"""
+    latencies = []
+    for _ in range(repeat):
+        for vector in vectors.tolist():
+            t0 = time.perf_counter()
+            if config.search_type == "similarity":
+                chroma_db.similarity_search_by_vector(vector, k=config.k)
+            else:
+                chroma_db.max_marginal_relevance_search_by_vector(
+                    vector, k=config.k, fetch_k=config.fetch_k, lambda_mult=config.lambda_mult
+                )
+            latencies.append(time.perf_counter() - t0)
+    latencies = np.asarray(latencies) * 1000
+    return {"p50_ms": float(np.percentile(latencies, 50)), "p95_ms": float(np.percentile(latencies, 95))}
+
+
+def evaluate(engine, questions, references, configs, threshold: float = 80, workers: int = 4, repeat: int = 1) -> list[dict]:
+    """설정별 품질 지표와 지연 시간 목록"""
+    # 1) 질문 임베딩은 한 번만 (임베딩 캐시에도 저장됨)
+    t0 = time.perf_counter()
+    vectors = np.asarray(engine.embeddings.embed_documents(questions), dtype=np.float32)
+    logger.info(f"질문 {len(questions)}개 임베딩: {time.perf_counter() - t0:.2f}s")
+
+    # 2) 가장 큰 fetch_k 만큼 후보를 한 번에 조회하고 정답 일치 행렬 계산
+    t0 = time.perf_counter()
+    size = max(max(config.fetch_k, config.k) for config in configs)
+    pool = build_pool(engine.chroma_db._collection, vectors, references, size, threshold)
+    logger.info(f"후보 {size}개 × 질문 {len(questions)}개 일치 행렬: {time.perf_counter() - t0:.2f}s")
+
+    # 3) 설정별 지표 + 지연 시간 (설정 단위로 병렬 실행)
+    def run(config: SearchConfig) -> dict:
+        quality = score(pool, select(pool, config))
+        latency = measure_latency(engine.chroma_db, vectors, config, repeat)
+        return {**asdict(config), "label": config.label, **quality, **latency}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, configs))
+
+
+def pareto_front(rows: list[dict], metric: str) -> set[int]:
+    """metric 이 같거나 높고 p95 지연 시간이 같거나 낮은 다른 설정이 없는 행 번호"""
+    quality = np.array([row[metric] for row in rows])
+    latency = np.array([row["p95_ms"] for row in rows])
+    dominated = (
+        (quality[None, :] >= quality[:, None])
+        & (latency[None, :] <= latency[:, None])
+        & ((quality[None, :] > quality[:, None]) | (latency[None, :] < latency[:, None]))
+    ).any(axis=1)
+    return set(np.flatnonzero(~dominated).tolist())
+
+
+def print_table(rows: list[dict], metric: str, show_all: bool = False):
+    front = pareto_front(rows, metric)
+    baseline = next(
+        (i for i, row in enumerate(rows)
+         if (row["search_type"], row["k"], row["fetch_k"], row["lambda_mult"]) == BASELINE),
+        None,
+    )
+    print(f"{'':2}{'설정':<34}{'recall@k':>10}{'MRR':>8}{'nDCG@k':>9}{'p50(ms)':>10}{'p95(ms)':>10}")
+    for i in sorted(range(len(rows)), key=lambda i: rows[i]["p95_ms"]):
+        if not show_all and i not in front and i != baseline:
+            continue
+        row = rows[i]
+        mark = ("*" if i in front else " ") + ("B" if i == baseline else " ")
+        print(
+            f"{mark}{row['label']:<34}{row['recall']:>10.3f}{row['mrr']:>8.3f}{row['ndcg']:>9.3f}"
+            f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+        )
+    print(f"(* 파레토 최적 - {metric} 기준, B 현재 기본 설정)")
+
+    if baseline is not None:
+        base = rows[baseline]
+        better = [
+            row["label"] for row in rows
+            if row is not base and row[metric] >= base[metric] and row["p95_ms"] < base["p95_ms"]
+        ]
+        if better:
+            print(f"기본 설정보다 빠르고 {metric}이 같거나 높은 설정: {', '.join(better)}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from app.hybrid import load_questions
+    from app.rag import CHROMA_PERSIST_DIR, RagEngine
+
+    parser = argparse.ArgumentParser(description="검색기 파라미터 조합별 품질/지연 시간 비교")
+    parser.add_argument("--collection", default="labor_law")
+    parser.add_argument("--persist-dir", default=CHROMA_PERSIST_DIR)
+    parser.add_argument("--questions", default="data/testset.xlsx", help="reference_contexts 열이 있는 .xlsx 테스트셋")
+    parser.add_argument("--search-types", nargs="+", choices=["mmr", "similarity"], default=["mmr", "similarity"])
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 5, 8])
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=[10, 20, 40])
+    parser.add_argument("--lambda-mult", type=float, nargs="+", default=[0.3, 0.5, 0.7])
+    parser.add_argument("--threshold", type=float, default=80, help="정답 일치로 볼 partial_ratio 최소 점수")
+    parser.add_argument("--metric", choices=["recall", "mrr", "ndcg"], default="ndcg", help="파레토 비교 기준 지표")
+    parser.add_argument("--workers", type=int, default=4, help="동시에 측정할 설정 수")
+    parser.add_argument("--repeat", type=int, default=3, help="지연 시간 측정 반복 횟수")
+    parser.add_argument("--all", action="store_true", help="파레토 최적이 아닌 설정도 출력")
+    parser.add_argument("--output", default=None, help="결과를 저장할 JSON 파일")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    questions, references = load_questions(args.questions)
+    if references is None:
+        parser.error("reference_contexts 열이 있는 .xlsx 테스트셋이 필요합니다.")
+
+    engine = RagEngine(collection_name=args.collection, persist_directory=args.persist_dir)
+    configs = build_grid(args.search_types, args.k, args.fetch_k, args.lambda_mult)
+    rows = evaluate(engine, questions, references, configs, args.threshold, args.workers, args.repeat)
+    print_table(rows, args.metric, args.all)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
@@ -1,34 +1,258 @@
-from fastapi import FastAPI
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
-from app.rag import rag_chain
+from app.batch import run_batch
+from app.answer_cache import answer_cache_from_env, cache_status, with_answer_cache
+from app.metrics import instrument, registry
+from app.rag import engine, rag_chain, reranker
+from app.registry import CollectionNotFound, CollectionRegistry
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langchain_openai import ChatOpenAI
-from langserve import add_routes
+from langserve import APIHandler, add_routes
 
 # 환경변수 로드
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """워커 시작 시 RAG 엔진을 미리 생성 (RAG_WARMUP=0 이면 첫 요청 시 생성)"""
+    if os.getenv("RAG_WARMUP", "1") != "0":
+        try:
+            probe = os.getenv("RAG_WARMUP_PROBE", "0") == "1"
+            await run_in_threadpool(engine.warmup, probe)
+        except Exception as e:
+            # 벡터 저장소에 문제가 있어도 서버는 기동하고 /ready 에서 상태를 알림
+            logger.error(f"RAG 엔진 warmup 실패: {e}")
+        if reranker is not None:
+            try:
+                await run_in_threadpool(reranker.load)
+            except Exception as e:
+                # 재정렬 모델이 없으면 검색기 순서 그대로 응답
+                logger.error(f"재정렬 모델 warmup 실패: {e}")
+    yield
+
+
 # FastAPI 서버를 설정
 app = FastAPI(
     title="LangChain Server",
     version="1.0",
     description="Spin up a simple api server using Langchain's Runnable interfaces",
+    lifespan=lifespan,
+)
+
+
+# 답변 캐시 (ANSWER_CACHE=0 이면 사용하지 않음)
+answer_cache = answer_cache_from_env()
+
+
+@app.middleware("http")
+async def answer_cache_header(request: Request, call_next):
+    """/rag 응답에 답변 캐시 적중 여부(X-RAG-Cache: hit | semantic-hit | miss)를 헤더로 추가"""
+    if answer_cache is None or not request.url.path.startswith("/rag"):
+        return await call_next(request)
+    statuses = []
+    token = cache_status.set(statuses)
+    try:
+        response = await call_next(request)
+    finally:
+        cache_status.reset(token)
+    # 스트리밍 응답은 헤더가 먼저 전송되므로 invoke/batch 응답에만 표시됨
+    if statuses:
+        response.headers["X-RAG-Cache"] = ",".join(statuses)
+    return response
+
+
+@app.get("/ready")
+async def ready():
+    """RAG 엔진 준비 상태 (준비 전에는 503 반환)"""
+    status = engine.status()
+    status["answer_cache"] = answer_cache.stats() if answer_cache else None
+    status["reranker"] = reranker.stats() if reranker else None
+    status["collections"] = collections.stats()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+def embedding_cache_counts() -> dict:
+    stats = engine.status()["embedding_cache"]
+    if not stats:
+        return {}
+    return {
+        ("memory_hit",): stats["hits"]["memory"],
+        ("disk_hit",): stats["hits"]["disk"],
+        ("miss",): stats["misses"],
+    }
+
+
+def answer_cache_counts() -> dict:
+    if answer_cache is None:
+        return {}
+    stats = answer_cache.stats()
+    return {(result,): stats[result] for result in ("hit", "semantic_hit", "miss")}
+
+
+def hit_ratio(counts: dict) -> float | None:
+    total = sum(counts.values())
+    return sum(value for (result,), value in counts.items() if result != "miss") / total if total else None
+
+
+registry.register_callback(
+    "rag_embedding_cache_requests_total", "counter", "질의 임베딩 캐시 조회 결과", ("result",), embedding_cache_counts
+)
+registry.register_callback(
+    "rag_answer_cache_requests_total", "counter", "답변 캐시 조회 결과", ("result",), answer_cache_counts
 )
+registry.register_callback(
+    "rag_cache_hit_ratio", "gauge", "캐시 적중률 (프로세스 시작 이후 누적)", ("cache",),
+    lambda: {
+        (name,): ratio
+        for name, ratio in (
+            ("embedding", hit_ratio(embedding_cache_counts())),
+            ("answer", hit_ratio(answer_cache_counts())),
+        )
+        if ratio is not None
+    },
+)
+
+
+registry.register_callback(
+    "rag_open_collections", "gauge", "열려 있는 컬렉션 수", (), lambda: {(): len(collections.stats()["open"])}
+)
+registry.register_callback(
+    "rag_open_collections_memory_bytes", "gauge",
+    "Chroma 에 올라와 있는 컬렉션 색인의 추정 메모리 (문서 수와 임베딩 차원으로 계산한 추정값, 실측 아님)", (),
+    lambda: {(): collections.stats()["memory_bytes"]},
+)
+
+
+@app.get("/metrics")
+async def metrics():
+    """단계별 지연 시간, 토큰 수, 캐시 적중률 (Prometheus 텍스트 형식)"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class BulkRequest(BaseModel):
+    questions: list[str] = Field(..., min_length=1, max_length=10_000)
+    concurrency: int = Field(8, ge=1, le=64, description="동시에 실행할 LLM 호출 수")
 
-# 라우팅 설정
+
+@app.post("/rag/bulk")
+async def rag_bulk(request: BulkRequest):
+    """대량 질문 일괄 처리 - 완료되는 순서대로 한 줄에 하나씩 JSON(NDJSON)으로 응답"""
+
+    async def ndjson():
+        async for result in run_batch(engine, request.questions, request.concurrency, answer_cache):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+######################
+#  컬렉션별 RAG (/rag/{collection})
+######################
+
+# 요청이 들어올 때 컬렉션을 열고 최근에 쓴 컬렉션만 열어 둠 (기본 엔진은 항상 유지)
+collections = CollectionRegistry(pinned=engine)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=collections.reset)
+
+
+def _route_collection(question: str, config: RunnableConfig):
+    return collections.get(config["configurable"]["collection"])
+
+
+async def _aroute_collection(question: str, config: RunnableConfig):
+    # 처음 여는 컬렉션은 SQLite/색인 로딩이 있으므로 이벤트 루프 밖에서 실행
+    return await run_in_threadpool(collections.get, config["configurable"]["collection"])
+
+
+def _collection_config(config: dict, request: Request) -> dict:
+    """경로의 컬렉션 이름을 체인 설정으로 전달"""
+    config.setdefault("configurable", {})["collection"] = request.path_params["collection"]
+    return config
+
+
+collection_api = APIHandler(
+    RunnableLambda(_route_collection, afunc=_aroute_collection, name="CollectionRouter").with_types(
+        input_type=str, output_type=str
+    ),
+    path="/rag/{collection}",
+    per_req_config_modifier=_collection_config,
+)
+
+
+async def _open_collection(collection: str):
+    """요청 처리 전에 컬렉션을 열어 두고, 없는 컬렉션이면 404"""
+    try:
+        await run_in_threadpool(collections.get, collection)
+    except CollectionNotFound:
+        raise HTTPException(status_code=404, detail=f"컬렉션을 찾을 수 없습니다: {collection}")
+    except Exception as e:
+        logger.error(f"컬렉션 '{collection}' 열기 실패: {e}")
+        raise HTTPException(status_code=503, detail=f"컬렉션을 열 수 없습니다: {collection}")
+
+
+@app.get("/collections")
+async def list_collections():
+    """저장소의 컬렉션 목록과 열려 있는 컬렉션 상태"""
+    names = await run_in_threadpool(collections.names)
+    return {"collections": names, **collections.stats()}
+
+
+@app.post("/rag/{collection}/invoke")
+async def rag_collection_invoke(collection: str, request: Request):
+    await _open_collection(collection)
+    return await collection_api.invoke(request)
+
+
+@app.post("/rag/{collection}/batch")
+async def rag_collection_batch(collection: str, request: Request):
+    await _open_collection(collection)
+    return await collection_api.batch(request)
+
+
+@app.post("/rag/{collection}/stream")
+async def rag_collection_stream(collection: str, request: Request):
+    await _open_collection(collection)
+    return await collection_api.stream(request)
+
+
+# 라우팅 설정 (단계별 지연 시간 계측 콜백 포함, RAG_METRICS=0 이면 제외)
 add_routes(
     app,
-    ChatOpenAI(model="gpt-4.1-mini"),
+    instrument(ChatOpenAI(model="gpt-4.1-mini"), "openai"),
     path="/openai",  # OpenAI 모델에 대한 경로
 )
 
 add_routes(
     app,
-    rag_chain,
+    instrument(with_answer_cache(rag_chain, engine, answer_cache) if answer_cache else rag_chain, "rag"),
     path="/rag",  # RAG 체인에 대한 경로
 )
 
 # FastAPI 서버 실행
 if __name__ == "__main__":
+    import argparse
+
     import uvicorn
 
-    uvicorn.run(app, host="localhost", port=8000)
+    parser = argparse.ArgumentParser(description="LangChain RAG 서버")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="워커 프로세스 수")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # 멀티 워커는 import 문자열로 실행해야 각 워커가 앱을 새로 로드함
+        uvicorn.run("app.server:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
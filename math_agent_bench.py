@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+math_server.py 도구 구성에 따른 에이전트 LLM 호출 횟수 비교
+
+같은 질문을 ReAct 에이전트에 보내면서
+    - before: 기존 스칼라 도구(add, multiply)만 제공
+    - after : 수식 계산(evaluate)과 배열 일괄 연산 도구까지 제공
+두 경우의 LLM 호출(라운드 트립) 수, 도구 호출 수, 소요 시간을 측정합니다. (OPENAI_API_KEY 필요)
+
+    python math_agent_bench.py
+    python math_agent_bench.py --model gpt-4.1-mini --repeat 3 --output bench_math.json
+"""
+
+import asyncio
+import json
+import time
+
+from dotenv import load_dotenv
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_mcp_adapters.tools import load_mcp_tools
+from langchain_openai import ChatOpenAI
+from langgraph.prebuilt import create_react_agent
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+load_dotenv()
+
+BASELINE_TOOLS = {"add", "multiply"}
+
+QUESTIONS = [
+    "3 + 5 × 12 계산해줘",
+    "(12 + 7) × (3 + 4) - 5 는 얼마야?",
+    "1, 2, 3, 4, 5, 6, 7, 8, 9, 10 을 모두 더하면?",
+    "다음 점수의 평균을 구해줘: 72, 85, 90, 66, 78, 94",
+    "단가 [1200, 3400, 560, 980]원인 상품을 각각 [3, 1, 10, 4]개 샀을 때 총액은?",
+    "[1, 2, 3]과 [10, 20, 30]을 원소별로 곱한 결과를 알려줘",
+]
+
+
+class RoundTripCounter(AsyncCallbackHandler):
+    """에이전트 실행 중 LLM 호출과 도구 호출 횟수를 셈"""
+
+    def __init__(self):
+        self.llm_calls = 0
+        self.tool_calls = 0
+
+    async def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.llm_calls += 1
+
+    async def on_tool_start(self, serialized, input_str, **kwargs):
+        self.tool_calls += 1
+
+
+async def run_question(agent, question: str) -> dict:
+    counter = RoundTripCounter()
+    t0 = time.perf_counter()
+    try:
+        response = await agent.ainvoke(
+            {"messages": [{"role": "user", "content": question}]},
+            config={"callbacks": [counter]},
+        )
+        answer, error = response["messages"][-1].content, None
+    except Exception as e:
+        answer, error = None, str(e)
+    return {
+        "question": question,
+        "llm_calls": counter.llm_calls,
+        "tool_calls": counter.tool_calls,
+        "seconds": round(time.perf_counter() - t0, 3),
+        "answer": answer,
+        "error": error,
+    }
+
+
+async def main(server_path: str, model: str, repeat: int) -> dict:
+    server_params = StdioServerParameters(
+        command="python",
+        args=[server_path],
+        env={"PYTHONIOENCODING": "utf-8", "PYTHONUNBUFFERED": "1"}
+    )
+    llm = ChatOpenAI(model=model, temperature=0)
+    results = {}
+    async with stdio_client(server_params) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            tools = await load_mcp_tools(session)
+            toolsets = {
+                "before": [tool for tool in tools if tool.name in BASELINE_TOOLS],
+                "after": tools,
+            }
+            for mode, mode_tools in toolsets.items():
+                agent = create_react_agent(llm, mode_tools)
+                runs = []
+                for _ in range(repeat):
+                    for question in QUESTIONS:
+                        runs.append(await run_question(agent, question))
+                results[mode] = {
+                    "tools": [tool.name for tool in mode_tools],
+                    "runs": runs,
+                    "llm_calls": sum(run["llm_calls"] for run in runs),
+                    "tool_calls": sum(run["tool_calls"] for run in runs),
+                    "seconds": round(sum(run["seconds"] for run in runs), 3),
+                    "errors": sum(run["error"] is not None for run in runs),
+                }
+    return results
+
+
+def print_report(results: dict):
+    print(f"{'질문':<50}{'before LLM/도구':>16}{'after LLM/도구':>16}")
+    for before, after in zip(results["before"]["runs"], results["after"]["runs"]):
+        print(
+            f"{before['question'][:48]:<50}"
+            f"{before['llm_calls']:>10}/{before['tool_calls']:<5}"
+            f"{after['llm_calls']:>10}/{after['tool_calls']:<5}"
+        )
+    for mode in ("before", "after"):
+        summary = results[mode]
+        print(
+            f"{mode:<7} LLM 호출 {summary['llm_calls']:>4}회, 도구 호출 {summary['tool_calls']:>4}회, "
+            f"{summary['seconds']:.1f}초, 오류 {summary['errors']}건"
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="math_server 도구 구성별 LLM 라운드 트립 비교")
+    parser.add_argument("--server", default="math_server.py")
+    parser.add_argument("--model", default="gpt-4.1-mini")
+    parser.add_argument("--repeat", type=int, default=1, help="질문 세트 반복 횟수")
+    parser.add_argument("--output", default=None, help="결과를 저장할 JSON 파일")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args.server, args.model, args.repeat))
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
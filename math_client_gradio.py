@@ -1,67 +1,393 @@
 import asyncio
+import json
+import logging
+import os
 import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import aclosing, asynccontextmanager
+from datetime import timedelta
+from typing import Optional
+
 import gradio as gr
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+from langchain_core.tools import StructuredTool
 from langchain_mcp_adapters.tools import load_mcp_tools
+from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.prebuilt import create_react_agent
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# 세션 풀 설정 (환경변수로 변경 가능)
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "4"))  # 미리 띄워 둘 MCP 서버 프로세스 수
+MCP_SESSIONS_PER_SERVER = int(os.getenv("MCP_SESSIONS_PER_SERVER", "4"))  # 서버 프로세스 1개가 동시에 맡는 대화 수
+MCP_HEALTH_INTERVAL = float(os.getenv("MCP_HEALTH_INTERVAL", "15"))  # 상태 확인(ping) 주기(초)
+MCP_TOOL_TIMEOUT = float(os.getenv("MCP_TOOL_TIMEOUT", "60"))  # 도구 호출 응답 제한 시간(초)
+CHAT_TIMEOUT = 60  # 대화 1턴 제한 시간(초), 스트리밍 모드에서는 이벤트 사이 최대 대기 시간
+TOOL_OUTPUT_PREVIEW = 500  # 채팅창에 표시할 도구 결과 최대 글자 수
+CONCURRENCY_LIMIT = int(os.getenv("GRADIO_CONCURRENCY_LIMIT", "32"))  # 동시에 처리할 채팅 요청 수
+TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "4096"))  # 도구 결과 캐시 최대 항목 수 (0이면 사용 안 함)
+
+# 모든 에이전트가 공유하는 모델과 대화 상태 저장소 (thread_id = 사용자 세션)
+llm = ChatOpenAI(model="gpt-4.1-mini")
+checkpointer = InMemorySaver()
+
+
+def tool_cache_ttl(tool) -> Optional[float]:
+    """서버가 도구 annotations로 알려 준 캐시 유효 시간(초)
+
+    - cacheTtl 값이 있으면 그 시간 동안 캐시
+    - 읽기 전용(readOnlyHint) + 멱등(idempotentHint) + 외부 의존 없음(openWorldHint=False)이면 계속 캐시 (inf)
+    - 그 외에는 캐시하지 않음 (None)
+    """
+    annotations = tool.metadata or {}
+    if annotations.get("cacheTtl") is not None:
+        return float(annotations["cacheTtl"])
+    if annotations.get("readOnlyHint") and annotations.get("idempotentHint") and annotations.get("openWorldHint") is False:
+        return float("inf")
+    return None
+
+
+class ToolResultCache:
+    """도구 이름과 인자를 키로 하는 도구 결과 LRU 캐시 (항목마다 유효 시간)
+
+    같은 인자로 동시에 들어온 호출은 한 번만 서버로 보냅니다. 오류는 캐시하지 않습니다.
+    """
+
+    def __init__(self, max_items: int = TOOL_CACHE_SIZE):
+        self.max_items = max_items
+        self._data = OrderedDict()  # 키 -> (만료 시각, 결과)
+        self._inflight = {}
+        self.hits = {}
+        self.misses = {}
+
+    def clear(self):
+        self._data.clear()
+        self.hits.clear()
+        self.misses.clear()
+
+    async def call(self, name: str, ttl: float, arguments: dict, func):
+        key = (name, json.dumps(arguments, sort_keys=True, ensure_ascii=False, default=str))
+        item = self._data.get(key)
+        if item is not None and item[0] > time.monotonic():
+            self._data.move_to_end(key)
+            self.hits[name] = self.hits.get(name, 0) + 1
+            return item[1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.hits[name] = self.hits.get(name, 0) + 1  # 진행 중인 같은 호출의 결과를 함께 사용
+        else:
+            self.misses[name] = self.misses.get(name, 0) + 1
+            task = asyncio.ensure_future(func(**arguments))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._store(key, ttl, done))
+        return await asyncio.shield(task)
+
+    def _store(self, key, ttl: float, task: asyncio.Future):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._data[key] = (time.monotonic() + ttl, task.result())
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_items:
+            self._data.popitem(last=False)
+
+    def wrap(self, tool):
+        """캐시 가능한 도구는 결과 캐시를 거치는 도구로 바꿔 반환 (그 외에는 그대로)"""
+        ttl = tool_cache_ttl(tool)
+        if not self.max_items or ttl is None or ttl <= 0 or tool.coroutine is None:
+            return tool
+
+        async def cached_call(**arguments):
+            return await self.call(tool.name, ttl, arguments, tool.coroutine)
+
+        return StructuredTool(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            coroutine=cached_call,
+            response_format=tool.response_format,
+            metadata=tool.metadata,
+        )
+
+    def stats(self) -> dict:
+        hits, misses = sum(self.hits.values()), sum(self.misses.values())
+        return {
+            "items": len(self._data),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "by_tool": {
+                name: {"hits": self.hits.get(name, 0), "misses": self.misses.get(name, 0)}
+                for name in sorted(set(self.hits) | set(self.misses))
+            },
+        }
+
+
+# 모든 서버 프로세스가 공유하는 도구 결과 캐시
+tool_cache = ToolResultCache()
+
+
+def is_server_url(server_path: str) -> bool:
+    return server_path.startswith(("http://", "https://"))
+
+
+class MCPServerWorker:
+    """MCP 서버 프로세스 1개(또는 HTTP 서버와의 세션 1개)와 그 세션에 연결된 도구/에이전트
+
+    stdio 연결은 연 태스크에서 닫아야 하므로 연결 수명 전체를 전용 태스크(_run)가 관리합니다.
+    """
+
+    def __init__(self, server_path: str, index: int):
+        self.server_path = server_path
+        self.index = index
+        self.session = None
+        self.tools = []
+        self.agent = None
+        self.active = 0  # 이 서버에서 처리 중인 대화 수
+        self.healthy = False
+        self.started_at = None
+        self._task = None
+        self._ready = None
+        self._stop = None
+
+    async def start(self, timeout: float = 30):
+        self._ready = asyncio.get_running_loop().create_future()
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        await asyncio.wait_for(asyncio.shield(self._ready), timeout)
+
+    def _transport(self):
+        """서버 경로가 URL이면 streamable HTTP로 접속, 아니면 stdio로 서버 프로세스를 띄움"""
+        if is_server_url(self.server_path):
+            return streamablehttp_client(self.server_path, timeout=MCP_TOOL_TIMEOUT)
+        server_params = StdioServerParameters(
+            command="python",
+            args=[self.server_path],
+            env={"PYTHONIOENCODING": "utf-8", "PYTHONUNBUFFERED": "1"}
+        )
+        return stdio_client(server_params)
+
+    async def _run(self):
+        try:
+            async with self._transport() as (read, write, *_):
+                async with ClientSession(read, write, read_timeout_seconds=timedelta(seconds=MCP_TOOL_TIMEOUT)) as session:
+                    await session.initialize()
+                    self.tools = [tool_cache.wrap(tool) for tool in await load_mcp_tools(session)]
+                    self.agent = create_react_agent(llm, self.tools, checkpointer=checkpointer)
+                    self.session = session
+                    self.healthy = True
+                    self.started_at = time.time()
+                    self._ready.set_result(None)
+                    await self._stop.wait()
+        except Exception as e:
+            if not self._ready.done():
+                self._ready.set_exception(e)
+            else:
+                logger.warning(f"MCP 서버 #{self.index} 연결 종료: {e}")
+        finally:
+            self.healthy = False
+            self.session = None
+
+    async def ping(self, timeout: float = 5):
+        if not self.healthy or self.session is None:
+            raise ConnectionError("연결되지 않은 서버입니다.")
+        await asyncio.wait_for(self.session.send_ping(), timeout)
+
+    async def close(self):
+        self.healthy = False
+        if self._task is None:
+            return
+        self._stop.set()
+        try:
+            await asyncio.wait_for(self._task, 10)
+        except BaseException:
+            self._task.cancel()
+
+
+class MCPSessionPool:
+    """미리 띄워 둔 MCP 서버 프로세스들에 여러 대화를 나누어 배정하는 세션 풀
+
+    - 대화 1턴마다 처리 중인 대화가 가장 적은 서버를 배정 (서버당 최대 sessions_per_server개)
+    - 모든 서버가 가득 차면 빈자리가 날 때까지 대기하고 대기 시간을 기록
+    - 주기적으로 ping을 보내 응답하지 않거나 종료된 서버 프로세스를 다시 띄움
+    - server_path가 URL이면 이미 실행 중인 HTTP 서버에 size개의 세션을 열어 같은 방식으로 사용
+    """
+
+    def __init__(self, server_path: str, size: int = MCP_POOL_SIZE, sessions_per_server: int = MCP_SESSIONS_PER_SERVER):
+        self.server_path = server_path
+        self.size = size
+        self.sessions_per_server = sessions_per_server
+        self.workers = [MCPServerWorker(server_path, i) for i in range(size)]
+        self._cond = asyncio.Condition()
+        self._respawning = set()
+        self._health_task = None
+        self.waiting = 0
+        self.requests = 0
+        self.respawns = 0
+        self.queue_waits = deque(maxlen=1000)  # 최근 배정 대기 시간(초)
+        self.startup_seconds = None
+
+    async def start(self):
+        """서버 프로세스를 동시에 띄움 (일부가 실패해도 나머지로 시작하고 실패한 서버는 다시 시도)"""
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*[worker.start() for worker in self.workers], return_exceptions=True)
+        self.startup_seconds = time.perf_counter() - t0
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if len(errors) == len(self.workers):
+            await self.close()
+            raise errors[0]
+        for worker, result in zip(self.workers, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"MCP 서버 #{worker.index} 시작 실패: {result}")
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    @property
+    def tools(self):
+        for worker in self.workers:
+            if worker.healthy:
+                return worker.tools
+        return []
+
+    @asynccontextmanager
+    async def session(self):
+        """대화 1턴 동안 사용할 서버를 배정받음"""
+        t0 = time.perf_counter()
+        async with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    candidates = [w for w in self.workers if w.healthy and w.active < self.sessions_per_server]
+                    if candidates:
+                        worker = min(candidates, key=lambda w: w.active)
+                        worker.active += 1
+                        break
+                    await self._cond.wait()
+            finally:
+                self.waiting -= 1
+        self.queue_waits.append(time.perf_counter() - t0)
+        self.requests += 1
+        try:
+            yield worker
+        except Exception:
+            # 서버 프로세스 문제로 실패했을 수 있으므로 바로 상태 확인
+            asyncio.create_task(self._check(worker.index))
+            raise
+        finally:
+            async with self._cond:
+                worker.active -= 1
+                self._cond.notify()
+
+    async def _check(self, index: int):
+        try:
+            await self.workers[index].ping()
+        except Exception:
+            await self._respawn(index)
+
+    async def _respawn(self, index: int):
+        if index in self._respawning:
+            return
+        self._respawning.add(index)
+        try:
+            old = self.workers[index]
+            await old.close()
+            for attempt in range(3):
+                worker = MCPServerWorker(self.server_path, index)
+                try:
+                    await worker.start()
+                    break
+                except Exception as e:
+                    logger.warning(f"MCP 서버 #{index} 재시작 실패 ({attempt + 1}/3): {e}")
+                    await worker.close()
+                    await asyncio.sleep(2 ** attempt)
+            else:
+                return  # 다음 상태 확인 때 다시 시도
+            self.workers[index] = worker
+            self.respawns += 1
+            logger.info(f"MCP 서버 #{index}를 다시 시작했습니다.")
+            async with self._cond:
+                self._cond.notify_all()
+        finally:
+            self._respawning.discard(index)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(MCP_HEALTH_INTERVAL)
+            await asyncio.gather(*[self._check(i) for i in range(self.size)], return_exceptions=True)
+
+    def metrics(self) -> dict:
+        waits = sorted(self.queue_waits)
+        return {
+            "servers": self.size,
+            "healthy_servers": sum(w.healthy for w in self.workers),
+            "active_sessions": sum(w.active for w in self.workers),
+            "capacity": self.size * self.sessions_per_server,
+            "waiting": self.waiting,
+            "requests": self.requests,
+            "respawns": self.respawns,
+            "queue_wait_ms": {
+                "avg": round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+                "p95": round(waits[int(len(waits) * 0.95)] * 1000, 2) if waits else 0.0,
+                "max": round(waits[-1] * 1000, 2) if waits else 0.0,
+            },
+            "startup_seconds": round(self.startup_seconds, 2) if self.startup_seconds else None,
+        }
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+        await asyncio.gather(*[worker.close() for worker in self.workers], return_exceptions=True)
+
+
 class SimpleMCPClient:
     def __init__(self):
-        self.agent = None
-        self.is_connected = False
-        self.stdio_context = None
-        self.session_context = None
-        self.session = None
+        self.pool: Optional[MCPSessionPool] = None
         
-    async def connect_to_server(self, server_path: str):
-        """MCP 서버에 연결하고 에이전트를 초기화"""
+    @property
+    def is_connected(self) -> bool:
+        return self.pool is not None
+
+    async def connect_to_server(self, server_path: str, pool_size: int = MCP_POOL_SIZE):
+        """MCP 서버 프로세스 풀을 띄우고 에이전트를 초기화"""
         try:
             # 기존 연결이 있으면 해제
             await self.disconnect()
             
-            server_params = StdioServerParameters(
-                command="python",
-                args=[server_path],
-                env={"PYTHONIOENCODING": "utf-8", "PYTHONUNBUFFERED": "1"}
-            )
-            
-            # MCP 클라이언트 연결
-            self.stdio_context = stdio_client(server_params)
-            self.read, self.write = await self.stdio_context.__aenter__()
-            
-            self.session_context = ClientSession(self.read, self.write)
-            self.session = await self.session_context.__aenter__()
-            
-            # 세션 초기화
-            await self.session.initialize()
-            
-            # 도구 로드
-            tools = await load_mcp_tools(self.session)
-            
-            # 에이전트 생성 (올바른 모델명 사용)
-            self.agent = create_react_agent("openai:gpt-4.1-mini", tools)
-            self.is_connected = True
-            
+            tool_cache.clear()
+            pool = MCPSessionPool(server_path, size=pool_size)
+            await pool.start()
+            self.pool = pool
+
+            tools = pool.tools
             tool_names = [tool.name for tool in tools] if tools else []
-            return f"✅ MCP 서버에 성공적으로 연결되었습니다.\n사용 가능한 도구 ({len(tools)}개): {', '.join(tool_names)}"
+            target = f"{server_path} 세션 {pool_size}개" if is_server_url(server_path) else f"MCP 서버 {pool_size}개"
+            return (
+                f"✅ {target}에 연결되었습니다. ({pool.startup_seconds:.1f}초)\n"
+                f"사용 가능한 도구 ({len(tools)}개): {', '.join(tool_names)}"
+            )
             
         except Exception as e:
-            self.is_connected = False
             return f"❌ 연결 실패: {str(e)}\n서버 파일 경로와 권한을 확인해주세요."
     
-    async def process_message(self, message: str):
-        """메시지를 처리하고 응답 반환"""
-        if not self.is_connected or not self.agent:
+    async def process_message(self, message: str, thread_id: str):
+        """메시지를 처리하고 응답 반환 (thread_id별로 대화 상태를 따로 유지)"""
+        if not self.is_connected:
             return "❌ 먼저 MCP 서버에 연결해주세요."
         
         try:
-            # 메시지 형식을 올바르게 구성
             messages = [{"role": "user", "content": message}]
-            response = await self.agent.ainvoke({"messages": messages})
+            async with self.pool.session() as worker:
+                response = await worker.agent.ainvoke(
+                    {"messages": messages},
+                    config={"configurable": {"thread_id": thread_id}},
+                )
             
             # 응답에서 마지막 메시지 추출
             if response and "messages" in response and response["messages"]:
@@ -78,18 +404,63 @@ class SimpleMCPClient:
         except Exception as e:
             return f"❌ 오류가 발생했습니다: {str(e)}"
     
+    async def stream_message(self, message: str, thread_id: str):
+        """에이전트 실행 이벤트를 발생하는 즉시 내보냄
+
+        {"type": "token", "text"} - LLM 응답 토큰
+        {"type": "tool_start", "id", "name", "input"} - 도구 호출 시작
+        {"type": "tool_end", "id", "name", "output", "duration"} - 도구 호출 완료 (duration: 초)
+        {"type": "tool_error", "id", "name", "error", "duration"} - 도구 호출 실패
+        {"type": "error", "text"} - 실행 실패
+        이 제너레이터를 닫거나 실행 중인 태스크를 취소하면 에이전트 루프도 중단됩니다.
+        """
+        if not self.is_connected:
+            yield {"type": "error", "text": "❌ 먼저 MCP 서버에 연결해주세요."}
+            return
+
+        try:
+            messages = [{"role": "user", "content": message}]
+            tool_started = {}
+            async with self.pool.session() as worker:
+                events = worker.agent.astream_events(
+                    {"messages": messages},
+                    config={"configurable": {"thread_id": thread_id}},
+                    version="v2",
+                )
+                async with aclosing(events):
+                    async for event in events:
+                        kind = event["event"]
+                        if kind == "on_chat_model_stream":
+                            text = event["data"]["chunk"].content
+                            if isinstance(text, str) and text:
+                                yield {"type": "token", "text": text}
+                        elif kind == "on_tool_start":
+                            tool_started[event["run_id"]] = time.perf_counter()
+                            yield {"type": "tool_start", "id": event["run_id"], "name": event["name"],
+                                   "input": event["data"].get("input")}
+                        elif kind in ("on_tool_end", "on_tool_error"):
+                            duration = time.perf_counter() - tool_started.pop(event["run_id"], time.perf_counter())
+                            if kind == "on_tool_end":
+                                output = event["data"].get("output")
+                                yield {"type": "tool_end", "id": event["run_id"], "name": event["name"],
+                                       "output": getattr(output, "content", output), "duration": duration}
+                            else:
+                                yield {"type": "tool_error", "id": event["run_id"], "name": event["name"],
+                                       "error": str(event["data"].get("error")), "duration": duration}
+
+        except Exception as e:
+            yield {"type": "error", "text": f"❌ 오류가 발생했습니다: {str(e)}"}
+
+    def metrics(self) -> dict:
+        metrics = self.pool.metrics() if self.pool else {"servers": 0}
+        metrics["tool_cache"] = tool_cache.stats()
+        return metrics
+
     async def disconnect(self):
         """서버 연결 해제"""
-        self.is_connected = False
-        try:
-            if self.session_context:
-                await self.session_context.__aexit__(None, None, None)
-                self.session_context = None
-            if self.stdio_context:
-                await self.stdio_context.__aexit__(None, None, None)
-                self.stdio_context = None
-        except Exception:
-            pass
+        pool, self.pool = self.pool, None
+        if pool:
+            await pool.close()
 
 # 전역 클라이언트 인스턴스와 이벤트 루프
 client = SimpleMCPClient()
@@ -109,72 +480,145 @@ def get_or_create_loop():
         thread.start()
     return loop
 
-def connect_server(server_path):
-    """서버 연결 함수 (동기)"""
+async def run_in_client_loop(coro, timeout: float):
+    """MCP 연결이 있는 이벤트 루프에서 실행하고 결과를 기다림 (Gradio 워커 스레드를 막지 않음)"""
+    future = asyncio.run_coroutine_threadsafe(coro, get_or_create_loop())
+    # 시간 초과나 취소 시 백그라운드 루프의 작업도 함께 취소됨
+    return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+async def stream_in_client_loop(agen, idle_timeout: float):
+    """MCP 연결이 있는 이벤트 루프에서 비동기 제너레이터를 실행하고 항목을 그대로 전달
+
+    호출한 쪽이 취소되거나(중지 버튼, 연결 종료) idle_timeout 동안 새 항목이 없으면
+    백그라운드 루프의 제너레이터도 취소됩니다.
+    """
+    caller_loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async with aclosing(agen):
+                async for item in agen:
+                    caller_loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            caller_loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            caller_loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), get_or_create_loop())
+    try:
+        while True:
+            item = await asyncio.wait_for(queue.get(), idle_timeout)
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        future.cancel()
+
+async def connect_server(server_path, pool_size):
+    """서버 연결 함수"""
     if not server_path.strip():
-        return "❌ 서버 경로를 입력해주세요."
+        return "❌ 서버 경로를 입력해주세요.", client.metrics()
     
     try:
-        event_loop = get_or_create_loop()
-        future = asyncio.run_coroutine_threadsafe(
-            client.connect_to_server(server_path), 
-            event_loop
-        )
-        result = future.result(timeout=30)  # 30초 타임아웃
-        return result
+        result = await run_in_client_loop(client.connect_to_server(server_path, int(pool_size)), timeout=60)
+        return result, client.metrics()
     except asyncio.TimeoutError:
-        return "❌ 연결 시간 초과. 서버가 실행 중인지 확인해주세요."
+        return "❌ 연결 시간 초과. 서버가 실행 중인지 확인해주세요.", client.metrics()
     except Exception as e:
-        return f"❌ 연결 오류: {str(e)}"
+        return f"❌ 연결 오류: {str(e)}", client.metrics()
+
+def format_tool_input(tool_input) -> str:
+    if isinstance(tool_input, dict):
+        return ", ".join(f"{key}={value}" for key, value in tool_input.items())
+    return str(tool_input)
+
+async def chat_response(message, history, streaming, request: gr.Request):
+    """채팅 응답 함수 (사용자 세션마다 대화 상태를 따로 유지)
 
-def chat_response(message, history):
-    """채팅 응답 함수 (동기)"""
+    스트리밍 모드에서는 LLM 토큰과 도구 호출 시작/완료(소요 시간 포함)를 발생하는 즉시 채팅창에 표시합니다.
+    """
     if not message.strip():
-        return history, ""
+        yield history, "", client.metrics()
+        return
     
-    try:
-        event_loop = get_or_create_loop()
-        future = asyncio.run_coroutine_threadsafe(
-            client.process_message(message), 
-            event_loop
-        )
-        response = future.result(timeout=60)  # 60초 타임아웃
+    new_history = history + [{"role": "user", "content": message}]
+    
+    if not streaming:
+        try:
+            response = await run_in_client_loop(
+                client.process_message(message, request.session_hash),
+                timeout=CHAT_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            response = "⏱️ 응답 시간이 초과되었습니다. 다시 시도해주세요."
+        except Exception as e:
+            response = f"❌ 오류: {str(e)}"
         
         # Gradio chatbot의 messages 형식에 맞게 구성
-        new_history = history + [
-            {"role": "user", "content": message},
-            {"role": "assistant", "content": response}
-        ]
-        return new_history, ""
-        
+        new_history.append({"role": "assistant", "content": response})
+        yield new_history, "", client.metrics()
+        return
+    
+    tool_messages = {}  # 도구 호출 id -> 채팅창 메시지
+    answer = None  # 현재 스트리밍 중인 답변 메시지
+    yield new_history, "", client.metrics()
+    try:
+        async for event in stream_in_client_loop(
+            client.stream_message(message, request.session_hash),
+            idle_timeout=CHAT_TIMEOUT,
+        ):
+            if event["type"] == "token":
+                if answer is None:
+                    answer = {"role": "assistant", "content": ""}
+                    new_history.append(answer)
+                answer["content"] += event["text"]
+            elif event["type"] == "tool_start":
+                answer = None  # 도구 호출 뒤의 응답은 새 메시지로 표시
+                tool_messages[event["id"]] = {
+                    "role": "assistant",
+                    "content": f"입력: {format_tool_input(event['input'])}",
+                    "metadata": {"title": f"🛠️ {event['name']}", "status": "pending"},
+                }
+                new_history.append(tool_messages[event["id"]])
+            elif event["type"] in ("tool_end", "tool_error"):
+                tool_message = tool_messages.get(event["id"])
+                if tool_message is None:
+                    continue
+                result = event["output"] if event["type"] == "tool_end" else f"❌ {event['error']}"
+                tool_message["content"] += f"\n결과: {str(result)[:TOOL_OUTPUT_PREVIEW]}"
+                tool_message["metadata"].update(status="done", duration=round(event["duration"], 3))
+            elif event["type"] == "error":
+                new_history.append({"role": "assistant", "content": event["text"]})
+            yield new_history, "", client.metrics()
     except asyncio.TimeoutError:
-        error_msg = "⏱️ 응답 시간이 초과되었습니다. 다시 시도해주세요."
-        new_history = history + [
-            {"role": "user", "content": message},
-            {"role": "assistant", "content": error_msg}
-        ]
-        return new_history, ""
+        new_history.append({"role": "assistant", "content": "⏱️ 응답 시간이 초과되었습니다. 다시 시도해주세요."})
+        yield new_history, "", client.metrics()
     except Exception as e:
-        error_msg = f"❌ 오류: {str(e)}"
-        new_history = history + [
-            {"role": "user", "content": message},
-            {"role": "assistant", "content": error_msg}
-        ]
-        return new_history, ""
-
-def clear_chat():
-    """채팅 내역 지우기"""
+        new_history.append({"role": "assistant", "content": f"❌ 오류: {str(e)}"})
+        yield new_history, "", client.metrics()
+        
+def clear_chat(request: gr.Request):
+    """채팅 내역과 이 사용자의 에이전트 대화 상태 지우기"""
+    checkpointer.delete_thread(request.session_hash)
     return []
 
+def forget_session(request: gr.Request):
+    """사용자가 페이지를 떠나면 에이전트 대화 상태 삭제"""
+    checkpointer.delete_thread(request.session_hash)
+
 def disconnect_server():
     """서버 연결 해제"""
     try:
         event_loop = get_or_create_loop()
         future = asyncio.run_coroutine_threadsafe(client.disconnect(), event_loop)
         future.result(timeout=10)
-        return "🔌 서버 연결이 해제되었습니다."
+        return "🔌 서버 연결이 해제되었습니다.", client.metrics()
     except Exception as e:
-        return f"연결 해제 중 오류: {str(e)}"
+        return f"연결 해제 중 오류: {str(e)}", client.metrics()
 
 # Gradio 인터페이스 구성
 with gr.Blocks(title="MCP Chat Assistant", theme=gr.themes.Soft()) as demo:
@@ -184,10 +628,17 @@ with gr.Blocks(title="MCP Chat Assistant", theme=gr.themes.Soft()) as demo:
     with gr.Row():
         with gr.Column(scale=3):
             server_path = gr.Textbox(
-                label="MCP 서버 경로",
-                placeholder="/path/to/your/server.py",
+                label="MCP 서버 경로 또는 URL",
+                placeholder="/path/to/your/server.py 또는 http://127.0.0.1:8001/mcp",
                 value="math_server.py"
             )
+            pool_size = gr.Slider(
+                label="서버 프로세스 수 (URL이면 세션 수)",
+                minimum=1,
+                maximum=16,
+                step=1,
+                value=MCP_POOL_SIZE
+            )
         with gr.Column(scale=1):
             connect_btn = gr.Button("연결", variant="primary")
             disconnect_btn = gr.Button("연결 해제", variant="secondary")
@@ -215,7 +666,9 @@ with gr.Blocks(title="MCP Chat Assistant", theme=gr.themes.Soft()) as demo:
             )
         with gr.Column(scale=1):
             send_btn = gr.Button("전송", variant="primary")
+            stop_btn = gr.Button("중지", variant="stop")
             clear_btn = gr.Button("대화 지우기")
+            streaming = gr.Checkbox(label="스트리밍", value=True)
     
     # 예시 질문 버튼들
     with gr.Row():
@@ -223,30 +676,38 @@ with gr.Blocks(title="MCP Chat Assistant", theme=gr.themes.Soft()) as demo:
         example_btn2 = gr.Button("예시: 22 더하기 8은 얼마죠?", size="sm")
         example_btn3 = gr.Button("예시: 7과 6을 곱한 값은?", size="sm")
 
+    with gr.Accordion("세션 풀 상태", open=False):
+        pool_status = gr.JSON(value=client.metrics())
+
     # 이벤트 핸들러 연결
     connect_btn.click(
         connect_server,
-        inputs=[server_path],
-        outputs=[status_display]
+        inputs=[server_path, pool_size],
+        outputs=[status_display, pool_status]
     )
     
     disconnect_btn.click(
         disconnect_server,
-        outputs=[status_display]
+        outputs=[status_display, pool_status]
     )
     
-    msg_input.submit(
+    submit_event = msg_input.submit(
         chat_response,
-        inputs=[msg_input, chatbot],
-        outputs=[chatbot, msg_input]
+        inputs=[msg_input, chatbot, streaming],
+        outputs=[chatbot, msg_input, pool_status],
+        concurrency_limit=CONCURRENCY_LIMIT
     )
     
-    send_btn.click(
+    send_event = send_btn.click(
         chat_response,
-        inputs=[msg_input, chatbot],
-        outputs=[chatbot, msg_input]
+        inputs=[msg_input, chatbot, streaming],
+        outputs=[chatbot, msg_input, pool_status],
+        concurrency_limit=CONCURRENCY_LIMIT
     )
     
+    # 실행 중인 응답을 취소하면 에이전트 루프도 중단됨
+    stop_btn.click(None, cancels=[submit_event, send_event])
+    
     clear_btn.click(
         clear_chat,
         outputs=[chatbot]
@@ -266,9 +727,14 @@ with gr.Blocks(title="MCP Chat Assistant", theme=gr.themes.Soft()) as demo:
         outputs=[msg_input]
     )
 
+    # 세션 풀 상태 주기적 갱신, 사용자가 나가면 대화 상태 삭제
+    gr.Timer(5).tick(client.metrics, outputs=[pool_status])
+    demo.unload(forget_session)
+
 if __name__ == "__main__":
     print("🚀 MCP Chat Assistant 시작 중...")
     print("📋 필요한 환경 변수: OPENAI_API_KEY")
+    demo.queue(default_concurrency_limit=CONCURRENCY_LIMIT)
     demo.launch(
         debug=True,
         share=False,
@@ -1,17 +1,179 @@
 # math_server.py
+import ast
+import math
+import operator
+import os
+
+import numpy as np
 from mcp.server.fastmcp import FastMCP
+from mcp.types import ToolAnnotations
+
+from mcp_transport import build_parser, run_server
 
 mcp = FastMCP("Math")
 
-@mcp.tool()
+# 입력이 같으면 결과도 같은 순수 함수 - 클라이언트가 결과를 계속 캐시해도 됨
+PURE = ToolAnnotations(readOnlyHint=True, idempotentHint=True, openWorldHint=False)
+
+# 입력 크기 제한
+MAX_EXPRESSION_LENGTH = 1000  # 수식 최대 길이(글자)
+MAX_RESULT_BITS = 100_000  # 거듭제곱 결과 정수의 최대 비트 수 (약 3만 자리)
+MAX_EXPRESSION_DEPTH = 500  # 수식 트리의 최대 중첩 깊이 (최대 길이의 1+1+...+1 은 통과, - - - ... 1 같은 깊은 중첩은 거부)
+MAX_ARRAY_SIZE = int(os.getenv("MATH_MAX_ARRAY_SIZE", "100000"))  # 배열 1개의 최대 원소 수
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+_UNARY_OPERATORS = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+_FUNCTIONS = {
+    "abs": abs, "round": round, "min": min, "max": max,
+    "sqrt": math.sqrt, "exp": math.exp, "log": math.log, "log10": math.log10,
+    "sin": math.sin, "cos": math.cos, "tan": math.tan,
+    "floor": math.floor, "ceil": math.ceil, "factorial": math.factorial,
+}
+_CONSTANTS = {"pi": math.pi, "e": math.e}
+# 사용자가 자주 쓰는 기호를 파이썬 연산자로 변환
+_SYMBOLS = {"×": "*", "÷": "/", "^": "**", "−": "-"}
+
+
+def _eval_node(node, depth: int = 0):
+    """허용된 노드(숫자, 사칙연산, 거듭제곱, 일부 수학 함수)만 계산"""
+    if depth > MAX_EXPRESSION_DEPTH:
+        raise ValueError(f"수식의 중첩이 너무 깊습니다 (최대 {MAX_EXPRESSION_DEPTH}단계).")
+    depth += 1
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        left, right = _eval_node(node.left, depth), _eval_node(node.right, depth)
+        if isinstance(node.op, ast.Pow) and isinstance(left, int) and isinstance(right, int):
+            if right > 0 and max(left.bit_length(), 1) * right > MAX_RESULT_BITS:
+                raise ValueError("거듭제곱 결과가 너무 큽니다.")
+        if isinstance(node.op, ast.Mult) and isinstance(left, int) and isinstance(right, int):
+            if left.bit_length() + right.bit_length() > MAX_RESULT_BITS:
+                raise ValueError("곱셈 결과가 너무 큽니다.")
+        result = _BINARY_OPERATORS[type(node.op)](left, right)
+        if isinstance(result, complex):
+            # 예: (-8)**0.5 - 음수의 분수 거듭제곱은 실수 결과가 없음
+            raise ValueError("결과가 실수가 아닙니다 (복소수). 음수의 분수 거듭제곱은 계산할 수 없습니다.")
+        return result
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        return _UNARY_OPERATORS[type(node.op)](_eval_node(node.operand, depth))
+    if isinstance(node, ast.Name) and node.id in _CONSTANTS:
+        return _CONSTANTS[node.id]
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id in _FUNCTIONS
+        and not node.keywords
+    ):
+        args = [_eval_node(arg, depth) for arg in node.args]
+        if node.func.id == "factorial" and args and args[0] > 1000:
+            raise ValueError("factorial은 1000 이하의 정수만 계산할 수 있습니다.")
+        return _FUNCTIONS[node.func.id](*args)
+    raise ValueError(f"허용되지 않는 식입니다: {ast.unparse(node)}")
+
+
+def _as_array(values: list[float], name: str) -> np.ndarray:
+    if len(values) > MAX_ARRAY_SIZE:
+        raise ValueError(f"{name}의 원소 수({len(values)})가 최대 {MAX_ARRAY_SIZE}개를 넘습니다.")
+    return np.asarray(values, dtype=np.float64)
+
+
+def _as_pair(a: list[float], b: list[float]) -> tuple[np.ndarray, np.ndarray]:
+    if len(a) != len(b):
+        raise ValueError(f"두 배열의 길이가 다릅니다: {len(a)} != {len(b)}")
+    return _as_array(a, "a"), _as_array(b, "b")
+
+
+@mcp.tool(annotations=PURE)
 def add(a: int, b: int) -> int:
     """Add two numbers"""
     return a + b
 
-@mcp.tool()
+@mcp.tool(annotations=PURE)
 def multiply(a: int, b: int) -> int:
     """Multiply two numbers"""
     return a * b
 
+@mcp.tool(annotations=PURE)
+def evaluate(expression: str) -> float:
+    """Evaluate a whole arithmetic expression in one call, e.g. "3 + 5 * 12" or "(2^10 - 24) / 4".
+
+    Prefer this over chaining add/multiply: any mix of + - * / // % ** (also × ÷ ^),
+    parentheses, unary minus, constants pi/e and the functions abs, round, min, max, sqrt,
+    exp, log, log10, sin, cos, tan, floor, ceil, factorial is computed in a single call
+    with normal operator precedence.
+    Complexity: O(n) in the expression length (max 1000 characters).
+    """
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ValueError(f"수식은 최대 {MAX_EXPRESSION_LENGTH}자까지 입력할 수 있습니다.")
+    for symbol, replacement in _SYMBOLS.items():
+        expression = expression.replace(symbol, replacement)
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"수식을 해석할 수 없습니다: {e.msg}") from None
+    try:
+        return _eval_node(tree.body)
+    except ZeroDivisionError:
+        raise ValueError("0으로 나눌 수 없습니다.") from None
+    except OverflowError:
+        raise ValueError("계산 결과가 너무 큽니다.") from None
+
+@mcp.tool(annotations=PURE)
+def add_arrays(a: list[float], b: list[float]) -> list[float]:
+    """Element-wise sum of two equal-length lists: [a[0]+b[0], a[1]+b[1], ...].
+
+    Complexity: O(n), vectorized. Max 100,000 elements per list.
+    """
+    x, y = _as_pair(a, b)
+    return np.add(x, y).tolist()
+
+@mcp.tool(annotations=PURE)
+def multiply_arrays(a: list[float], b: list[float]) -> list[float]:
+    """Element-wise product of two equal-length lists: [a[0]*b[0], a[1]*b[1], ...].
+
+    Complexity: O(n), vectorized. Max 100,000 elements per list.
+    """
+    x, y = _as_pair(a, b)
+    return np.multiply(x, y).tolist()
+
+@mcp.tool(annotations=PURE)
+def sum_array(values: list[float]) -> float:
+    """Sum of all values in a list (e.g. a column total) in one call.
+
+    Complexity: O(n), vectorized pairwise summation. Max 100,000 elements.
+    """
+    return float(np.sum(_as_array(values, "values")))
+
+@mcp.tool(annotations=PURE)
+def mean_array(values: list[float]) -> float:
+    """Arithmetic mean of a non-empty list in one call.
+
+    Complexity: O(n), vectorized. Max 100,000 elements.
+    """
+    if not values:
+        raise ValueError("빈 배열의 평균은 계산할 수 없습니다.")
+    return float(np.mean(_as_array(values, "values")))
+
+@mcp.tool(annotations=PURE)
+def dot(a: list[float], b: list[float]) -> float:
+    """Dot product of two equal-length lists: sum(a[i] * b[i]), e.g. price × quantity totals.
+
+    Complexity: O(n), vectorized (BLAS). Max 100,000 elements per list.
+    """
+    x, y = _as_pair(a, b)
+    return float(np.dot(x, y))
+
+# streamable HTTP 워커 프로세스가 불러오는 ASGI 앱
+app = mcp.streamable_http_app()
+
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
\ No newline at end of file
+    args = build_parser("Math MCP 서버", default_port=8001).parse_args()
+    run_server(mcp, "math_server:app", args)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+MCP 서버 실행 옵션 (stdio / streamable HTTP)
+
+math_server.py, naver_news_yfinance_server.py 에서 공통으로 사용합니다.
+
+    # 기존처럼 클라이언트가 프로세스를 직접 띄우는 stdio 모드 (기본값)
+    python math_server.py
+
+    # 여러 클라이언트가 공유하는 HTTP 서버 (http://127.0.0.1:8001/mcp)
+    python math_server.py --transport streamable-http --port 8001 --workers 4
+"""
+
+import argparse
+import os
+
+
+def build_parser(description: str, default_port: int = 8000) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--transport", choices=["stdio", "streamable-http"], default="stdio")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=default_port)
+    parser.add_argument("--workers", type=int, default=1, help="HTTP 워커 프로세스 수")
+    parser.add_argument(
+        "--graceful-timeout", type=float, default=10.0,
+        help="종료 신호를 받은 뒤 처리 중인 요청을 기다리는 최대 시간(초)",
+    )
+    return parser
+
+
+def run_server(mcp, app_path: str, args: argparse.Namespace):
+    """명령줄 옵션에 따라 MCP 서버 실행
+
+    Args:
+        mcp: FastMCP 서버
+        app_path: 워커 프로세스가 불러올 ASGI 앱 위치 (예: "math_server:app")
+        args: build_parser()로 읽은 옵션
+    """
+    if args.transport == "stdio":
+        mcp.run(transport="stdio")
+        return
+
+    import uvicorn
+
+    if args.workers > 1:
+        # 같은 세션의 요청이 다른 워커로 갈 수 있으므로 세션 상태를 두지 않는 모드로 실행
+        # (워커 프로세스는 모듈을 다시 불러오므로 환경변수로 FastMCP 설정을 전달)
+        os.environ["FASTMCP_STATELESS_HTTP"] = "true"
+        app = app_path
+    else:
+        app = mcp.streamable_http_app()
+
+    print(f"🌐 streamable HTTP: http://{args.host}:{args.port}{mcp.settings.streamable_http_path} (workers={args.workers})")
+    uvicorn.run(
+        app,
+        host=args.host,
+        port=args.port,
+        workers=args.workers if args.workers > 1 else None,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=mcp.settings.log_level.lower(),
+    )
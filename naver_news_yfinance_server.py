@@ -5,15 +5,26 @@ MCP 서버 - 네이버 뉴스 검색 & 주식 가격 조회
 """
 
 import os
+import json
+import time
+import random
 import asyncio
 import logging
-from typing import Dict, Optional, Any
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Any, Awaitable, Callable, Hashable
 from datetime import datetime, timedelta
 
-import requests
+import httpx
 import yfinance as yf
 from mcp.server.fastmcp import FastMCP
+from mcp.types import ToolAnnotations
 from dotenv import load_dotenv
+import numpy as np
+
+from mcp_transport import build_parser, run_server
+from price_store import open_price_store, period_range
 
 # 환경변수 로드
 load_dotenv()
@@ -21,12 +32,35 @@ load_dotenv()
 # 로깅 설정
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)  # 요청마다 남는 httpx 로그 생략
 
 # FastMCP 서버 초기화
 mcp = FastMCP("news-stock-server")
 
 # 상수 정의
-NAVER_API_BASE = "https://openapi.naver.com/v1/search/news.json"
+NAVER_API_BASE = os.getenv("NAVER_API_BASE", "https://openapi.naver.com/v1/search/news.json")
+NEWS_CACHE_TTL = float(os.getenv("NEWS_CACHE_TTL", "300"))  # 뉴스 검색 결과 캐시 유효 시간(초)
+HTTP_MAX_RETRIES = 3  # 429/5xx 응답 또는 연결 오류 시 재시도 횟수
+HTTP_BACKOFF_BASE = 0.5  # 재시도 대기 시간 기준값(초) - 0.5, 1, 2 ...
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+YF_MAX_WORKERS = int(os.getenv("YF_MAX_WORKERS", "8"))  # yfinance 호출에 사용할 최대 스레드 수
+STOCK_PRICE_CACHE_TTL = float(os.getenv("STOCK_PRICE_CACHE_TTL", "60"))  # 클라이언트가 주가 조회 결과를 재사용할 시간(초)
+STOCK_INFO_TTL = float(os.getenv("STOCK_INFO_TTL", "3600"))  # 종목 메타데이터 캐시 유효 시간(초)
+STOCK_COMPARISON_MAX_SYMBOLS = int(os.getenv("STOCK_COMPARISON_MAX_SYMBOLS", "100"))  # 비교 가능한 최대 종목 수
+FANOUT_LEG_TIMEOUT = float(os.getenv("FANOUT_LEG_TIMEOUT", "15"))  # 복합 도구에서 하위 작업 1개의 기본 제한 시간(초)
+VALID_PERIODS = ["1d", "5d", "1mo", "3mo", "6mo", "1y", "2y", "5y", "10y", "ytd", "max"]
+OUTPUT_MODES = ("records", "columns", "summary")
+RESAMPLE_RULES = {"weekly": "W-FRI", "monthly": "ME"}  # 주봉은 금요일, 월봉은 월말 기준
+OHLCV_AGG = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum",
+             "Dividends": "sum", "Stock Splits": "prod"}
+STOCK_INFO_FIELDS = (
+    "longName", "shortName", "currency", "exchange", "sector", "industry",
+    "marketCap", "trailingPE", "dividendYield",
+)
+
+# 클라이언트 측 도구 결과 캐시용 힌트 (읽기 전용이지만 외부 데이터에 의존하므로 짧은 유효 시간만 허용)
+NEWS_TOOL_ANNOTATIONS = ToolAnnotations(readOnlyHint=True, openWorldHint=True, cacheTtl=NEWS_CACHE_TTL)
+STOCK_TOOL_ANNOTATIONS = ToolAnnotations(readOnlyHint=True, openWorldHint=True, cacheTtl=STOCK_PRICE_CACHE_TTL)
 
 def is_valid_date(date_str: str) -> bool:
     """날짜 형식 검증 함수"""
@@ -40,7 +74,318 @@ class ToolException(Exception):
     """도구 실행 중 발생하는 예외"""
     pass
 
-@mcp.tool()
+
+class TTLCache:
+    """유효 시간(TTL)과 최대 항목 수(LRU)를 가진 간단한 메모리 캐시"""
+
+    def __init__(self, ttl: float, max_items: int = 1024):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key: Hashable, value: Any):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_items:
+            self._data.popitem(last=False)
+
+
+class SingleFlight:
+    """같은 키로 동시에 들어온 요청을 하나의 실행으로 합침"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # 한 호출자가 취소되어도 다른 호출자가 기다리는 실행은 취소되지 않도록 보호
+        return await asyncio.shield(task)
+
+
+# 공유 HTTP 클라이언트 (keep-alive 연결 풀 재사용)
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """프로세스 전체에서 공유하는 비동기 HTTP 클라이언트"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=30),
+        )
+    return _http_client
+
+
+async def http_get_with_retry(url: str, **kwargs) -> httpx.Response:
+    """GET 요청 - 429/5xx 응답과 연결 오류는 지수 백오프로 재시도 (Retry-After 헤더 우선)"""
+    client = get_http_client()
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        try:
+            response = await client.get(url, **kwargs)
+        except httpx.TransportError:
+            if attempt == HTTP_MAX_RETRIES:
+                raise
+            delay = HTTP_BACKOFF_BASE * 2 ** attempt
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or attempt == HTTP_MAX_RETRIES:
+                return response
+            retry_after = response.headers.get("Retry-After", "")
+            delay = float(retry_after) if retry_after.isdigit() else HTTP_BACKOFF_BASE * 2 ** attempt
+        await asyncio.sleep(delay + random.uniform(0, HTTP_BACKOFF_BASE / 2))
+    raise RuntimeError("unreachable")
+
+
+# 뉴스 검색 결과 캐시와 중복 요청 합치기
+news_cache = TTLCache(ttl=NEWS_CACHE_TTL)
+news_single_flight = SingleFlight()
+
+# yfinance는 동기 라이브러리이므로 제한된 크기의 스레드 풀에서 실행하여 이벤트 루프를 막지 않음
+_yf_executor = ThreadPoolExecutor(max_workers=YF_MAX_WORKERS, thread_name_prefix="yfinance")
+
+# 종목 메타데이터(이름, 통화, 섹터 등)는 가격 데이터와 별도로 캐시
+stock_info_cache = TTLCache(ttl=STOCK_INFO_TTL)
+yf_single_flight = SingleFlight()
+
+# 일봉 로컬 저장소 (PRICE_STORE_PATH가 비어 있으면 매번 yfinance에서 조회)
+price_store = open_price_store()
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """동기 함수를 yfinance 전용 스레드 풀에서 실행"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_yf_executor, functools.partial(func, *args, **kwargs))
+
+
+def _fetch_stock_info(symbol: str) -> Dict[str, Any]:
+    info = yf.Ticker(symbol).info
+    return {key: info.get(key) for key in STOCK_INFO_FIELDS if info.get(key) is not None}
+
+
+async def get_stock_info(symbol: str) -> Dict[str, Any]:
+    """종목 메타데이터 조회 (TTL 캐시, 같은 종목 동시 조회는 한 번만 실행)"""
+    key = symbol.strip().upper()
+    info = stock_info_cache.get(key)
+    if info is None:
+        info = await yf_single_flight.run(("info", key), lambda: run_blocking(_fetch_stock_info, symbol))
+        stock_info_cache.set(key, info)
+    return info
+
+
+async def fetch_history(symbol: str, **kwargs):
+    """가격 데이터 조회 (같은 종목·조건의 동시 조회는 한 번만 실행)
+
+    로컬 가격 저장소가 켜져 있으면 저장소에서 읽고, 저장소에 없는 구간만 yfinance에서 받아옵니다.
+    """
+    key = ("history", symbol.strip().upper(), tuple(sorted((k, str(v)) for k, v in kwargs.items())))
+    if price_store is not None:
+        return await yf_single_flight.run(key, lambda: run_blocking(price_store.history, symbol, **kwargs))
+    return await yf_single_flight.run(key, lambda: run_blocking(lambda: yf.Ticker(symbol).history(**kwargs)))
+
+
+async def download_prices(symbols: list, **kwargs) -> Dict[str, Any]:
+    """여러 종목의 일봉을 한 번의 yf.download 호출로 받아 종목별 DataFrame으로 반환 (없으면 None)"""
+    symbols = list(dict.fromkeys(symbols))
+    key = ("download", tuple(sorted(symbols)), tuple(sorted((k, str(v)) for k, v in kwargs.items())))
+
+    def download():
+        return yf.download(
+            symbols,
+            group_by="ticker",
+            auto_adjust=True,  # Ticker.history와 같은 수정 종가
+            actions=True,  # 배당/분할 (가격 저장소의 수정주가 변경 감지용)
+            threads=True,
+            progress=False,
+            **kwargs,
+        )
+
+    data = await yf_single_flight.run(key, lambda: run_blocking(download))
+    frames = {}
+    for symbol in symbols:
+        if data is None or data.empty:
+            frames[symbol] = None
+        elif data.columns.nlevels > 1:
+            frames[symbol] = data[symbol].dropna(subset=["Close"]) if symbol in data.columns.get_level_values(0) else None
+        else:
+            frames[symbol] = data.dropna(subset=["Close"])
+    return frames
+
+
+async def download_closes(symbols: list, period: str) -> Dict[str, Any]:
+    """여러 종목의 종가를 종목별 Series로 반환
+
+    가격 저장소가 켜져 있으면 저장소에 없는 구간이 있는 종목만 모아 한 번에 내려받아 저장한 뒤 저장소에서 읽습니다.
+    """
+    tickers = {symbol: symbol.strip().upper() for symbol in symbols}
+    if price_store is None:
+        frames = await download_prices(list(tickers.values()), period=period)
+        return {
+            symbol: frames[ticker]["Close"] if frames[ticker] is not None else None
+            for symbol, ticker in tickers.items()
+        }
+
+    start, end, last_n = period_range(period)
+    unique = list(dict.fromkeys(tickers.values()))
+    not_found = set()  # 내려받은 데이터가 없는 종목 (잘못된 심볼 등)
+    for attempt in range(2):
+        invalidations = price_store.invalidations
+        missing = await run_blocking(lambda: {t: price_store.missing_ranges(t, start, end) for t in unique})
+        stale = [t for t in unique if missing[t] and t not in not_found]
+        if attempt == 0:
+            if stale:
+                price_store.misses += 1
+            else:
+                price_store.hits += 1
+        if not stale:
+            break
+        # 누락 구간을 모두 덮는 한 구간으로 한 번에 내려받음
+        starts = [range_start for t in stale for range_start, _ in missing[t]]
+        fetch_start = None if None in starts else min(starts)
+        frames = await download_prices(stale, **({"period": "max"} if fetch_start is None else {"start": fetch_start, "end": end}))
+        price_store.downloads += 1
+        not_found.update(t for t in stale if frames[t] is None or frames[t].empty)
+        await run_blocking(lambda: [price_store.write(t, frames[t], fetch_start, end) for t in stale])
+        # 배당/분할로 저장 데이터를 버린 종목이 있을 때만 비게 된 구간을 한 번 더 채움
+        if price_store.invalidations == invalidations:
+            break
+
+    frames = await run_blocking(lambda: {t: price_store.read(t, start, end) for t in unique})
+    return {
+        symbol: frames[ticker]["Close"].iloc[-last_n:] if last_n else frames[ticker]["Close"]
+        for symbol, ticker in tickers.items()
+    }
+
+
+def resample_ohlcv(price_data, resample: str):
+    """일봉 데이터를 주봉/월봉으로 변환 (거래가 없는 구간은 제외)"""
+    agg = {col: OHLCV_AGG.get(col, "last") for col in price_data.columns}
+    if "Stock Splits" in agg:
+        # 분할이 없는 날은 0으로 기록되므로 1로 바꿔 곱한 뒤 다시 0으로 되돌림
+        price_data = price_data.assign(**{"Stock Splits": price_data["Stock Splits"].replace(0, 1)})
+    bars = price_data.resample(RESAMPLE_RULES[resample]).agg(agg).dropna(subset=["Close"])
+    if "Stock Splits" in bars:
+        bars["Stock Splits"] = bars["Stock Splits"].replace(1, 0)
+    return bars
+
+
+def lttb_indices(values, max_points: int) -> np.ndarray:
+    """LTTB(Largest-Triangle-Three-Buckets)로 모양을 유지하며 max_points개 지점의 인덱스를 선택"""
+    y = np.asarray(values, dtype=float)
+    n = len(y)
+    if max_points >= n or max_points < 3:
+        return np.arange(n) if max_points >= n else np.linspace(0, n - 1, max(max_points, 1)).astype(int)
+
+    x = np.arange(n, dtype=float)
+    # 첫/마지막 점은 고정하고 나머지를 max_points - 2개 구간으로 나눔
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    selected = np.empty(max_points, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        # 다음 구간의 평균점 (마지막 구간은 마지막 점)
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        # 이전 선택점 a, 후보점, 다음 구간 평균점으로 만든 삼각형 넓이가 가장 큰 후보 선택
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def summarize_prices(price_data) -> Dict[str, Any]:
+    """기간 전체를 요약한 통계 (행 데이터 없이)"""
+    close = price_data["Close"]
+    first, last = float(close.iloc[0]), float(close.iloc[-1])
+    returns = close.pct_change().dropna()
+    summary = {
+        "start_date": price_data.index[0].strftime('%Y-%m-%d'),
+        "end_date": price_data.index[-1].strftime('%Y-%m-%d'),
+        "first_close": first,
+        "last_close": last,
+        "change": last - first,
+        "change_percent": (last / first - 1) * 100 if first else None,
+        "high": float(price_data["High"].max()),
+        "high_date": price_data["High"].idxmax().strftime('%Y-%m-%d'),
+        "low": float(price_data["Low"].min()),
+        "low_date": price_data["Low"].idxmin().strftime('%Y-%m-%d'),
+        "average_close": float(close.mean()),
+        "daily_volatility_percent": float(returns.std() * 100) if len(returns) > 1 else None,
+    }
+    if "Volume" in price_data:
+        summary["total_volume"] = int(price_data["Volume"].sum())
+        summary["average_volume"] = float(price_data["Volume"].mean())
+    return summary
+
+
+async def fan_out(
+    legs: Dict[str, Callable[[], Awaitable[Any]]],
+    timeouts: Optional[Dict[str, float]] = None,
+    default_timeout: float = FANOUT_LEG_TIMEOUT,
+) -> Dict[str, Any]:
+    """복합 도구의 하위 작업(leg)을 동시에 실행하고 끝난 것만 모아 반환
+
+    각 leg는 자신의 제한 시간 안에서 실행되며, 한 leg의 실패나 시간 초과는 다른 leg에 영향을 주지 않습니다.
+    호출한 쪽이 취소되면(클라이언트 연결 종료 등) 실행 중인 leg도 모두 취소됩니다.
+
+    Returns:
+        {"results": {이름: 결과}, "errors": {이름: {"type", "message"}}, "timings": {이름: 초}, "elapsed": 초}
+        도구가 {"error": ...} 형태로 실패를 반환한 경우 결과와 오류에 모두 기록됩니다.
+    """
+    timeouts = timeouts or {}
+
+    async def run_leg(name: str, factory: Callable[[], Awaitable[Any]]):
+        timeout = timeouts.get(name, default_timeout)
+        t0 = time.perf_counter()
+        try:
+            value = await asyncio.wait_for(factory(), timeout)
+        except asyncio.TimeoutError:
+            return name, None, {"type": "timeout", "message": f"{timeout}초 안에 완료되지 않았습니다."}, time.perf_counter() - t0
+        except Exception as e:
+            return name, None, {"type": type(e).__name__, "message": str(e)}, time.perf_counter() - t0
+        error = None
+        if isinstance(value, dict) and "error" in value:
+            error = {"type": "tool_error", "message": str(value["error"])}
+        return name, value, error, time.perf_counter() - t0
+
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(run_leg(name, factory)) for name, factory in legs.items()]
+    try:
+        finished = await asyncio.gather(*tasks)
+    finally:
+        # 호출자가 취소된 경우 남은 leg를 정리
+        for task in tasks:
+            task.cancel()
+
+    outcome = {"results": {}, "errors": {}, "timings": {}, "elapsed": time.perf_counter() - start}
+    for name, value, error, seconds in finished:
+        outcome["timings"][name] = round(seconds, 4)
+        if value is not None:
+            outcome["results"][name] = value
+        if error is not None:
+            outcome["errors"][name] = error
+            logger.warning(f"fan-out leg '{name}' 실패: {error['type']} - {error['message']}")
+    return outcome
+
+
+@mcp.tool(annotations=NEWS_TOOL_ANNOTATIONS)
 async def naver_news_search(query: str, display: int = 10, start: int = 1, sort: str = "date") -> Dict[str, Any]:
     """
     네이버 검색 API를 사용하여 뉴스 검색 결과를 조회합니다.
@@ -77,12 +422,24 @@ async def naver_news_search(query: str, display: int = 10, start: int = 1, sort:
         "sort": sort if sort in ["date", "sim"] else "date"
     }
     
+    cache_key = (query, params["display"], params["start"], params["sort"])
+
+    async def fetch():
+        response = await http_get_with_retry(NAVER_API_BASE, headers=headers, params=params)
+        return response.status_code, response.json()
+
     try:
-        response = requests.get(NAVER_API_BASE, headers=headers, params=params, timeout=10)
-        
+        cached = news_cache.get(cache_key)
+        if cached is None:
+            status_code, data = await news_single_flight.run(cache_key, fetch)
+            if status_code == 200:
+                news_cache.set(cache_key, (status_code, data))
+        else:
+            status_code, data = cached
+
         return {
-            "data": response.json(),
-            "status_code": response.status_code,
+            "data": data,
+            "status_code": status_code,
             "query_info": {
                 "검색어": query,
                 "출력건수": params["display"],
@@ -90,49 +447,65 @@ async def naver_news_search(query: str, display: int = 10, start: int = 1, sort:
                 "정렬방식": params["sort"]
             }
         }
-    except requests.exceptions.RequestException as e:
+    except (httpx.HTTPError, ValueError) as e:
         logger.error(f"네이버 API 요청 중 오류 발생: {e}")
         return {
             "error": f"API 요청 중 오류가 발생했습니다: {str(e)}",
             "status_code": 500
         }
 
-@mcp.tool()
-async def get_stock_price(symbol: str, date: Optional[str] = None, period: str = "5d") -> Dict[str, Any]:
+@mcp.tool(annotations=STOCK_TOOL_ANNOTATIONS)
+async def get_stock_price(
+    symbol: str,
+    date: Optional[str] = None,
+    period: str = "5d",
+    output: str = "records",
+    resample: Optional[str] = None,
+    max_points: Optional[int] = None,
+) -> Dict[str, Any]:
     """
     yfinance를 사용하여 특정 날짜 또는 기간의 주식 가격 정보를 조회합니다.
+    기간이 긴 경우(1y 이상) output="summary" 또는 resample/max_points로 응답 크기를 줄이는 것을 권장합니다.
     
     Args:
         symbol: 주식 심볼 (예: "AAPL", "TSLA", "005930.KS")
         date: 특정 날짜 (YYYY-MM-DD 형식, 선택사항)
         period: 조회 기간 (1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max)
+        output: 기간 데이터 형식
+            - records: 행마다 {컬럼: 값} 딕셔너리 목록 (기본값)
+            - columns: 컬럼별 배열 {"Date": [...], "Close": [...], ...}
+            - summary: 기간 요약 통계만 반환 (행 데이터 없음)
+        resample: 일봉을 주봉/월봉으로 변환 (weekly, monthly, 선택사항)
+        max_points: 기간 데이터 최대 행 수 - 넘으면 종가 모양을 유지하도록 LTTB 방식으로 솎아냄 (선택사항)
     
     Returns:
-        주식 가격 정보를 포함한 딕셔너리
+        주식 가격 정보를 포함한 딕셔너리 (payload에 기간 데이터의 JSON 크기와 직렬화 시간 포함)
     """
     
     # 날짜 형식 검증
     if date and not is_valid_date(date):
         raise ToolException(f"잘못된 날짜 형식입니다: {date}. YYYY-MM-DD 형식을 사용해주세요.")
+    if output not in OUTPUT_MODES:
+        raise ToolException(f"잘못된 output 값입니다: {output}. {', '.join(OUTPUT_MODES)} 중에서 선택해주세요.")
+    if resample and resample not in RESAMPLE_RULES:
+        raise ToolException(f"잘못된 resample 값입니다: {resample}. {', '.join(RESAMPLE_RULES)} 중에서 선택해주세요.")
     
     try:
-        stock = yf.Ticker(symbol)
-        
-        # 주식 정보 가져오기
-        info = stock.info
-        stock_name = info.get('longName', info.get('shortName', symbol))
-        
-        # 특정 날짜의 주식 가격 정보 조회
+        # 특정 날짜의 주식 가격 정보 조회 (메타데이터와 가격 데이터를 동시에 조회)
         if date:
             start_date = datetime.strptime(date, "%Y-%m-%d")
             end_date = start_date + timedelta(days=1)
-            price_data = stock.history(start=start_date, end=end_date)
+            info, price_data = await asyncio.gather(
+                get_stock_info(symbol),
+                fetch_history(symbol, start=start_date, end=end_date),
+            )
+            stock_name = info.get('longName', info.get('shortName', symbol))
             
             # 가격 정보가 없으면 해당 날짜로부터 과거 5일간의 데이터 조회
             if price_data.empty:
                 end_date = start_date
                 start_date = start_date - timedelta(days=5)
-                price_data = stock.history(start=start_date, end=end_date)
+                price_data = await fetch_history(symbol, start=start_date, end=end_date)
                 
                 if price_data.empty:
                     return {
@@ -143,11 +516,14 @@ async def get_stock_price(symbol: str, date: Optional[str] = None, period: str =
                     }
         else:
             # 특정 날짜가 없으면 지정된 기간의 데이터 조회
-            valid_periods = ["1d", "5d", "1mo", "3mo", "6mo", "1y", "2y", "5y", "10y", "ytd", "max"]
-            if period not in valid_periods:
+            if period not in VALID_PERIODS:
                 period = "5d"
             
-            price_data = stock.history(period=period)
+            info, price_data = await asyncio.gather(
+                get_stock_info(symbol),
+                fetch_history(symbol, period=period),
+            )
+            stock_name = info.get('longName', info.get('shortName', symbol))
         
         if price_data.empty:
             return {
@@ -156,15 +532,10 @@ async def get_stock_price(symbol: str, date: Optional[str] = None, period: str =
                 "stock_name": stock_name
             }
         
-        # 데이터프레임을 딕셔너리로 변환
-        df = price_data.reset_index()
-        df['Date'] = df['Date'].dt.strftime('%Y-%m-%d')
-        
-        # 최신 데이터 (마지막 행)
-        latest_data = df.iloc[-1].to_dict()
-        
-        # 전체 기간 데이터
-        all_data = df.to_dict(orient='records')
+        # 최신 데이터 (마지막 일봉 - 변환/솎아내기 전 기준)
+        latest = price_data.iloc[[-1]].reset_index()
+        latest['Date'] = latest['Date'].dt.strftime('%Y-%m-%d')
+        latest_data = latest.iloc[0].to_dict()
         
         # 기본 주식 정보
         stock_info = {
@@ -182,9 +553,41 @@ async def get_stock_price(symbol: str, date: Optional[str] = None, period: str =
         result = {
             "stock_info": stock_info,
             "latest_price": latest_data,
-            "period_data": all_data,
             "data_period": period if not date else f"around {date}",
-            "total_records": len(all_data)
+            "output": output,
+        }
+        
+        if output == "summary":
+            result["summary"] = summarize_prices(price_data)
+            result["total_records"] = len(price_data)
+            payload_key = "summary"
+        else:
+            source_records = len(price_data)
+            if resample:
+                price_data = resample_ohlcv(price_data, resample)
+                result["resample"] = resample
+            if max_points and len(price_data) > max_points:
+                price_data = price_data.iloc[lttb_indices(price_data["Close"].to_numpy(), max_points)]
+                result["downsampled"] = True
+            
+            df = price_data.reset_index()
+            df['Date'] = df['Date'].dt.strftime('%Y-%m-%d')
+            if output == "columns":
+                result["period_data"] = {col: df[col].tolist() for col in df.columns}
+            else:
+                # 전체 기간 데이터
+                result["period_data"] = df.to_dict(orient='records')
+            result["total_records"] = len(df)
+            if len(df) != source_records:
+                result["source_records"] = source_records
+            payload_key = "period_data"
+        
+        # 응답 데이터 크기와 직렬화 시간 측정
+        t0 = time.perf_counter()
+        payload_bytes = len(json.dumps(result[payload_key], ensure_ascii=False, default=str).encode("utf-8"))
+        result["payload"] = {
+            "bytes": payload_bytes,
+            "serialization_ms": round((time.perf_counter() - t0) * 1000, 3),
         }
         
         return result
@@ -193,43 +596,62 @@ async def get_stock_price(symbol: str, date: Optional[str] = None, period: str =
         logger.error(f"주식 데이터 조회 중 오류 발생: {e}")
         raise ToolException(f"주식 데이터 조회 중 오류가 발생했습니다: {str(e)}")
 
-@mcp.tool()
-async def get_stock_comparison(symbols: list, period: str = "1mo") -> Dict[str, Any]:
+@mcp.tool(annotations=STOCK_TOOL_ANNOTATIONS)
+async def get_stock_comparison(symbols: list, period: str = "1mo", max_symbols: int = 10) -> Dict[str, Any]:
     """
     여러 주식의 가격 정보를 비교합니다.
     
     Args:
         symbols: 주식 심볼 리스트 (예: ["AAPL", "MSFT", "GOOGL"])
         period: 조회 기간 (1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max)
+        max_symbols: 한 번에 비교할 최대 종목 수 (기본값: 10, 서버 설정 상한까지 늘릴 수 있음)
     
     Returns:
         여러 주식의 비교 정보를 포함한 딕셔너리
     """
     
-    if not symbols or len(symbols) == 0:
+    # 대소문자/공백만 다른 심볼은 한 종목으로 보고 입력 순서대로 중복 제거 (중복이 종목 수 한도에 잡히지 않도록)
+    symbols = list(dict.fromkeys(symbol.strip().upper() for symbol in symbols or [] if symbol and symbol.strip()))
+    
+    if not symbols:
         return {"error": "비교할 주식 심볼을 최소 1개 이상 입력해주세요."}
     
-    if len(symbols) > 10:
-        return {"error": "한 번에 최대 10개의 주식만 비교할 수 있습니다."}
+    max_symbols = min(max(max_symbols, 1), STOCK_COMPARISON_MAX_SYMBOLS)
+    
+    if len(symbols) > max_symbols:
+        return {"error": f"한 번에 최대 {max_symbols}개의 주식만 비교할 수 있습니다."}
+    
+    if period not in VALID_PERIODS:
+        period = "1mo"
+    
+    # 전체 종목의 가격은 한 번에 내려받고, 메타데이터는 종목별로 동시에 조회 (캐시 사용)
+    price_result, *info_results = await asyncio.gather(
+        download_closes(symbols, period),
+        *[get_stock_info(symbol) for symbol in symbols],
+        return_exceptions=True,
+    )
     
     comparison_data = {}
     
-    for symbol in symbols:
-        try:
-            result = await get_stock_price(symbol, period=period)
-            if "error" not in result:
-                comparison_data[symbol] = {
-                    "name": result["stock_info"]["stock_name"],
-                    "latest_price": result["latest_price"]["Close"],
-                    "latest_date": result["latest_price"]["Date"],
-                    "currency": result["stock_info"]["currency"],
-                    "market_cap": result["stock_info"]["market_cap"],
-                    "pe_ratio": result["stock_info"]["pe_ratio"]
-                }
-            else:
-                comparison_data[symbol] = {"error": result["error"]}
-        except Exception as e:
-            comparison_data[symbol] = {"error": str(e)}
+    for symbol, info in zip(symbols, info_results):
+        if isinstance(price_result, Exception):
+            comparison_data[symbol] = {"error": str(price_result)}
+            continue
+        closes = price_result.get(symbol)
+        if closes is None or closes.empty:
+            comparison_data[symbol] = {"error": f"{symbol}에 대한 주식 데이터를 찾을 수 없습니다. 심볼을 확인해주세요."}
+            continue
+        if isinstance(info, Exception):
+            info = {}
+        # 비교에 필요한 요약 값만 계산
+        comparison_data[symbol] = {
+            "name": info.get('longName', info.get('shortName', symbol)),
+            "latest_price": float(closes.iloc[-1]),
+            "latest_date": closes.index[-1].strftime('%Y-%m-%d'),
+            "currency": info.get('currency', 'USD'),
+            "market_cap": info.get('marketCap', 'Unknown'),
+            "pe_ratio": info.get('trailingPE', 'Unknown')
+        }
     
     return {
         "comparison_period": period,
@@ -238,7 +660,7 @@ async def get_stock_comparison(symbols: list, period: str = "1mo") -> Dict[str,
         "successful_queries": len([s for s in comparison_data.values() if "error" not in s])
     }
 
-@mcp.tool()
+@mcp.tool(annotations=STOCK_TOOL_ANNOTATIONS)
 async def get_market_news_and_stock(query: str, stock_symbol: str) -> Dict[str, Any]:
     """
     특정 키워드로 뉴스를 검색하고 관련 주식 정보를 함께 조회합니다.
@@ -249,24 +671,32 @@ async def get_market_news_and_stock(query: str, stock_symbol: str) -> Dict[str,
     
     Returns:
         뉴스 검색 결과와 주식 정보를 포함한 딕셔너리
+        (실패하거나 시간 초과된 항목은 None이며 errors에 원인, timings에 항목별 소요 시간이 기록됨)
     """
     
-    # 뉴스 검색
-    news_result = await naver_news_search(query, display=5)
-    
-    # 주식 정보 조회
-    stock_result = await get_stock_price(stock_symbol)
+    # 뉴스 검색과 주식 정보 조회를 동시에 실행 (한쪽이 실패하거나 지연돼도 다른 쪽 결과는 반환)
+    outcome = await fan_out({
+        "news_data": lambda: naver_news_search(query, display=5),
+        "stock_data": lambda: get_stock_price(stock_symbol),
+    })
     
     return {
         "query": query,
         "stock_symbol": stock_symbol,
-        "news_data": news_result,
-        "stock_data": stock_result,
+        "news_data": outcome["results"].get("news_data"),
+        "stock_data": outcome["results"].get("stock_data"),
+        "errors": outcome["errors"],
+        "timings": outcome["timings"],
         "analysis_timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
 
+# streamable HTTP 워커 프로세스가 불러오는 ASGI 앱
+app = mcp.streamable_http_app()
+
 # 서버 실행
 if __name__ == "__main__":
+    args = build_parser("뉴스-주식 MCP 서버", default_port=8002).parse_args()
+    
     # 환경변수 확인
     print("🚀 MCP 뉴스-주식 서버를 시작합니다...")
     
@@ -277,11 +707,15 @@ if __name__ == "__main__":
     else:
         print("✅ 네이버 API 키가 설정되었습니다.")
     
+    if price_store is not None:
+        # stdio 전송에서는 stdout 이 MCP JSON-RPC 채널이므로 로그(stderr)로 남김
+        logger.info(f"💾 가격 저장소: {price_store.path}")
+    
     print("📊 사용 가능한 도구:")
     print("   - naver_news_search: 네이버 뉴스 검색")
     print("   - get_stock_price: 주식 가격 조회")
     print("   - get_stock_comparison: 여러 주식 비교")
     print("   - get_market_news_and_stock: 뉴스 + 주식 통합 조회")
     
-    # MCP 서버 실행
-    mcp.run(transport='stdio')
\ No newline at end of file
+    # MCP 서버 실행 (기본값 stdio, --transport streamable-http 로 HTTP 서버 실행)
+    run_server(mcp, "naver_news_yfinance_server:app", args)
\ No newline at end of file
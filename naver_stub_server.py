@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+네이버 뉴스 검색 API 스텁 서버
+실제 API 키나 네트워크 없이 naver_news_search 도구의 동시 호출 처리량을 측정할 때 사용합니다.
+
+    # 스텁 서버만 실행 (NAVER_API_BASE=http://127.0.0.1:8765/v1/search/news.json 으로 지정)
+    python naver_stub_server.py --port 8765
+
+    # 스텁 서버를 띄우고 naver_news_search 동시 호출 부하 테스트
+    python naver_stub_server.py --bench --calls 200 --queries 20
+"""
+
+import json
+import random
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubNaverServer(ThreadingHTTPServer):
+    """응답 지연과 오류(429/503) 비율을 조절할 수 있는 스텁 서버"""
+
+    daemon_threads = True
+    request_queue_size = 128  # 동시 연결이 많아도 접속이 거부되지 않도록
+
+    def __init__(self, address, latency: float = 0.05, error_rate: float = 0.0):
+        super().__init__(address, StubNaverHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.request_count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/search/news.json"
+
+
+class StubNaverHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive 연결 재사용 확인용
+
+    def do_GET(self):
+        server: StubNaverServer = self.server
+        with server._lock:
+            server.request_count += 1
+
+        parsed = urlparse(self.path)
+        if parsed.path != "/v1/search/news.json":
+            self._send(404, {"errorMessage": "Not Found"})
+            return
+        if not self.headers.get("X-Naver-Client-Id"):
+            self._send(401, {"errorMessage": "Authentication failed", "errorCode": "024"})
+            return
+
+        time.sleep(server.latency)
+        if random.random() < server.error_rate:
+            status = random.choice([429, 503])
+            self._send(status, {"errorMessage": "stub error", "errorCode": str(status)}, {"Retry-After": "0"})
+            return
+
+        params = parse_qs(parsed.query)
+        query = params.get("query", [""])[0]
+        display = int(params.get("display", ["10"])[0])
+        start = int(params.get("start", ["1"])[0])
+        items = [
+            {
+                "title": f"<b>{query}</b> 관련 뉴스 {start + i}",
+                "originallink": f"https://news.example.com/{start + i}",
+                "link": f"https://n.news.naver.com/article/{start + i}",
+                "description": f"{query}에 대한 스텁 기사 본문입니다.",
+                "pubDate": formatdate(localtime=True),
+            }
+            for i in range(display)
+        ]
+        self._send(200, {
+            "lastBuildDate": formatdate(localtime=True),
+            "total": 1000,
+            "start": start,
+            "display": display,
+            "items": items,
+        })
+
+    def _send(self, status: int, body: dict, headers: dict | None = None):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass  # 요청 로그 출력 생략
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, latency: float = 0.05, error_rate: float = 0.0):
+    """백그라운드 스레드에서 스텁 서버를 실행하고 서버 객체를 반환 (port=0이면 빈 포트 사용)"""
+    server = StubNaverServer((host, port), latency=latency, error_rate=error_rate)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+async def run_bench(server: StubNaverServer, calls: int, queries: int) -> dict:
+    """naver_news_search를 동시에 calls번 호출하고 처리량과 실제 업스트림 요청 수를 반환"""
+    import asyncio
+    import os
+
+    os.environ.setdefault("NAVER_CLIENT_ID", "stub")
+    os.environ.setdefault("NAVER_CLIENT_SECRET", "stub")
+    import naver_news_yfinance_server as news_server
+
+    news_server.NAVER_API_BASE = server.url
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*[
+        news_server.naver_news_search(f"검색어{i % queries}", display=10) for i in range(calls)
+    ])
+    elapsed = time.perf_counter() - t0
+    return {
+        "calls": calls,
+        "elapsed": elapsed,
+        "calls_per_second": calls / elapsed,
+        "upstream_requests": server.request_count,
+        "errors": sum(1 for r in results if r.get("status_code") != 200),
+        "cache_hits": news_server.news_cache.hits,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="네이버 뉴스 검색 API 스텁 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="응답 지연(초)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="429/503 응답 비율 (0~1)")
+    parser.add_argument("--bench", action="store_true", help="스텁 서버를 띄우고 부하 테스트 실행")
+    parser.add_argument("--calls", type=int, default=200, help="부하 테스트 동시 호출 수")
+    parser.add_argument("--queries", type=int, default=20, help="부하 테스트에 사용할 서로 다른 검색어 수")
+    args = parser.parse_args()
+
+    if args.bench:
+        stub = start_stub_server(args.host, 0, args.latency, args.error_rate)
+        print(asyncio.run(run_bench(stub, args.calls, args.queries)))
+        stub.shutdown()
+    else:
+        stub = StubNaverServer((args.host, args.port), latency=args.latency, error_rate=args.error_rate)
+        print(f"🧪 스텁 서버 실행 중: {stub.url}")
+        stub.serve_forever()
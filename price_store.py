@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+로컬 일봉(OHLCV) 가격 저장소
+
+지난 일봉은 바뀌지 않으므로 한 번 받은 데이터는 SQLite에 종목/날짜 단위로 저장하고,
+다음 조회부터는 저장소에 없는 구간(주로 마지막 저장일 이후)만 내려받습니다.
+
+- 종목별로 "확정된 구간"(coverage)들을 기록하여 휴장일처럼 데이터가 없는 날도 다시 조회하지 않음
+- 확정 구간은 여러 개를 두고 맞닿거나 겹치면 합침 (떨어진 날짜를 조회해도 사이를 채우지 않고, 기존 구간도 버리지 않음)
+- 최근 며칠(장중 변동 가능 구간)은 tail_ttl 동안만 재사용하고 이후 다시 내려받음
+- 배당/분할이 새로 생기면 수정주가가 바뀌므로 해당 종목의 이전 데이터를 버리고 다시 받음
+- WAL 모드 + 스레드별 연결로 여러 스레드/프로세스가 동시에 읽을 수 있음
+- downloader를 주입할 수 있어 네트워크 없이 테스트 가능
+
+    # 가짜 downloader로 반복 장기 조회 시간 측정
+    python price_store.py --bench
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PRICE_STORE_PATH = os.getenv("PRICE_STORE_PATH", "./.cache/prices.sqlite3")  # 빈 값이면 저장소 사용 안 함
+PRICE_STORE_TAIL_TTL = float(os.getenv("PRICE_STORE_TAIL_TTL", "300"))  # 최근 구간 재사용 시간(초)
+FINAL_LAG_DAYS = 2  # 오늘 기준 이 일수 이전의 일봉만 확정된 것으로 취급 (시차/장중 변동 고려)
+MIN_DATE = "1900-01-01"  # period="max"로 받은 구간의 시작
+COLUMNS = ("Open", "High", "Low", "Close", "Volume", "Dividends", "Stock Splits")
+
+# 날짜 구간 [시작일, 종료일)
+Range = Tuple[str, str]
+
+# (종목, 시작일 또는 None(전체), 종료일(미포함)) -> yfinance 형식 DataFrame
+Downloader = Callable[[str, Optional[str], str], pd.DataFrame]
+
+
+def yfinance_downloader(symbol: str, start: Optional[str], end: str) -> pd.DataFrame:
+    """yfinance에서 [start, end) 구간 일봉 조회 (start가 None이면 상장 이후 전체)"""
+    import yfinance as yf
+
+    ticker = yf.Ticker(symbol)
+    if start is None:
+        return ticker.history(period="max")
+    return ticker.history(start=start, end=end)
+
+
+def _to_date(value) -> str:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value[:10]
+    return value.strftime("%Y-%m-%d")
+
+
+def subtract_ranges(start: str, end: str, ranges: List[Range]) -> List[Range]:
+    """[start, end) 에서 정렬된 구간 목록 ranges 가 덮지 않는 부분"""
+    gaps = []
+    cursor = start
+    for range_start, range_end in ranges:
+        if range_end <= cursor:
+            continue
+        if range_start >= end:
+            break
+        if range_start > cursor:
+            gaps.append((cursor, range_start))
+        cursor = range_end
+        if cursor >= end:
+            break
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def period_range(period: str, today: Optional[date] = None) -> Tuple[Optional[str], str, Optional[int]]:
+    """yfinance period를 (시작일, 종료일(미포함), 마지막 N개 행) 으로 변환
+
+    "1d", "5d"는 거래일 기준이므로 넉넉한 달력 구간을 조회한 뒤 마지막 N개 행만 사용합니다.
+    """
+    today = today or date.today()
+    end = (today + timedelta(days=1)).isoformat()
+    if period == "max":
+        return None, end, None
+    if period == "ytd":
+        return date(today.year, 1, 1).isoformat(), end, None
+    if period.endswith("d"):
+        days = int(period[:-1])
+        return (today - timedelta(days=days * 2 + 7)).isoformat(), end, days
+    if period.endswith("mo"):
+        offset = pd.DateOffset(months=int(period[:-2]))
+    elif period.endswith("y"):
+        offset = pd.DateOffset(years=int(period[:-1]))
+    else:
+        raise ValueError(f"지원하지 않는 기간입니다: {period}")
+    return (pd.Timestamp(today) - offset).strftime("%Y-%m-%d"), end, None
+
+
+class PriceStore:
+    """종목/날짜 단위 일봉 저장소
+
+    Args:
+        path: SQLite 파일 경로
+        downloader: 누락 구간을 받아올 함수 (기본값: yfinance)
+        tail_ttl: 확정되지 않은 최근 구간을 다시 받기 전까지 재사용할 시간(초)
+    """
+
+    def __init__(self, path: str, downloader: Downloader = yfinance_downloader, tail_ttl: float = PRICE_STORE_TAIL_TTL):
+        self.path = path
+        self.downloader = downloader
+        self.tail_ttl = tail_ttl
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self.hits = 0  # 다운로드 없이 저장소만으로 응답한 조회
+        self.misses = 0
+        self.downloads = 0
+        self.invalidations = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS bars ("
+            " symbol TEXT NOT NULL, date TEXT NOT NULL,"
+            " open REAL, high REAL, low REAL, close REAL, volume REAL, dividends REAL, splits REAL,"
+            " PRIMARY KEY (symbol, date)) WITHOUT ROWID"
+        )
+        # [start, end) 구간은 확정 데이터가 모두 저장됨
+        # (fetched: 구간을 처음 받은 시점의 확정 기준일 - 이후 날짜의 새 배당/분할은 수정주가를 바꿈)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS coverage_ranges ("
+            " symbol TEXT NOT NULL, start TEXT NOT NULL, end TEXT NOT NULL, fetched TEXT NOT NULL,"
+            " PRIMARY KEY (symbol, start)) WITHOUT ROWID"
+        )
+        # 확정되지 않은 최근 [start, end) 구간은 checked 시각 기준으로 저장됨
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS coverage_tail ("
+            " symbol TEXT PRIMARY KEY, start TEXT NOT NULL, end TEXT NOT NULL, checked REAL NOT NULL)"
+        )
+        self._migrate(conn)
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        """종목당 확정 구간이 하나였던 이전 coverage 테이블을 옮김"""
+        exists = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'coverage'"
+        if conn.execute(exists).fetchone() is None:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute(exists).fetchone() is None:  # 다른 프로세스가 먼저 옮김
+                conn.execute("ROLLBACK")
+                return
+            # 이전에는 확정 구간 끝 이후의 배당/분할만 새 것으로 봤으므로 end 를 확정 기준일로 사용
+            conn.execute("INSERT OR IGNORE INTO coverage_ranges SELECT symbol, start, end, end FROM coverage")
+            conn.execute(
+                "INSERT OR IGNORE INTO coverage_tail"
+                " SELECT symbol, end, tail_end, tail_checked FROM coverage WHERE tail_end IS NOT NULL"
+            )
+            conn.execute("DROP TABLE coverage")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _conn(self) -> sqlite3.Connection:
+        """스레드별 연결 (WAL 모드에서 읽기는 서로 막지 않음)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _final_end() -> str:
+        return (date.today() - timedelta(days=FINAL_LAG_DAYS)).isoformat()
+
+    def coverage(self, symbol: str) -> List[Range]:
+        """저장된 확정 구간 목록 (시작일 순) - 스레드별 연결이므로 쓰기 트랜잭션 안에서도 같은 연결로 읽음"""
+        return self._conn().execute(
+            "SELECT start, end FROM coverage_ranges WHERE symbol = ? ORDER BY start", (symbol,)
+        ).fetchall()
+
+    def tail(self, symbol: str) -> Optional[Tuple[str, str, float]]:
+        """확정되지 않은 최근 구간 (start, end, checked)"""
+        return self._conn().execute(
+            "SELECT start, end, checked FROM coverage_tail WHERE symbol = ?", (symbol,)
+        ).fetchone()
+
+    def missing_ranges(self, symbol: str, start: Optional[str], end: str) -> List[Tuple[Optional[str], str]]:
+        """[start, end) 조회에 필요하지만 저장소에 없는 구간 목록 (start=None은 상장 이후 전체)"""
+        gaps = subtract_ranges(start or MIN_DATE, end, self.coverage(symbol))
+        tail = self.tail(symbol)
+        if gaps and tail is not None and time.time() - tail[2] < self.tail_ttl:
+            gaps = [gap for gap_start, gap_end in gaps for gap in subtract_ranges(gap_start, gap_end, [tail[:2]])]
+        # 상장 이후 전체가 빠져 있으면 시작일 없이(period="max") 받음
+        return [(None if gap_start == MIN_DATE else gap_start, gap_end) for gap_start, gap_end in gaps]
+
+    def read(self, symbol: str, start: Optional[str], end: str) -> pd.DataFrame:
+        """저장된 [start, end) 일봉을 yfinance와 같은 컬럼의 DataFrame으로 반환"""
+        rows = self._conn().execute(
+            "SELECT date, open, high, low, close, volume, dividends, splits FROM bars"
+            " WHERE symbol = ? AND date >= ? AND date < ? ORDER BY date",
+            (symbol, start or MIN_DATE, end),
+        ).fetchall()
+        index = pd.DatetimeIndex([row[0] for row in rows], name="Date")
+        return pd.DataFrame([row[1:] for row in rows], index=index, columns=list(COLUMNS), dtype=float)
+
+    def write(self, symbol: str, frame: pd.DataFrame, start: Optional[str], end: str):
+        """[start, end) 구간을 내려받은 결과를 저장하고, 확정된 부분을 맞닿거나 겹치는 확정 구간과 합침"""
+        if frame is not None and not frame.empty:
+            frame = frame.dropna(subset=["Close"])
+
+        rows = []
+        if frame is not None and not frame.empty:
+            values = frame.reindex(columns=list(COLUMNS)).fillna({"Dividends": 0.0, "Stock Splits": 0.0})
+            dates = frame.index.strftime("%Y-%m-%d")
+            rows = [(symbol, d, *map(float, v)) for d, v in zip(dates, values.itertuples(index=False))]
+
+        start = start or MIN_DATE
+        final_end = self._final_end()
+        now = time.time()
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 다른 스레드/프로세스가 먼저 기록한 구간을 덮어쓰지 않도록 쓰기 잠금을 잡은 뒤 읽음
+                ranges = conn.execute(
+                    "SELECT start, end, fetched FROM coverage_ranges WHERE symbol = ? ORDER BY start", (symbol,)
+                ).fetchall()
+                if not rows and not ranges:
+                    conn.execute("ROLLBACK")
+                    return  # 잘못된 심볼일 수 있으므로 빈 결과는 기록하지 않음
+                if ranges and self._has_new_actions(conn, symbol, rows, min(r[2] for r in ranges)):
+                    # 새 배당/분할로 수정주가가 바뀌었으므로 이번에 받은 구간 밖의 데이터는 버림
+                    conn.execute("DELETE FROM bars WHERE symbol = ? AND (date < ? OR date >= ?)", (symbol, start, end))
+                    conn.execute("DELETE FROM coverage_ranges WHERE symbol = ?", (symbol,))
+                    conn.execute("DELETE FROM coverage_tail WHERE symbol = ?", (symbol,))
+                    self.invalidations += 1
+                    ranges = []
+                conn.executemany("INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+                new_start, new_end, fetched = start, min(end, final_end), final_end
+                if new_start < new_end:
+                    for range_start, range_end, range_fetched in ranges:
+                        if range_start <= new_end and range_end >= new_start:
+                            new_start, new_end = min(new_start, range_start), max(new_end, range_end)
+                            fetched = min(fetched, range_fetched)
+                            conn.execute(
+                                "DELETE FROM coverage_ranges WHERE symbol = ? AND start = ?", (symbol, range_start)
+                            )
+                    conn.execute(
+                        "INSERT INTO coverage_ranges VALUES (?, ?, ?, ?)", (symbol, new_start, new_end, fetched)
+                    )
+                if end > final_end:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO coverage_tail VALUES (?, ?, ?, ?)",
+                        (symbol, max(start, final_end), end, now),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _has_new_actions(conn: sqlite3.Connection, symbol: str, rows: list, fetched: str) -> bool:
+        """저장된 구간의 확정 기준일(fetched) 이후에 저장소에 없던 배당/분할이 생겼는지 확인"""
+        events = {row[1]: (row[7], row[8]) for row in rows if row[1] >= fetched and (row[7] or row[8])}
+        if not events:
+            return False
+        stored = dict(
+            (d, (div, split))
+            for d, div, split in conn.execute(
+                "SELECT date, dividends, splits FROM bars WHERE symbol = ? AND date >= ?", (symbol, fetched)
+            )
+        )
+        return any(stored.get(d) != values for d, values in events.items())
+
+    def clear(self, symbol: Optional[str] = None):
+        with self._write_lock:
+            conn = self._conn()
+            if symbol is None:
+                conn.execute("DELETE FROM bars")
+                conn.execute("DELETE FROM coverage_ranges")
+                conn.execute("DELETE FROM coverage_tail")
+            else:
+                conn.execute("DELETE FROM bars WHERE symbol = ?", (symbol,))
+                conn.execute("DELETE FROM coverage_ranges WHERE symbol = ?", (symbol,))
+                conn.execute("DELETE FROM coverage_tail WHERE symbol = ?", (symbol,))
+
+    def load(self, symbol: str, start: Optional[str], end: str) -> pd.DataFrame:
+        """[start, end) 일봉 조회 - 저장소에 없는 구간만 내려받아 저장한 뒤 저장소에서 읽음"""
+        symbol = symbol.strip().upper()
+        start, end = _to_date(start), _to_date(end)
+        missing = self.missing_ranges(symbol, start, end)
+        if not missing:
+            self.hits += 1
+        else:
+            self.misses += 1
+            for _ in range(2):
+                invalidations = self.invalidations
+                for range_start, range_end in missing:
+                    self.downloads += 1
+                    self.write(symbol, self.downloader(symbol, range_start, range_end), range_start, range_end)
+                # 배당/분할로 데이터를 버린 경우에만 비게 된 구간을 한 번 더 채움
+                if self.invalidations == invalidations:
+                    break
+                missing = self.missing_ranges(symbol, start, end)
+        return self.read(symbol, start, end)
+
+    def history(self, symbol: str, start=None, end=None, period: Optional[str] = None) -> pd.DataFrame:
+        """Ticker.history와 같은 방식(start/end 또는 period)으로 조회"""
+        last_n = None
+        if period is not None:
+            start, end, last_n = period_range(period)
+        frame = self.load(symbol, start, end)
+        return frame.iloc[-last_n:] if last_n else frame
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        return {
+            "path": self.path,
+            "symbols": conn.execute("SELECT COUNT(DISTINCT symbol) FROM coverage_ranges").fetchone()[0],
+            "bars": conn.execute("SELECT COUNT(*) FROM bars").fetchone()[0],
+            "hits": self.hits,
+            "misses": self.misses,
+            "downloads": self.downloads,
+            "invalidations": self.invalidations,
+        }
+
+
+def open_price_store() -> Optional[PriceStore]:
+    """환경변수 설정에 따라 저장소를 열고, 비활성화되어 있거나 열 수 없으면 None"""
+    if not PRICE_STORE_PATH:
+        return None
+    try:
+        return PriceStore(PRICE_STORE_PATH)
+    except sqlite3.Error as e:
+        logger.warning(f"가격 저장소를 열 수 없어 사용하지 않습니다 ({PRICE_STORE_PATH}): {e}")
+        return None
+
+
+def fake_downloader(latency: float = 0.5) -> Downloader:
+    """네트워크 없이 평일마다 일봉을 만들어 내는 downloader (latency초 지연)"""
+
+    def download(symbol: str, start: Optional[str], end: str) -> pd.DataFrame:
+        time.sleep(latency)
+        index = pd.bdate_range(start or "2000-01-01", pd.Timestamp(end) - pd.Timedelta(days=1), name="Date")
+        close = 100 + (index.dayofyear.to_numpy() % 50)
+        return pd.DataFrame(
+            {"Open": close, "High": close + 1, "Low": close - 1, "Close": close, "Volume": 1000,
+             "Dividends": 0.0, "Stock Splits": 0.0},
+            index=index.tz_localize("America/New_York"),
+        )
+
+    return download
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="로컬 일봉 저장소")
+    parser.add_argument("--bench", action="store_true", help="가짜 downloader로 반복 조회 시간 측정")
+    parser.add_argument("--period", default="10y")
+    parser.add_argument("--latency", type=float, default=0.5, help="가짜 downloader 지연(초)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.bench:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = PriceStore(os.path.join(tmp, "prices.sqlite3"), downloader=fake_downloader(args.latency))
+            for i in range(args.repeat):
+                t0 = time.perf_counter()
+                frame = store.history("AAPL", period=args.period)
+                print(f"#{i + 1} {args.period}: {len(frame)} rows, {(time.perf_counter() - t0) * 1000:.1f} ms")
+            print(store.stats())
+    else:
+        store = open_price_store()
+        print(store.stats() if store else "가격 저장소가 비활성화되어 있습니다 (PRICE_STORE_PATH).")
@@ -0,0 +1,75 @@
+"""SparseIndex(BM25 역색인) 증분 갱신 회귀 테스트
+
+Kiwi 없이 공백 기준 토크나이저로 실행합니다.
+    python -m pytest -q tests/test_hybrid.py
+"""
+from app.hybrid import SparseIndex
+
+
+class SplitTokenizer:
+    def tokenize_many(self, texts):
+        return [tuple(text.split()) for text in texts]
+
+
+def build(docs: dict[str, str]) -> SparseIndex:
+    index = SparseIndex()
+    index.add(list(docs), list(docs.values()), [{}] * len(docs), SplitTokenizer())
+    return index
+
+
+def ranking(index: SparseIndex, query: str) -> list[tuple[str, float]]:
+    return sorted((doc.id, round(score, 5)) for doc, score in index.search_documents(tuple(query.split()), 10))
+
+
+def test_readd_more_than_half_replaces_documents():
+    index = build({"a": "x y", "b": "x z", "c": "q r"})
+
+    # 절반 넘게 교체하면 add 도중 압축이 일어남 (새 본문의 토큰이 캐시에서 빠지면 안 됨)
+    index.add(["a", "b"], ["x new", "z new"], [{}, {}], SplitTokenizer())
+
+    expected = build({"c": "q r", "a": "x new", "b": "z new"})
+    assert index.size == 3
+    assert ranking(index, "new x z") == ranking(expected, "new x z")
+    assert ranking(index, "y") == []
+
+
+def test_remove_matches_fresh_index():
+    docs = {f"d{i}": " ".join(f"w{(i * j) % 7}" for j in range(i % 5 + 1)) for i in range(30)}
+    index = build(docs)
+    removed = list(docs)[:20]
+    for i in range(0, len(removed), 4):
+        index.remove(removed[i : i + 4])
+
+    expected = build({k: v for k, v in docs.items() if k not in removed})
+    assert len(index.ids) < len(docs)  # 압축됨
+    assert ranking(index, "w1 w3") == ranking(expected, "w1 w3")
+
+
+class FakeVectorStore:
+    def __init__(self, docs: dict[str, tuple[str, dict]]):
+        self.docs = docs
+
+    def get(self, include):
+        ids = list(self.docs)
+        return {
+            "ids": ids,
+            "documents": [self.docs[doc_id][0] for doc_id in ids],
+            "metadatas": [self.docs[doc_id][1] for doc_id in ids],
+        }
+
+
+def test_sync_picks_up_text_and_metadata_changes():
+    store = FakeVectorStore({"a": ("x y", {"page": 1}), "b": ("x z", {"page": 2})})
+    index = SparseIndex()
+    assert index.sync(store, SplitTokenizer()) == (2, 0, 0)
+
+    store.docs["a"] = ("x y", {"page": 5})  # 메타데이터만 변경
+    store.docs["b"] = ("q", {"page": 2})  # 같은 id, 본문 변경
+    store.docs["c"] = ("z", {})
+    assert index.sync(store, SplitTokenizer()) == (2, 0, 1)
+    assert index.document(index.id_to_idx["a"]).metadata == {"page": 5}
+    assert [doc_id for doc_id, _ in ranking(index, "z")] == ["c"]
+
+    del store.docs["c"]
+    assert index.sync(store, SplitTokenizer()) == (0, 1, 0)
+    assert index.size == 2